@@ -1,15 +1,64 @@
-from pathlib import Path
-import sys
-import anyio
-from fastapi import FastAPI, HTTPException
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import httpx
+import json
 import re
 
-from rag_service import answer_question
+# rag_service первым: кладёт rag/ в sys.path; тяжёлые модули он грузит лениво (warm_runtime)
+from rag_service import (
+    WARMUP_COMPONENTS,
+    answer_question,
+    get_intent_classifier,
+    get_settings,
+    aclose_runtime,
+    prepare_answer,
+    run_embed,
+    stream_prepared_answer,
+    warm_answer_cache,
+    warm_runtime,
+)
+from app.ollama_client import OllamaClient, OllamaHTTPError
+from app.llm_scheduler import PRIORITY_CLASSIFY, LLMOverloaded
+from utils.filters import SearchFilters
+
+SETTINGS = get_settings()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # один пул keep-alive соединений к Ollama на весь процесс
+    app.state.ollama = OllamaClient.from_settings(SETTINGS)
+    # прогрев в фоне: /health отвечает сразу, /ready — когда всё поднято
+    app.state.readiness = {name: "pending" for name in WARMUP_COMPONENTS}
+    warmup = asyncio.create_task(_warm_up(app))
+    try:
+        yield
+    finally:
+        _discard(warmup)
+        await app.state.ollama.aclose()
+        await aclose_runtime()
+
+
+async def _warm_up(app: FastAPI) -> None:
+    t0 = time.perf_counter()
+    await warm_runtime(app.state.ollama, app.state.readiness)
+    print(f"Ready in {time.perf_counter() - t0:.1f}s (keep_alive={SETTINGS.ollama_keep_alive})")
+    # кэш ответов FAQ — уже после готовности, в фоновом приоритете LLM
+    try:
+        n = await warm_answer_cache(app.state.ollama)
+        if n:
+            print(f"Answer cache: warmed {n} FAQ questions")
+    except Exception as e:
+        print(f"Answer cache warm-up failed: {e!r}")
+
 
-app = FastAPI(title="AeroDoc MVP API")
+app = FastAPI(title="AeroDoc MVP API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,11 +68,14 @@ app.add_middleware(
 )
 
 # IMPORTANT: use 127.0.0.1 (IPv4) to avoid localhost/IPv6 issues on Windows
-OLLAMA_URL = "http://127.0.0.1:11434/api/chat"
-MODEL = "llama3:8b"
+OLLAMA_URL = SETTINGS.ollama_base_url.rstrip("/") + "/api/chat"
+MODEL = SETTINGS.ollama_model
 
 LABELS = {"rag_query", "greeting", "junk"}
 
+GREETING_ANSWER = "Привет! Готов отвечать на твои вопросы."
+JUNK_ANSWER = "Похоже на мусор или не по теме. Напиши вопрос чуть понятнее 🙂"
+
 SYSTEM_PROMPT = """
 Ты — классификатор пользовательских сообщений для чат-ассистента по авиационной документации.
 Верни ТОЛЬКО один label из списка:
@@ -48,95 +100,252 @@ def normalize_label(s: str) -> str:
     return t if t in LABELS else "junk"
 
 
-async def ollama_chat(system_prompt: str, user_text: str) -> str:
-    payload = {
-        "model": MODEL,
-        "stream": False,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_text},
-        ],
-        "options": {"temperature": 0.0},
-    }
-
+def get_ollama(request: Request) -> OllamaClient:
+    return request.app.state.ollama
+
+
+def ollama_http_error(e: Exception) -> HTTPException:
+    """
+    Ошибки Ollama -> HTTP-коды API.
+    """
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, LLMOverloaded):
+        # перегрузка: быстрый отказ, клиенту — когда повторить
+        return HTTPException(
+            status_code=e.status,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after_s))},
+        )
+    if isinstance(e, OllamaHTTPError):
+        return HTTPException(status_code=502, detail=str(e))
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return HTTPException(status_code=503, detail=f"Cannot connect to Ollama at {OLLAMA_URL}. {e}")
+    if isinstance(e, httpx.ReadTimeout):
+        return HTTPException(status_code=504, detail="Timeout calling Ollama")
+    return HTTPException(status_code=500, detail=f"Internal error calling Ollama: {repr(e)}")
+
+
+async def ollama_chat(client: OllamaClient, system_prompt: str, user_text: str) -> str:
     try:
-        async with httpx.AsyncClient(timeout=60, trust_env=False) as client:
-            r = await client.post(OLLAMA_URL, json=payload)
-            if r.status_code != 200:
-                raise HTTPException(
-                    status_code=502,
-                    detail=f"Ollama HTTP {r.status_code}. Body: {r.text}",
-                )
-            data = r.json()
-
-        msg = data.get("message") or {}
-        content = msg.get("content")
-        if not content:
-            raise HTTPException(status_code=502, detail=f"Unexpected Ollama response: {data}")
-
-        return content
-
-    except httpx.ConnectError as e:
-        raise HTTPException(status_code=503, detail=f"Cannot connect to Ollama at {OLLAMA_URL}. {e}")
-    except httpx.ReadTimeout:
-        raise HTTPException(status_code=504, detail="Timeout calling Ollama")
-    except HTTPException:
-        raise
+        content = await client.chat(
+            user_text, system=system_prompt, model=MODEL, temperature=0.0, priority=PRIORITY_CLASSIFY
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal error calling Ollama: {repr(e)}")
+        raise ollama_http_error(e)
+
+    if not content:
+        raise HTTPException(status_code=502, detail="Unexpected Ollama response: empty content")
+
+    return content
+
+
+async def classify_text(text: str, client: OllamaClient) -> str:
+    """
+    Сначала локальный классификатор (правила + эмбеддинги + кэш),
+    LLM — только если он не уверен.
+    """
+    intent = get_intent_classifier()
+    result = await run_embed(intent.classify, text)
+    if result.confident or not SETTINGS.intent_llm_fallback:
+        return result.label
+
+    raw = await ollama_chat(client, SYSTEM_PROMPT, text)
+    label = normalize_label(raw)
+    intent.remember(text, label)
+    return label
 
 
 @app.get("/health")
 def health():
+    # liveness: процесс жив, даже если прогрев ещё идёт
     return {"ok": True}
 
 
+@app.get("/ready")
+def ready(request: Request):
+    # readiness: модель, Qdrant, FTS и Ollama прогреты; до этого 503
+    status = request.app.state.readiness
+    ok = all(v == "ok" for v in status.values())
+    return JSONResponse({"ready": ok, "components": status}, status_code=200 if ok else 503)
+
+
 @app.post("/classify", response_model=ClassifyResponse)
-async def classify(req: ClassifyRequest):
+async def classify(req: ClassifyRequest, request: Request):
     text = (req.text or "").strip()
     if not text:
         return {"label": "junk"}
 
-    raw = await ollama_chat(SYSTEM_PROMPT, text)
-    label = normalize_label(raw)
-    return {"label": label}
-
-
-
+    return {"label": await classify_text(text, get_ollama(request))}
 
 
-from typing import List, Optional
-from pydantic import BaseModel
-
 class ChatRequest(BaseModel):
     text: str
     file_name: Optional[str] = None
+    doc_id: Optional[str] = None
+    source_type: Optional[str] = None
+    modified_from: Optional[str] = None  # ISO 8601, включительно
+    modified_to: Optional[str] = None
     top_k: Optional[int] = None
     score_threshold: Optional[float] = None
 
+    def filters(self) -> Optional[SearchFilters]:
+        try:
+            flt = SearchFilters(
+                file_name=self.file_name,
+                doc_id=self.doc_id,
+                source_type=self.source_type,
+                modified_from=self.modified_from,
+                modified_to=self.modified_to,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Bad date filter: {e}")
+        return None if flt.is_empty() else flt
+
 class ChatResponse(BaseModel):
     answer: str
     sources: List[str] = []
 
 
-from functools import partial
-
 @app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
     text = (req.text or "").strip()
     if not text:
         return {"answer": "Пустой запрос.", "sources": []}
 
-    fn = partial(
-        answer_question,
+    try:
+        answer, sources = await answer_question(
+            text,
+            ollama=get_ollama(request),
+            filters=req.filters(),
+            top_k=req.top_k,
+            score_threshold=req.score_threshold,
+        )
+    except (OllamaHTTPError, LLMOverloaded, httpx.HTTPError) as e:
+        raise ollama_http_error(e)
+    return {"answer": answer, "sources": sources}
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """
+    Потоковый /chat: NDJSON, по одному событию на строку.
+    Сначала приходят sources, затем token-события по мере генерации, в конце done.
+    Retrieval — до ответа: если LLM перегружена, вместо стрима сразу 429/503 с Retry-After.
+    """
+    text = (req.text or "").strip()
+    client = get_ollama(request)
+    filters = req.filters()  # 422 до начала стрима
+
+    if not text:
+        async def empty():
+            yield {"type": "sources", "sources": []}
+            yield {"type": "token", "content": "Пустой запрос."}
+            yield {"type": "done"}
+
+        return ndjson_response(empty())
+
+    prepared = await prepare_answer(
         text,
-        file_name=req.file_name,
+        filters=filters,
         top_k=req.top_k,
         score_threshold=req.score_threshold,
     )
+    if prepared.cached is None and prepared.prompt is not None:
+        try:
+            client.check_admission()
+        except LLMOverloaded as e:
+            raise ollama_http_error(e)
+
+    async def events():
+        try:
+            async for ev in stream_prepared_answer(prepared, ollama=client):
+                yield ev
+        except Exception as e:
+            # заголовки уже отправлены — статус не поменять, сообщаем ошибку событием
+            yield error_event(e)
+
+    return ndjson_response(events())
+
+
+def error_event(e: Exception) -> dict:
+    if isinstance(e, LLMOverloaded):
+        return {"type": "error", "status": e.status, "retry_after": e.retry_after_s, "detail": str(e)}
+    return {"type": "error", "detail": repr(e)}
+
+
+def ndjson_response(events) -> StreamingResponse:
+    async def lines():
+        async for ev in events:
+            yield json.dumps(ev, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    answer, sources = await anyio.to_thread.run_sync(fn)
-    return {"answer": answer, "sources": sources}
+
+def _discard(task: "asyncio.Task") -> None:
+    # отменяем и гасим возможную ошибку (уже запущенная в пуле работа просто доработает)
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+@app.post("/ask")
+async def ask(req: ChatRequest, request: Request):
+    """
+    Один запрос вместо classify + chat/stream.
+    Retrieval стартует сразу, параллельно с классификацией; для greeting/junk
+    его результат выбрасывается. Ответ — NDJSON, первым событием идёт label,
+    дальше те же события, что у /chat/stream.
+    """
+    text = (req.text or "").strip()
+    client = get_ollama(request)
+
+    if not text:
+        label = "junk"
+        retrieval = None
+    else:
+        retrieval = asyncio.create_task(
+            prepare_answer(
+                text,
+                filters=req.filters(),
+                top_k=req.top_k,
+                score_threshold=req.score_threshold,
+            )
+        )
+        try:
+            label = await classify_text(text, client)
+        except BaseException:
+            _discard(retrieval)
+            raise
+
+        if label != "rag_query":
+            _discard(retrieval)
+        else:
+            try:
+                client.check_admission()
+            except LLMOverloaded as e:
+                _discard(retrieval)
+                raise ollama_http_error(e)
+
+    async def events():
+        yield {"type": "label", "label": label}
+
+        if label != "rag_query":
+            yield {"type": "token", "content": GREETING_ANSWER if label == "greeting" else JUNK_ANSWER}
+            yield {"type": "done"}
+            return
+
+        try:
+            prepared = await retrieval
+            async for ev in stream_prepared_answer(prepared, ollama=client):
+                yield ev
+        except Exception as e:
+            yield error_event(e)
+
+    return ndjson_response(events())
 
 
 @app.get("/models")
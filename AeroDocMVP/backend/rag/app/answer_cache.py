@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.generation import read_generation
+
+_RE_SPACES = re.compile(r"\s+")
+_RE_TRAILING = re.compile(r"[\s?!.…]+$")
+
+
+def normalize_question(question: str) -> str:
+    q = _RE_SPACES.sub(" ", (question or "").strip().lower()).replace("ё", "е")
+    return _RE_TRAILING.sub("", q)
+
+
+def cache_scope(*, model: str, filters: Dict[str, Any]) -> str:
+    """
+    Всё, что кроме вопроса влияет на ответ: модель + фильтры/параметры retrieval.
+    """
+    raw = json.dumps([model, filters], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def exact_key(question: str, *, scope: str) -> str:
+    return hashlib.sha1(f"{scope}\x00{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    answer: str
+    sources: List[str]
+    question: str
+    tier: str  # exact | semantic
+    similarity: float = 1.0
+
+
+@dataclass
+class _Entry:
+    scope: str
+    question: str
+    answer: str
+    sources: List[str]
+    vec: Optional[np.ndarray]
+    created: float
+
+
+class AnswerCache:
+    """
+    Двухуровневый кэш ответов:
+    - exact: ключ = нормализованный вопрос + scope (модель, фильтры);
+    - semantic: косинус эмбеддинга вопроса с ранее заданными в том же scope (>= semantic_threshold;
+      0 — уровень выключен).
+    В памяти — LRU на max_entries с TTL; в SQLite — персистентная копия (переживает рестарт
+    и общая для воркеров: промах в памяти проверяется по ключу в SQLite).
+    Все записи привязаны к поколению корпуса (generation_path, пишет run_ingest):
+    сменилось поколение — кэш очищается.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        generation_path: str,
+        max_entries: int = 2000,
+        ttl_s: float = 86400.0,
+        semantic_threshold: float = 0.0,
+    ):
+        self.generation_path = Path(generation_path)
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+        self.semantic_threshold = float(semantic_threshold)
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("PRAGMA busy_timeout=2000;")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key        TEXT PRIMARY KEY,
+                scope      TEXT NOT NULL,
+                question   TEXT NOT NULL,
+                answer     TEXT NOT NULL,
+                sources    TEXT NOT NULL,
+                vec        BLOB,
+                created    REAL NOT NULL,
+                last_used  REAL NOT NULL,
+                generation INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used);")
+        self._conn.commit()
+
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._mat: Optional[np.ndarray] = None  # эмбеддинги вопросов для semantic tier
+        self._mat_keys: List[str] = []
+        self._gen_sig: Optional[Tuple[int, int]] = None
+        self.generation = -1
+
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+
+        with self._lock:
+            self._check_generation()
+
+    # ---------------------------
+    # Generation / persistence
+    # ---------------------------
+
+    def _check_generation(self) -> None:
+        try:
+            st = self.generation_path.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            sig = (0, 0)
+        if sig == self._gen_sig:
+            return
+        self._gen_sig = sig
+
+        gen = read_generation(self.generation_path)
+        if gen == self.generation:
+            return
+        self.generation = gen
+        self._mem.clear()
+        self._mat = None
+        with self._conn:
+            self._conn.execute("DELETE FROM answers WHERE generation != ?", (gen,))
+        self._load()
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            """
+            SELECT key, scope, question, answer, sources, vec, created FROM answers
+            WHERE generation = ? AND created > ?
+            ORDER BY last_used DESC LIMIT ?
+            """,
+            (self.generation, time.time() - self.ttl_s, self.max_entries),
+        ).fetchall()
+        for row in reversed(rows):
+            self._mem[row[0]] = self._entry_from_row(row[1:])
+
+    @staticmethod
+    def _entry_from_row(row) -> _Entry:
+        scope, question, answer, sources, vec, created = row
+        return _Entry(
+            scope=scope,
+            question=question,
+            answer=answer,
+            sources=json.loads(sources),
+            vec=np.frombuffer(vec, dtype=np.float32) if vec else None,
+            created=float(created),
+        )
+
+    def _expired(self, e: _Entry, now: float) -> bool:
+        return now - e.created > self.ttl_s
+
+    # ---------------------------
+    # Lookup
+    # ---------------------------
+
+    def get_exact(self, key: str) -> Optional[CachedAnswer]:
+        now = time.time()
+        with self._lock:
+            self._check_generation()
+            e = self._mem.get(key)
+            if e is None:
+                row = self._conn.execute(
+                    """
+                    SELECT scope, question, answer, sources, vec, created FROM answers
+                    WHERE key = ? AND generation = ?
+                    """,
+                    (key, self.generation),
+                ).fetchone()
+                if row is not None:
+                    e = self._entry_from_row(row)
+                    self._remember(key, e)
+            if e is None or self._expired(e, now):
+                if e is not None:
+                    self._drop(key)
+                return None
+
+            self._touch(key, now)
+            self.hits_exact += 1
+            return CachedAnswer(answer=e.answer, sources=list(e.sources), question=e.question, tier="exact")
+
+    def get_semantic(self, qvec, *, scope: str) -> Optional[CachedAnswer]:
+        if self.semantic_threshold <= 0:
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        q = np.asarray(qvec, dtype=np.float32)
+        with self._lock:
+            self._check_generation()
+            mat, keys = self._matrix()
+            best_key, best_sim = None, -1.0
+            if mat is not None:
+                sims = mat @ q
+                for i in np.argsort(-sims):
+                    if sims[i] < self.semantic_threshold:
+                        break
+                    e = self._mem.get(keys[i])
+                    if e is not None and e.scope == scope and not self._expired(e, now):
+                        best_key, best_sim = keys[i], float(sims[i])
+                        break
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            e = self._mem[best_key]
+            self._touch(best_key, now)
+            self.hits_semantic += 1
+            return CachedAnswer(
+                answer=e.answer,
+                sources=list(e.sources),
+                question=e.question,
+                tier="semantic",
+                similarity=best_sim,
+            )
+
+    def _matrix(self) -> Tuple[Optional[np.ndarray], List[str]]:
+        if self._mat is None:
+            keys = [k for k, e in self._mem.items() if e.vec is not None]
+            self._mat_keys = keys
+            self._mat = np.stack([self._mem[k].vec for k in keys]) if keys else np.zeros((0, 0), np.float32)
+        if not self._mat_keys:
+            return None, []
+        return self._mat, self._mat_keys
+
+    # ---------------------------
+    # Store
+    # ---------------------------
+
+    def put(
+        self,
+        key: str,
+        *,
+        scope: str,
+        question: str,
+        answer: str,
+        sources: List[str],
+        qvec=None,
+    ) -> None:
+        now = time.time()
+        vec = np.asarray(qvec, dtype=np.float32) if qvec is not None else None
+        e = _Entry(scope=scope, question=question, answer=answer, sources=list(sources), vec=vec, created=now)
+        with self._lock:
+            self._check_generation()
+            self._remember(key, e)
+            with self._conn:
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO answers(key, scope, question, answer, sources, vec, created, last_used, generation)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        key,
+                        scope,
+                        question,
+                        answer,
+                        json.dumps(e.sources, ensure_ascii=False),
+                        vec.tobytes() if vec is not None else None,
+                        now,
+                        now,
+                        self.generation,
+                    ),
+                )
+                # SQLite держим того же размера, что и память
+                self._conn.execute(
+                    """
+                    DELETE FROM answers WHERE key IN (
+                        SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+
+    def _remember(self, key: str, e: _Entry) -> None:
+        self._mem[key] = e
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+        self._mat = None
+
+    def _touch(self, key: str, now: float) -> None:
+        self._mem.move_to_end(key)
+        with self._conn:
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+
+    def _drop(self, key: str) -> None:
+        self._mem.pop(key, None)
+        self._mat = None
+        with self._conn:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    # ---------------------------
+    # Stats
+    # ---------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._mem),
+                "generation": self.generation,
+                "hits_exact": self.hits_exact,
+                "hits_semantic": self.hits_semantic,
+                "misses": self.misses,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from utils.sparse import sparse_tokens  # тот же модуль, что у app.search
+from utils.tokens import TokenCounter
+
+# Предложение кончается на .!?… и дальше идёт заглавная/цифра/кавычка/скобка.
+_RE_SENT = re.compile(r"(?<=[.!?…])\s+(?=[«\"(\[A-ZА-ЯЁ0-9])")
+TABLE_MARK = "ТАБЛИЦА:"  # preprocessor/chef.py: linearize
+GAP = "…"
+# служебные токены на блок источника в build_prompt ("=== SOURCE [i] ===" + переводы строк)
+SOURCE_OVERHEAD_TOKENS = 12
+
+
+def split_units(text: str) -> List[str]:
+    """
+    Единицы извлечения: строки таблиц (после "ТАБЛИЦА:" до пустой строки) — целиком,
+    обычный текст — по предложениям.
+    """
+    units: List[str] = []
+    in_table = False
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            in_table = False
+            continue
+        if line == TABLE_MARK:
+            in_table = True
+            units.append(line)
+            continue
+        if in_table:
+            units.append(line)
+            continue
+        units.extend(p.strip() for p in _RE_SENT.split(line) if p.strip())
+    return units
+
+
+def _term_weights(question: str, unit_terms: Sequence[Set[str]]) -> Dict[str, float]:
+    # idf термов вопроса по всем единицам всех кандидатов: редкое слово важнее частого
+    q_terms = set(sparse_tokens(question))
+    if not q_terms:
+        return {}
+    df: Counter = Counter()
+    for terms in unit_terms:
+        df.update(terms & q_terms)
+    n = max(1, len(unit_terms))
+    return {t: math.log(1.0 + n / df[t]) for t in q_terms if df[t]}
+
+
+def _extract(
+    units: List[str],
+    tokens: List[int],
+    scores: List[float],
+    quota: int,
+    neighbours: int,
+) -> str:
+    """
+    Жадно: единицы по убыванию скора (при равенстве — раньше в тексте), каждая вместе
+    с соседями ±neighbours; если с соседями не влезает — одна. Сборка в исходном порядке.
+    Нет совпадений с вопросом — начало чанка.
+    """
+    gap_cost = 1  # перевод строки / "…"
+    order = sorted((i for i, sc in enumerate(scores) if sc > 0), key=lambda i: (-scores[i], i))
+    if not order:
+        order = list(range(len(units)))
+        neighbours = 0
+
+    chosen: Set[int] = set()
+    used = 0
+    for seed in order:
+        if seed in chosen:
+            continue
+        lo, hi = max(0, seed - neighbours), min(len(units), seed + neighbours + 1)
+        for span in (range(lo, hi), range(seed, seed + 1)):
+            new = [i for i in span if i not in chosen]
+            cost = sum(tokens[i] for i in new) + gap_cost
+            if used + cost <= quota:
+                chosen.update(new)
+                used += cost
+                break
+
+    parts: List[str] = []
+    prev = -1
+    for i in sorted(chosen):
+        if i != prev + 1:
+            parts.append(GAP)  # пропущенный кусок
+        parts.append(units[i])
+        prev = i
+    if parts and prev < len(units) - 1:
+        parts.append(GAP)
+    return "\n".join(parts)
+
+
+def compress_hits(
+    question: str,
+    hits: List[Dict[str, Any]],
+    *,
+    budget_tokens: int,
+    counter: TokenCounter,
+    neighbours: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Контекст под фиксированный бюджет токенов целевой LLM.
+    hits — в порядке релевантности. Бюджет делится поровну между источниками,
+    недоиспользованное переходит к следующим. Чанк, который влезает в свою долю
+    (n_tokens посчитан при ingest), идёт целиком; иначе — извлечение предложений/строк
+    таблиц, ближайших к вопросу, с соседями. Порядок и число hits не меняются:
+    в payload — новый text, n_tokens и compressed.
+    """
+    texts = [((h.get("payload") or {}).get("text") or "").strip() for h in hits]
+    if budget_tokens <= 0 or not hits:
+        return hits
+
+    # сначала пробуем целиком: токены из ingest, для старых чанков — посчитать
+    known: List[Optional[int]] = [(h.get("payload") or {}).get("n_tokens") for h in hits]
+    missing = [i for i, n in enumerate(known) if n is None and texts[i]]
+    for i, n in zip(missing, counter.count_many([texts[i] for i in missing])):
+        known[i] = n
+
+    units_per_hit = [split_units(t) for t in texts]
+    unit_terms = [set(sparse_tokens(u)) for units in units_per_hit for u in units]
+    weights = _term_weights(question, unit_terms)
+
+    out: List[Dict[str, Any]] = []
+    remaining = budget_tokens
+    flat = 0
+    for idx, h in enumerate(hits):
+        units = units_per_hit[idx]
+        terms = unit_terms[flat : flat + len(units)]
+        flat += len(units)
+
+        payload = dict(h.get("payload") or {})
+        quota = remaining // (len(hits) - idx) - SOURCE_OVERHEAD_TOKENS
+        n_full = known[idx] or 0
+
+        if not texts[idx] or quota <= 0:
+            text, used, compressed = "", 0, bool(texts[idx])
+        elif n_full <= quota:
+            text, used, compressed = texts[idx], n_full, False
+        else:
+            tokens = counter.count_many(units)
+            scores = [sum(weights.get(t, 0.0) for t in ts) for ts in terms]
+            text = _extract(units, tokens, scores, quota, neighbours)
+            used, compressed = (counter.count(text) if text else 0), True
+
+        if text:
+            remaining -= used + SOURCE_OVERHEAD_TOKENS
+        payload.update({"text": text, "n_tokens": used, "compressed": compressed})
+        out.append({**h, "payload": payload})
+    return out
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from embed.embeddings import Embedder
+
+LABELS = ("rag_query", "greeting", "junk")
+
+# Размеченные прототипы: центроид каждого набора = "средний" пример класса
+PROTOTYPES: Dict[str, List[str]] = {
+    "rag_query": [
+        "Как подготовиться к буксировке ВС?",
+        "Какие ограничения по ветру при рулении и буксировке?",
+        "Какой порядок запуска двигателя: ключевые шаги и проверки?",
+        "Где найти нормы давления азота в стойках шасси?",
+        "Какая максимальная взлётная масса Ан-2?",
+        "Что делать при отказе двигателя в полёте?",
+        "Порядок проверки топливной системы перед вылетом",
+        "Какой интервал технического обслуживания воздушного винта?",
+        "Какие требования к сертификации компонентов воздушных судов?",
+        "Расскажи про электрооборудование двигателя",
+        "Как выполняется предполётный осмотр самолёта?",
+        "Какое давление масла допустимо на режиме малого газа?",
+        "What is the maximum crosswind for takeoff?",
+        "How to perform engine start procedure?",
+    ],
+    "greeting": [
+        "Привет",
+        "Здравствуйте",
+        "Добрый день",
+        "Доброе утро",
+        "Привет, как дела?",
+        "Кто ты?",
+        "Что ты умеешь?",
+        "Спасибо!",
+        "Пока",
+        "Как тебя зовут?",
+        "Hello",
+        "Hi, how are you?",
+        "Thanks",
+    ],
+    "junk": [
+        "asdfgh",
+        "ываыва",
+        "qwerty123",
+        "ааааааа",
+        "лол",
+        "ок",
+        "какая сегодня погода в Москве",
+        "расскажи анекдот",
+        "рецепт борща",
+        "кто выиграл футбольный матч",
+        "купить телефон недорого",
+        "jkl;jkl;",
+        "test test",
+    ],
+}
+
+_RE_LETTER = re.compile(r"[^\W\d_]", re.UNICODE)
+_RE_SPACES = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class IntentResult:
+    label: str
+    confidence: float
+    source: str  # rule | cache | embedding | llm
+    confident: bool = True
+
+
+def normalize_text(text: str) -> str:
+    return _RE_SPACES.sub(" ", (text or "").strip().lower())
+
+
+def rule_label(text: str) -> Optional[str]:
+    """
+    Дешёвые правила до эмбеддингов:
+    - пусто / только символы и цифры -> junk
+    - один и тот же символ повторяется -> junk
+    """
+    t = normalize_text(text)
+    if not t:
+        return "junk"
+    if not _RE_LETTER.search(t):
+        return "junk"
+    compact = t.replace(" ", "")
+    if len(compact) >= 3 and len(set(compact)) == 1:
+        return "junk"
+    return None
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _normalize(v: List[float]) -> List[float]:
+    n = _dot(v, v) ** 0.5
+    return [x / n for x in v] if n > 0 else v
+
+
+class IntentClassifier:
+    """
+    Nearest-centroid классификатор намерений поверх уже загруженного Embedder.
+    Эмбеддинги нормализованы -> косинус = скалярное произведение.
+    Уверенность: сходство с лучшим центроидом и отрыв от второго;
+    если ниже порогов — result.confident=False, решает вызывающий (LLM fallback).
+    Результаты кэшируются (LRU) по нормализованному тексту.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        *,
+        prototypes: Optional[Dict[str, List[str]]] = None,
+        min_similarity: float = 0.35,
+        min_margin: float = 0.05,
+        cache_size: int = 2048,
+    ):
+        self.embedder = embedder
+        self.prototypes = prototypes or PROTOTYPES
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.cache_size = cache_size
+
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._cache: "OrderedDict[str, IntentResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_centroids(self) -> Dict[str, List[float]]:
+        if self._centroids is None:
+            centroids: Dict[str, List[float]] = {}
+            for label, examples in self.prototypes.items():
+                vecs = self.embedder.embed(examples)
+                if not vecs:
+                    continue
+                mean = [sum(col) / len(vecs) for col in zip(*vecs)]
+                centroids[label] = _normalize(mean)
+            self._centroids = centroids
+        return self._centroids
+
+    def warmup(self) -> None:
+        self._get_centroids()
+
+    # ---------------------------
+    # Cache
+    # ---------------------------
+
+    def _cache_get(self, key: str) -> Optional[IntentResult]:
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+            return hit
+
+    def remember(self, text: str, label: str, *, confidence: float = 1.0, source: str = "llm") -> None:
+        key = normalize_text(text)
+        with self._lock:
+            self._cache[key] = IntentResult(label=label, confidence=confidence, source=source)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---------------------------
+    # Classify
+    # ---------------------------
+
+    def scores(self, text: str) -> List[Tuple[str, float]]:
+        vecs = self.embedder.embed([text])
+        if not vecs:
+            return []
+        v = vecs[0]
+        out = [(label, _dot(v, c)) for label, c in self._get_centroids().items()]
+        out.sort(key=lambda x: x[1], reverse=True)
+        return out
+
+    def classify(self, text: str) -> IntentResult:
+        label = rule_label(text)
+        if label is not None:
+            return IntentResult(label=label, confidence=1.0, source="rule")
+
+        key = normalize_text(text)
+        hit = self._cache_get(key)
+        if hit is not None:
+            return IntentResult(label=hit.label, confidence=hit.confidence, source="cache")
+
+        ranked = self.scores(text)
+        if not ranked:
+            return IntentResult(label="junk", confidence=0.0, source="embedding", confident=False)
+
+        best_label, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else -1.0
+        confident = best >= self.min_similarity and (best - second) >= self.min_margin
+
+        result = IntentResult(label=best_label, confidence=best, source="embedding", confident=confident)
+        if confident:
+            self.remember(text, best_label, confidence=best, source="embedding")
+        return result
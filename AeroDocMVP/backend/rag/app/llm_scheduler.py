@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Полосы приоритета: меньше = раньше. Классификация короткая и стоит перед генерацией.
+PRIORITY_CLASSIFY = 0
+PRIORITY_GENERATE = 1
+PRIORITY_BACKGROUND = 2  # прогрев кэша ответов и прочее, что может подождать
+
+
+class LLMOverloaded(RuntimeError):
+    """
+    Очередь к модели переполнена (status=429) или ожидание слота дольше порога (status=503).
+    retry_after_s — подсказка клиенту для заголовка Retry-After.
+    """
+
+    def __init__(self, model: str, *, status: int, retry_after_s: float):
+        super().__init__(f"LLM '{model}' overloaded ({status}), retry after {retry_after_s:.0f}s")
+        self.model = model
+        self.status = status
+        self.retry_after_s = retry_after_s
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    # "llama3:8b=2,qwen2.5:3b=4" -> {"llama3:8b": 2, "qwen2.5:3b": 4}
+    out: Dict[str, int] = {}
+    for part in (spec or "").split(","):
+        name, sep, n = part.strip().rpartition("=")
+        if sep and name.strip():
+            out[name.strip()] = max(1, int(n))
+    return out
+
+
+@dataclass
+class _Gate:
+    """Слоты одной модели: занятые + куча ожидающих (priority, seq, future)."""
+
+    limit: int
+    active: int = 0
+    waiters: List[Tuple[int, int, "asyncio.Future[None]"]] = field(default_factory=list)
+    avg_hold_s: float = 1.0  # EWMA времени занятия слота — для оценки ожидания
+
+    def queued(self) -> int:
+        return sum(1 for _, _, f in self.waiters if not f.done())
+
+
+class _StreamFlight:
+    """Один upstream-стрим, который читают несколько подписчиков (одинаковые промпты)."""
+
+    def __init__(self) -> None:
+        self.pieces: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, piece: Optional[str] = None, *, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            if piece is not None:
+                self.pieces.append(piece)
+            else:
+                self.done = True
+                self.error = error
+            self._changed.notify_all()
+
+    async def read(self) -> AsyncIterator[str]:
+        i = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: i < len(self.pieces) or self.done)
+                new = self.pieces[i:]
+                done, error = self.done, self.error
+            for piece in new:
+                yield piece
+            i += len(new)
+            if done and i >= len(self.pieces):
+                if error is not None:
+                    raise error
+                return
+
+
+class LLMScheduler:
+    """
+    Планировщик перед каждым вызовом LLM:
+    - не больше max_concurrency одновременных запросов на модель (model_limits — исключения);
+    - ожидающие обслуживаются по приоритету (PRIORITY_*), внутри полосы — FIFO;
+    - одинаковые запросы в полёте склеиваются в один upstream-вызов (singleflight), в т.ч. стримы;
+    - backpressure: очередь длиннее max_queue — сразу LLMOverloaded(429),
+      ожидание слота дольше max_queue_wait_s — LLMOverloaded(503).
+    Однопоточный (asyncio): все методы — из одного event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int = 2,
+        model_limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 32,
+        max_queue_wait_s: float = 30.0,
+        retry_after_s: float = 5.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.model_limits = dict(model_limits or {})
+        self.max_queue = max_queue
+        self.max_queue_wait_s = max_queue_wait_s
+        self.retry_after_s = retry_after_s
+
+        self._gates: Dict[str, _Gate] = {}
+        self._seq = itertools.count()
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+
+    @classmethod
+    def from_settings(cls, s) -> "LLMScheduler":
+        return cls(
+            max_concurrency=s.llm_max_concurrency,
+            model_limits=parse_model_limits(s.llm_model_concurrency),
+            max_queue=s.llm_max_queue,
+            max_queue_wait_s=s.llm_max_queue_wait_s,
+            retry_after_s=s.llm_retry_after_s,
+        )
+
+    def _gate(self, model: str) -> _Gate:
+        g = self._gates.get(model)
+        if g is None:
+            g = self._gates[model] = _Gate(limit=self.model_limits.get(model, self.max_concurrency))
+        return g
+
+    # ---------------------------
+    # Admission / slots
+    # ---------------------------
+
+    def estimated_wait_s(self, model: str) -> float:
+        g = self._gate(model)
+        if g.active < g.limit and not g.queued():
+            return 0.0
+        return (g.queued() + 1) / g.limit * g.avg_hold_s
+
+    def _overloaded(self, model: str, status: int) -> LLMOverloaded:
+        retry = max(self.retry_after_s, self.estimated_wait_s(model))
+        return LLMOverloaded(model, status=status, retry_after_s=float(math.ceil(retry)))
+
+    def check_admission(self, model: str) -> None:
+        """
+        Быстрый отказ до начала работы (например, до отправки заголовков стрима):
+        очередь полна или по оценке слот не освободится за max_queue_wait_s.
+        """
+        g = self._gate(model)
+        if self.max_queue > 0 and g.queued() >= self.max_queue:
+            raise self._overloaded(model, 429)
+        if self.max_queue_wait_s > 0 and self.estimated_wait_s(model) > self.max_queue_wait_s:
+            raise self._overloaded(model, 503)
+
+    async def _acquire(self, model: str, priority: int) -> None:
+        g = self._gate(model)
+        if g.active < g.limit and not g.queued():
+            g.active += 1
+            return
+        if self.max_queue > 0 and g.queued() >= self.max_queue:
+            raise self._overloaded(model, 429)
+
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        heapq.heappush(g.waiters, (priority, next(self._seq), fut))
+        try:
+            if self.max_queue_wait_s > 0:
+                await asyncio.wait_for(asyncio.shield(fut), self.max_queue_wait_s)
+            else:
+                await fut
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # слот уже передан нам — вернуть следующему
+                self._release(model)
+            else:
+                fut.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._overloaded(model, 503) from None
+            raise
+
+    def _release(self, model: str) -> None:
+        g = self._gate(model)
+        while g.waiters:
+            _, _, fut = heapq.heappop(g.waiters)
+            if not fut.done():
+                fut.set_result(None)  # слот переходит ожидающему, active не меняется
+                return
+        g.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, model: str, *, priority: int = PRIORITY_GENERATE) -> AsyncIterator[None]:
+        await self._acquire(model, priority)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            g = self._gate(model)
+            g.avg_hold_s = 0.8 * g.avg_hold_s + 0.2 * (time.perf_counter() - t0)
+            self._release(model)
+
+    # ---------------------------
+    # Calls
+    # ---------------------------
+
+    async def run(
+        self,
+        model: str,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        *,
+        priority: int = PRIORITY_GENERATE,
+    ) -> Any:
+        """
+        Вызов fn() в слоте модели. Тот же key в полёте — ждём его результат, второго вызова нет.
+        Отмена одного ожидающего не отменяет общий вызов.
+        """
+        fut = self._calls.get(key)
+        if fut is None:
+
+            async def call() -> Any:
+                try:
+                    async with self.slot(model, priority=priority):
+                        return await fn()
+                finally:
+                    self._calls.pop(key, None)
+
+            fut = self._calls[key] = asyncio.ensure_future(call())
+        return await asyncio.shield(fut)
+
+    async def stream(
+        self,
+        model: str,
+        key: str,
+        fn: Callable[[], AsyncIterator[str]],
+        *,
+        priority: int = PRIORITY_GENERATE,
+    ) -> AsyncIterator[str]:
+        """
+        Стрим fn() в слоте модели. Одинаковые стримы в полёте читают один upstream:
+        новый подписчик сначала получает уже сгенерированное, дальше — вживую.
+        Upstream отменяется, когда ушёл последний подписчик.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _StreamFlight()
+
+            async def pump(fl: _StreamFlight) -> None:
+                try:
+                    async with self.slot(model, priority=priority):
+                        async for piece in fn():
+                            await fl.publish(piece)
+                    await fl.publish()
+                except BaseException as e:
+                    await fl.publish(error=e)
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                finally:
+                    if self._streams.get(key) is fl:
+                        del self._streams[key]
+
+            flight.task = asyncio.ensure_future(pump(flight))
+
+        flight.subscribers += 1
+        try:
+            async for piece in flight.read():
+                yield piece
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and flight.task is not None and not flight.task.done():
+                # новые подписчики с тем же key начнут свой upstream, а не получат отмену
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            m: {"limit": g.limit, "active": g.active, "queued": g.queued(), "avg_hold_s": round(g.avg_hold_s, 3)}
+            for m, g in self._gates.items()
+        }
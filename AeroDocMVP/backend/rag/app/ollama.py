@@ -1,39 +1,138 @@
 from __future__ import annotations
 
 import json
+from typing import Any, Dict, Iterator, Optional, Union
 from urllib.request import Request, urlopen
 
 DEFAULT_SYSTEM = (
     "Ты помощник по технической документаци. Старайся отвечать по предоставленным данным. Делай ссылки на страницы"
 )
 
-def ollama_chat(
+
+def keep_alive_value(keep_alive: str) -> Union[int, str]:
+    # Ollama: число — секунды (-1 = держать всегда), строка — длительность Go ("30m")
+    v = (keep_alive or "").strip()
+    try:
+        return int(v)
+    except ValueError:
+        return v
+
+
+def model_options(temperature: float, *, num_ctx: int = 0, num_thread: int = 0) -> Dict[str, Any]:
+    """
+    options для /api/chat. num_ctx/num_thread должны совпадать во всех запросах к модели:
+    другое значение — перезагрузка раннера и потеря кэша промпта.
+    """
+    opts: Dict[str, Any] = {"temperature": temperature}
+    if num_ctx > 0:
+        opts["num_ctx"] = num_ctx
+    if num_thread > 0:
+        opts["num_thread"] = num_thread
+    return opts
+
+
+def _chat_request(
     prompt: str,
     *,
     model: str,
-    base_url: str = "http://localhost:11434",
-    timeout: int = 120,
-    system: str = DEFAULT_SYSTEM,
-    temperature: float = 0.1,
-) -> str:
-    """
-    Ollama /api/chat, non-stream.
-    """
+    base_url: str,
+    system: str,
+    temperature: float,
+    stream: bool,
+    keep_alive: Optional[str] = None,
+    num_ctx: int = 0,
+    num_thread: int = 0,
+) -> Request:
     url = base_url.rstrip("/") + "/api/chat"
-    payload = {
+    payload: Dict[str, Any] = {
         "model": model,
-        "stream": False,
+        "stream": stream,
         "messages": [
             {"role": "system", "content": system},
             {"role": "user", "content": prompt},
         ],
-        "options": {"temperature": temperature},
+        "options": model_options(temperature, num_ctx=num_ctx, num_thread=num_thread),
     }
+    if keep_alive:
+        payload["keep_alive"] = keep_alive_value(keep_alive)
 
     data = json.dumps(payload).encode("utf-8")
-    req = Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+    return Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+
+
+def ollama_chat(
+    prompt: str,
+    *,
+    model: str,
+    base_url: str = "http://localhost:11434",
+    timeout: int = 120,
+    system: str = DEFAULT_SYSTEM,
+    temperature: float = 0.1,
+    keep_alive: Optional[str] = None,
+    num_ctx: int = 0,
+    num_thread: int = 0,
+) -> str:
+    """
+    Ollama /api/chat, non-stream.
+    """
+    req = _chat_request(
+        prompt,
+        model=model,
+        base_url=base_url,
+        system=system,
+        temperature=temperature,
+        stream=False,
+        keep_alive=keep_alive,
+        num_ctx=num_ctx,
+        num_thread=num_thread,
+    )
 
     with urlopen(req, timeout=timeout) as r:
         body = r.read().decode("utf-8", errors="replace")
         resp = json.loads(body)
         return (resp.get("message") or {}).get("content") or ""
+
+
+def ollama_chat_stream(
+    prompt: str,
+    *,
+    model: str,
+    base_url: str = "http://localhost:11434",
+    timeout: int = 120,
+    system: str = DEFAULT_SYSTEM,
+    temperature: float = 0.1,
+    keep_alive: Optional[str] = None,
+    num_ctx: int = 0,
+    num_thread: int = 0,
+) -> Iterator[str]:
+    """
+    Ollama /api/chat, stream.
+    Ollama отдаёт NDJSON: по одному объекту на строку, пока не придёт {"done": true}.
+    Отдаём куски текста по мере генерации.
+    """
+    req = _chat_request(
+        prompt,
+        model=model,
+        base_url=base_url,
+        system=system,
+        temperature=temperature,
+        stream=True,
+        keep_alive=keep_alive,
+        num_ctx=num_ctx,
+        num_thread=num_thread,
+    )
+
+    with urlopen(req, timeout=timeout) as r:
+        for line in r:
+            line = line.strip()
+            if not line:
+                continue
+            resp = json.loads(line.decode("utf-8", errors="replace"))
+            if resp.get("error"):
+                raise RuntimeError(f"Ollama error: {resp['error']}")
+
+            piece = (resp.get("message") or {}).get("content") or ""
+            if piece:
+                yield piece
+            if resp.get("done"):
+                break
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.ollama import DEFAULT_SYSTEM, keep_alive_value, model_options
+from app.llm_scheduler import PRIORITY_GENERATE, LLMScheduler
+from config.settings import Settings
+
+
+class OllamaHTTPError(RuntimeError):
+    """Ollama ответил не-200."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Ollama HTTP {status_code}. Body: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class OllamaClient:
+    """
+    Общий async-клиент Ollama /api/chat:
+    - один httpx.AsyncClient на процесс (keep-alive пул соединений)
+    - retry с экспоненциальным backoff на ошибках соединения
+    - non-stream и stream режимы
+    - keep_alive/num_ctx/num_thread в каждом запросе; preload() грузит модель заранее
+    - chat/chat_stream идут через LLMScheduler (лимит на модель, приоритеты, склейка одинаковых)
+    Создаётся в lifespan FastAPI, закрывается через aclose().
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        model: str,
+        timeout_s: float = 120.0,
+        connect_timeout_s: float = 5.0,
+        max_connections: int = 16,
+        max_keepalive: int = 8,
+        keepalive_expiry_s: float = 60.0,
+        retry_count: int = 3,
+        retry_backoff_s: float = 0.5,
+        keep_alive: str = "",
+        num_ctx: int = 0,
+        num_thread: int = 0,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.num_thread = num_thread
+        self.scheduler = scheduler or LLMScheduler()
+        self.retry_count = max(1, retry_count)
+        self.retry_backoff_s = retry_backoff_s
+
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout_s, connect=connect_timeout_s),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry_s,
+            ),
+            trust_env=False,
+        )
+
+    @classmethod
+    def from_settings(cls, s: Settings) -> "OllamaClient":
+        return cls(
+            s.ollama_base_url,
+            model=s.ollama_model,
+            timeout_s=s.ollama_timeout_s,
+            connect_timeout_s=s.ollama_connect_timeout_s,
+            max_connections=s.ollama_max_connections,
+            max_keepalive=s.ollama_max_keepalive,
+            keepalive_expiry_s=s.ollama_keepalive_expiry_s,
+            retry_count=s.ollama_retry_count,
+            retry_backoff_s=s.ollama_retry_backoff_s,
+            keep_alive=s.ollama_keep_alive,
+            num_ctx=s.ollama_num_ctx,
+            num_thread=s.ollama_num_thread,
+            scheduler=LLMScheduler.from_settings(s),
+        )
+
+    @property
+    def chat_url(self) -> str:
+        return self.base_url + "/api/chat"
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+
+    def _payload(
+        self,
+        prompt: str,
+        *,
+        system: str,
+        model: Optional[str],
+        temperature: float,
+        stream: bool,
+    ) -> Dict[str, Any]:
+        return self._request(
+            [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+            model=model,
+            options=model_options(temperature, num_ctx=self.num_ctx, num_thread=self.num_thread),
+            stream=stream,
+        )
+
+    def _request(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        model: Optional[str],
+        options: Dict[str, Any],
+        stream: bool,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": model or self.model,
+            "stream": stream,
+            "messages": messages,
+            "options": options,
+        }
+        if self.keep_alive:
+            payload["keep_alive"] = keep_alive_value(self.keep_alive)
+        return payload
+
+    @staticmethod
+    def _key(payload: Dict[str, Any]) -> str:
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    async def _send(self, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        Отправка с retry только на этапе соединения: запрос ещё не дошёл до модели,
+        повтор безопасен. Ответ открыт в stream-режиме — вызывающий обязан закрыть.
+        """
+        for attempt in range(1, self.retry_count + 1):
+            try:
+                req = self._client.build_request("POST", "/api/chat", json=payload)
+                r = await self._client.send(req, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt == self.retry_count:
+                    raise
+                await asyncio.sleep(self.retry_backoff_s * (2 ** (attempt - 1)))
+                continue
+
+            if r.status_code != 200:
+                body = (await r.aread()).decode("utf-8", errors="replace")
+                await r.aclose()
+                raise OllamaHTTPError(r.status_code, body)
+            return r
+
+        raise RuntimeError("unreachable")
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+
+    async def preload(
+        self,
+        model: Optional[str] = None,
+        *,
+        system: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> None:
+        """
+        Загрузить модель в память с keep_alive и теми же num_ctx/num_thread, что у запросов.
+        system + prefix — прогон статического начала промпта (1 токен генерации):
+        его KV уже в кэше Ollama, следующие запросы с тем же префиксом считают только хвост.
+        """
+        options = model_options(0.0, num_ctx=self.num_ctx, num_thread=self.num_thread)
+        messages: List[Dict[str, str]] = []
+        if system is not None:
+            options["num_predict"] = 1
+            messages = [{"role": "system", "content": system}, {"role": "user", "content": prefix or ""}]
+        r = await self._send(self._request(messages, model=model, options=options, stream=False))
+        try:
+            await r.aread()
+        finally:
+            await r.aclose()
+
+    async def chat(
+        self,
+        prompt: str,
+        *,
+        system: str = DEFAULT_SYSTEM,
+        model: Optional[str] = None,
+        temperature: float = 0.1,
+        priority: int = PRIORITY_GENERATE,
+    ) -> str:
+        """
+        Ollama /api/chat, non-stream. Через планировщик: может бросить LLMOverloaded.
+        """
+        payload = self._payload(prompt, system=system, model=model, temperature=temperature, stream=False)
+
+        async def call() -> str:
+            r = await self._send(payload)
+            try:
+                data = json.loads(await r.aread())
+            finally:
+                await r.aclose()
+            return (data.get("message") or {}).get("content") or ""
+
+        return await self.scheduler.run(payload["model"], self._key(payload), call, priority=priority)
+
+    async def chat_stream(
+        self,
+        prompt: str,
+        *,
+        system: str = DEFAULT_SYSTEM,
+        model: Optional[str] = None,
+        temperature: float = 0.1,
+        priority: int = PRIORITY_GENERATE,
+    ) -> AsyncIterator[str]:
+        """
+        Ollama /api/chat, stream: куски текста по мере генерации.
+        Через планировщик: может бросить LLMOverloaded до первого куска.
+        """
+        payload = self._payload(prompt, system=system, model=model, temperature=temperature, stream=True)
+        async for piece in self.scheduler.stream(
+            payload["model"], self._key(payload), lambda: self._stream(payload), priority=priority
+        ):
+            yield piece
+
+    def check_admission(self, model: Optional[str] = None) -> None:
+        """Быстрый отказ (LLMOverloaded), если модель перегружена — до начала стрима."""
+        self.scheduler.check_admission(model or self.model)
+
+    async def _stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        r = await self._send(payload)
+        try:
+            async for line in r.aiter_lines():
+                line = line.strip()
+                if not line:
+                    continue
+                resp = json.loads(line)
+                if resp.get("error"):
+                    raise RuntimeError(f"Ollama error: {resp['error']}")
+
+                piece = (resp.get("message") or {}).get("content") or ""
+                if piece:
+                    yield piece
+                if resp.get("done"):
+                    break
+        finally:
+            await r.aclose()
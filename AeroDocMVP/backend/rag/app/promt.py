@@ -1,6 +1,17 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+
+# Неизменная часть промпта — всегда первой (см. build_prompt, OllamaClient.preload).
+PROMPT_PREFIX = """Инструкция:
+1) Ответь кратко и по делу на вопрос в конце сообщения.
+2) Старайся использовать факты из Контекста.
+3) Источники отсортированы по релевантности — опирайся прежде всего на первые.
+4) В тексте ответа после каждого утверждения указывай источник в формате: ([номер источника, стр. X–Y]).
+   Если факт взят из метаданных (например, из названия файла) — всё равно укажи: ([номер источника, metadata]).
+5) В конце добавь "Источники:" — только файл и страницы.
+"""
 
 
 def format_sources(hits: List[Dict[str, Any]]) -> str:
@@ -27,7 +38,10 @@ def format_sources(hits: List[Dict[str, Any]]) -> str:
     return "\n".join(lines)
 
 
-def build_prompt(question: str, hits: List[Dict[str, Any]], max_chars: int = 4000) -> str:
+def build_prompt(question: str, hits: List[Dict[str, Any]], max_chars: Optional[int] = 4000) -> str:
+    """
+    max_chars=None — без обрезки по символам (контекст уже уложен в бюджет токенов, app/budget.py).
+    """
     parts: List[str] = []
     used = 0
 
@@ -54,7 +68,7 @@ def build_prompt(question: str, hits: List[Dict[str, Any]], max_chars: int = 400
 
         header = f"\n=== SOURCE [{i}] ===\n"
         block = header + txt + "\n"
-        if used + len(block) > max_chars:
+        if max_chars is not None and used + len(block) > max_chars:
             break
 
         parts.append(block)
@@ -62,21 +76,14 @@ def build_prompt(question: str, hits: List[Dict[str, Any]], max_chars: int = 400
 
     context = "".join(parts).strip()
 
-    return f"""Вопрос: {question}
-
+    # статическое начало (инструкция) + переменный хвост, вопрос — последним:
+    # префикс одинаков у всех запросов, Ollama переиспользует его KV-кэш
+    return f"""{PROMPT_PREFIX}
 Метаданные источников (их можно использовать как факты):
 {meta_block}
 
 Контекст (фрагменты из документов):
 {context}
 
-Инструкция:
-1) Ответь кратко и по делу.
-2) Старайся использовать факты из Контекста.
-3) Из 10 предоставленных источников выбери лучшие по смыслу
-3) В тексте ответа после каждого утверждения указывай источник в формате: ([номер источника, стр. X–Y]).
-   Если факт взят из метаданных (например, из названия файла) — всё равно укажи: ([номер источника, metadata]).
-4) В конце добавь "Источники:" — только файл и страницы.
+Вопрос: {question}
 """
-
-
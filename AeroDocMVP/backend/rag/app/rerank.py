@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+class Reranker:
+    """
+    Локальный cross-encoder поверх кандидатов после rrf_fuse.
+    - берём не больше max_candidates лучших по RRF;
+    - скоры (нормализованный вопрос, chunk_id) кэшируются (LRU), в модель уходят только промахи;
+    - промахи скорятся батчами по batch_size.
+    Потокобезопасен; модель грузится лениво.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        max_candidates: int = 20,
+        batch_size: int = 16,
+        cache_size: int = 4096,
+        max_length: int = 512,
+    ):
+        self.model_name = model_name
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.max_length = max_length
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, Any], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, s) -> "Reranker":
+        return cls(
+            s.rerank_model,
+            max_candidates=s.rerank_candidates,
+            batch_size=s.rerank_batch_size,
+            cache_size=s.rerank_cache_size,
+        )
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder  # type: ignore
+
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self._model
+
+    def warmup(self) -> None:
+        self._get_model().predict([("warmup", "warmup")], batch_size=1, show_progress_bar=False)
+
+    # ---------------------------
+    # Cache
+    # ---------------------------
+
+    def _cached(self, keys: Sequence[Tuple[str, Any]]) -> Dict[Tuple[str, Any], float]:
+        out: Dict[Tuple[str, Any], float] = {}
+        with self._lock:
+            for k in keys:
+                v = self._cache.get(k)
+                if v is not None:
+                    self._cache.move_to_end(k)
+                    out[k] = v
+        return out
+
+    def _remember(self, scores: Dict[Tuple[str, Any], float]) -> None:
+        with self._lock:
+            for k, v in scores.items():
+                self._cache[k] = v
+                self._cache.move_to_end(k)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---------------------------
+    # Rerank
+    # ---------------------------
+
+    def scores(self, question: str, hits: Sequence[Dict[str, Any]]) -> List[float]:
+        q = " ".join((question or "").lower().split())
+        keys = [(q, h.get("id")) for h in hits]
+        known = self._cached(keys)
+
+        todo = [(k, h) for k, h in zip(keys, hits) if k not in known]
+        if todo:
+            pairs = [(question, ((h.get("payload") or {}).get("text") or "")) for _, h in todo]
+            raw = self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            fresh = {k: float(v) for (k, _), v in zip(todo, raw)}
+            self._remember(fresh)
+            known.update(fresh)
+
+        return [known[k] for k in keys]
+
+    def rerank(
+        self,
+        question: str,
+        hits: List[Dict[str, Any]],
+        *,
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        hits — в порядке RRF, с текстом в payload. Возвращает top_k по скору cross-encoder;
+        исходный скор остаётся в "score", новый — в "rerank_score".
+        """
+        candidates = [h for h in hits[: self.max_candidates] if (h.get("payload") or {}).get("text")]
+        if not candidates:
+            return hits[:top_k]
+
+        scored = sorted(
+            zip(self.scores(question, candidates), candidates),
+            key=lambda x: x[0],
+            reverse=True,
+        )
+        return [{**h, "rerank_score": score} for score, h in scored[:top_k]]
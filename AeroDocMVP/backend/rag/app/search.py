@@ -1,10 +1,17 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from embed.embeddings import Embedder
-from utils.qdrant_store import QdrantStore
-from utils.sqlite_fts import connect_db, init_fts, bm25_search
+from utils.filters import SearchFilters
+from utils.sparse import sparse_query_vector
+from utils.sqlite_fts import get_read_pool, bm25_search, fetch_chunks
+
+if TYPE_CHECKING:
+    from embed.embeddings import Embedder
+    from utils.qdrant_store import QdrantStore
 
 
 def search_qdrant(
@@ -14,25 +21,28 @@ def search_qdrant(
     *,
     limit: int = 5,
     score_threshold: Optional[float] = None,
+    query_vector: Optional[list] = None,
+    filters: Optional[SearchFilters] = None,
+    with_payload: bool = True,
 ) -> List[Dict[str, Any]]:
-    qvec = embedder.embed([question])[0]
+    qvec = query_vector if query_vector is not None else embedder.embed([question])[0]
     hits = store.search(
         query_vector=qvec,
         limit=limit,
-        query_filter=None,
+        query_filter=filters.to_qdrant() if filters else None,
         score_threshold=score_threshold,
+        with_payload=with_payload,
     )
 
-    out: List[Dict[str, Any]] = []
-    for h in hits:
-        out.append(
-            {
-                "id": getattr(h, "id", None),
-                "score": getattr(h, "score", None),
-                "payload": getattr(h, "payload", None),
-            }
-        )
-    return out
+    return [_hit_dict(h) for h in hits]
+
+
+def _hit_dict(h) -> Dict[str, Any]:
+    return {
+        "id": getattr(h, "id", None),
+        "score": getattr(h, "score", None),
+        "payload": getattr(h, "payload", None),
+    }
 
 
 def rrf_fuse(
@@ -73,20 +83,173 @@ def search_hybrid(
     prefetch_dense: int = 30,
     prefetch_bm25: int = 30,
     score_threshold: Optional[float] = None,
+    max_df_ratio: float = 0.5,
+    query_vector: Optional[list] = None,
+    filters: Optional[SearchFilters] = None,
+    slim: bool = False,
+    engine: str = "local",
 ) -> List[Dict[str, Any]]:
+    """
+    slim=True: dense-ветка получает только id/score (без payload); текст финальных
+    хитов после fusion добирается из SQLite одним запросом (hydrate_hits).
+    engine="qdrant": dense + sparse BM25 с RRF одним запросом к Qdrant; SQLite нужен
+    только для slim-коллекции.
+    """
+    if engine == "qdrant":
+        qvec = query_vector if query_vector is not None else embedder.embed([question])[0]
+        hits = [
+            _hit_dict(h)
+            for h in store.search_hybrid(
+                qvec,
+                sparse_query_vector(question),
+                limit=limit,
+                prefetch_dense=prefetch_dense,
+                prefetch_sparse=prefetch_bm25,
+                query_filter=filters.to_qdrant() if filters else None,
+                score_threshold=score_threshold,
+                with_payload=not slim,
+            )
+        ]
+        if any(not (h.get("payload") or {}).get("text") for h in hits):
+            hits = hydrate_hits(get_read_pool(fts_db_path).get(), hits)
+        return hits
+
     dense_hits = search_qdrant(
         store,
         embedder,
         question,
         limit=prefetch_dense,
         score_threshold=score_threshold,
+        query_vector=query_vector,
+        filters=filters,
+        with_payload=not slim,
     )
 
-    conn = connect_db(fts_db_path)
-    init_fts(conn)
-    try:
-        bm25_hits = bm25_search(conn, question, limit=prefetch_bm25)
-    finally:
-        conn.close()
+    conn = get_read_pool(fts_db_path).get()
+    bm25_hits = bm25_search(
+        conn,
+        question,
+        limit=prefetch_bm25,
+        filters=filters or SearchFilters(),
+        max_df_ratio=max_df_ratio,
+    )
+
+    return hydrate_hits(conn, rrf_fuse(dense_hits, bm25_hits, limit=limit))
+
+
+def hydrate_hits(conn, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Хиты без текста в payload (slim-коллекция или запрос без payload) дополняются из chunks.
+    """
+    missing = [h["id"] for h in hits if not (h.get("payload") or {}).get("text")]
+    if not missing:
+        return hits
+    rows = fetch_chunks(conn, missing)
+    for h in hits:
+        row = rows.get(h["id"])
+        if row is not None:
+            h["payload"] = {**(h.get("payload") or {}), **row}
+    return hits
+
+
+# ---------------------------
+# Async (API)
+# ---------------------------
+
+def _bm25_leg(
+    fts_db_path: str,
+    question: str,
+    *,
+    limit: int,
+    filters: Optional[SearchFilters],
+    max_df_ratio: float,
+) -> List[Dict[str, Any]]:
+    conn = get_read_pool(fts_db_path).get()  # соединение потока fts-пула
+    return bm25_search(conn, question, limit=limit, filters=filters or SearchFilters(), max_df_ratio=max_df_ratio)
+
+
+def _hydrate(fts_db_path: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return hydrate_hits(get_read_pool(fts_db_path).get(), hits)
+
+
+def _needs_text(hits: List[Dict[str, Any]]) -> bool:
+    return any(not (h.get("payload") or {}).get("text") for h in hits)
+
+
+async def search_hybrid_async(
+    store: QdrantStore,
+    embedder: Embedder,
+    question: str,
+    *,
+    fts_db_path: str,
+    embed_executor: Executor,
+    fts_executor: Executor,
+    limit: int = 5,
+    prefetch_dense: int = 30,
+    prefetch_bm25: int = 30,
+    score_threshold: Optional[float] = None,
+    max_df_ratio: float = 0.5,
+    query_vector: Optional[list] = None,
+    filters: Optional[SearchFilters] = None,
+    slim: bool = False,
+    engine: str = "local",
+) -> List[Dict[str, Any]]:
+    """
+    То же, что search_hybrid, но без блокировки event loop:
+    эмбеддинг — в embed_executor, Qdrant — через AsyncQdrantClient, FTS — в fts_executor.
+    BM25 не ждёт эмбеддинга: обе ветки идут параллельно.
+    """
+    loop = asyncio.get_running_loop()
+    query_filter = filters.to_qdrant() if filters else None
+
+    async def embed_query() -> list:
+        if query_vector is not None:
+            return query_vector
+        vecs = await loop.run_in_executor(embed_executor, embedder.embed, [question])
+        return vecs[0]
+
+    if engine == "qdrant":
+        qvec = await embed_query()
+        points = await store.asearch_hybrid(
+            qvec,
+            sparse_query_vector(question),
+            limit=limit,
+            prefetch_dense=prefetch_dense,
+            prefetch_sparse=prefetch_bm25,
+            query_filter=query_filter,
+            score_threshold=score_threshold,
+            with_payload=not slim,
+        )
+        hits = [_hit_dict(h) for h in points]
+        if _needs_text(hits):
+            hits = await loop.run_in_executor(fts_executor, _hydrate, fts_db_path, hits)
+        return hits
+
+    async def dense_leg() -> List[Dict[str, Any]]:
+        qvec = await embed_query()
+        points = await store.asearch(
+            qvec,
+            limit=prefetch_dense,
+            query_filter=query_filter,
+            score_threshold=score_threshold,
+            with_payload=not slim,
+        )
+        return [_hit_dict(h) for h in points]
+
+    bm25_leg = loop.run_in_executor(
+        fts_executor,
+        partial(
+            _bm25_leg,
+            fts_db_path,
+            question,
+            limit=prefetch_bm25,
+            filters=filters,
+            max_df_ratio=max_df_ratio,
+        ),
+    )
+    dense_hits, bm25_hits = await asyncio.gather(dense_leg(), bm25_leg)
 
-    return rrf_fuse(dense_hits, bm25_hits, limit=limit)
+    hits = rrf_fuse(dense_hits, bm25_hits, limit=limit)
+    if _needs_text(hits):
+        hits = await loop.run_in_executor(fts_executor, _hydrate, fts_db_path, hits)
+    return hits
@@ -8,9 +8,12 @@ from urllib.error import URLError, HTTPError
 from config.settings import Settings
 from embed.embeddings import Embedder
 from utils.qdrant_store import QdrantStore
+from utils.filters import SearchFilters
+from utils.tokens import get_token_counter
 
-from app.ollama import ollama_chat
+from app.ollama import ollama_chat_stream
 from app.promt import build_prompt, format_sources
+from app.budget import compress_hits
 from app.search import search_qdrant
 from app.search import search_hybrid
 
@@ -58,8 +61,8 @@ def main():
     if file_name:
         print("Filter file_name:", file_name)
 
-    store = QdrantStore(url=s.qdrant_url, collection=s.collection, vector_name=s.vector_name)
-    embedder = Embedder(s.embedding_model, batch_size=32)
+    store = QdrantStore.from_settings(s)
+    embedder = Embedder.from_settings(s)
 
     t0 = time.time()
     hits = search_hybrid(
@@ -69,6 +72,9 @@ def main():
         fts_db_path=s.fts_db_path,
         limit=top_k,
         score_threshold=score_threshold,
+        filters=SearchFilters(file_name=file_name) if file_name else None,
+        slim=s.qdrant_slim_payload,
+        engine=s.hybrid_engine,
     )
 
     dt = time.time() - t0
@@ -78,20 +84,48 @@ def main():
         print("\nОтвет: в предоставленных фрагментах нет информации.")
         return
 
-    prompt = build_prompt(question, hits, max_chars=12000)
-
+    if s.prompt_context_tokens > 0:
+        counter = get_token_counter(s.prompt_tokenizer)
+        hits = compress_hits(
+            question,
+            hits,
+            budget_tokens=s.prompt_context_tokens,
+            counter=counter,
+            neighbours=s.prompt_neighbour_units,
+        )
+        used = sum((h.get("payload") or {}).get("n_tokens") or 0 for h in hits)
+        print(f"Context tokens: {used}/{s.prompt_context_tokens} ({'exact' if counter.exact else 'estimate'})")
+        prompt = build_prompt(question, hits, max_chars=None)
+    else:
+        prompt = build_prompt(question, hits, max_chars=12000)
+
+    print()
+    t1 = time.time()
+    first_token_s = None
     try:
-        answer = ollama_chat(prompt, model=ollama_model, base_url=ollama_url)
+        for piece in ollama_chat_stream(
+            prompt,
+            model=ollama_model,
+            base_url=ollama_url,
+            keep_alive=s.ollama_keep_alive,
+            num_ctx=s.ollama_num_ctx,
+            num_thread=s.ollama_num_thread,
+        ):
+            if first_token_s is None:
+                first_token_s = time.time() - t1
+            print(piece, end="", flush=True)
     except HTTPError as e:
         err_body = e.read().decode("utf-8", errors="replace") if hasattr(e, "read") else ""
         print(f"HTTPError: {e.code} {e.reason}")
         print(err_body[:4000])
         return
     except (URLError, Exception) as e:
-        print("LLM request failed:", repr(e))
+        print("\nLLM request failed:", repr(e))
         return
 
-    print("\n" + answer.strip())
+    print()
+    if first_token_s is not None:
+        print(f"\nTTFT: {first_token_s:.2f}s | total: {time.time() - t1:.2f}s")
     print("\nИсточники (retrieval):")
     print(format_sources(hits))
 
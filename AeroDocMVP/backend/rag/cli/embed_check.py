@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from config.settings import Settings
+from embed.embeddings import Embedder
+
+
+def load_samples(s: Settings, limit: int) -> List[str]:
+    path = Path(s.exports_dir) / "chunks.jsonl"
+    texts: List[str] = []
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                text = (json.loads(line).get("text") or "").strip()
+                if text:
+                    texts.append(text)
+                if len(texts) >= limit:
+                    break
+    return texts or [
+        "Как выполнить запуск двигателя в холодное время года?",
+        "Какой минимальный остаток топлива перед посадкой?",
+        "Engine start procedure at low ambient temperature.",
+    ]
+
+
+def measure(s: Settings, backend: str, texts: List[str], queries: List[str]):
+    t0 = time.perf_counter()
+    emb = Embedder.from_settings(s, backend=backend)
+    emb.dim()
+    cold_s = time.perf_counter() - t0
+
+    vecs = np.asarray(emb.embed(texts), dtype=np.float32)
+
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        emb.embed([q])
+        lat.append(time.perf_counter() - t)
+    return vecs, cold_s, lat
+
+
+def main():
+    # python -m cli.embed_check [N]
+    # Сравнивает настроенный EMBED_BACKEND с sentence-transformers на чанках из экспорта:
+    # косинус между векторами одних и тех же текстов, cold start и латентность одного запроса.
+    s = Settings()
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    texts = load_samples(s, limit)
+    queries = [t[:200] for t in texts[:50]]
+
+    backends = ["sentence-transformers"]
+    if s.embed_backend != "sentence-transformers":
+        backends.append(s.embed_backend)
+
+    results = {}
+    for b in backends:
+        vecs, cold_s, lat = measure(s, b, texts, queries)
+        results[b] = vecs
+        print(
+            f"{b:22s} cold_start={cold_s:6.2f}s  "
+            f"query p50={np.percentile(lat, 50) * 1000:6.1f}ms  p95={np.percentile(lat, 95) * 1000:6.1f}ms"
+        )
+
+    if len(results) == 2:
+        ref, other = results["sentence-transformers"], results[backends[1]]
+        cos = (ref * other).sum(axis=1)
+        print(f"cosine vs sentence-transformers: min={cos.min():.5f} mean={cos.mean():.5f} (n={len(cos)})")
+        if cos.min() < 0.98:
+            print("WARNING: векторы заметно расходятся — коллекцию лучше переиндексировать этим бэкендом")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+
+from config.settings import Settings
+from embed.batcher import BatchingEmbedder
+from embed.embeddings import Embedder
+from embed.remote import parse_address, serve
+from utils.proxy import disable_proxies_for_localhost
+
+# Общий сервер эмбеддингов: одна модель на хост для всех воркеров API (EMBED_SERVER в их .env).
+# python -m cli.embed_server [address]   (по умолчанию — EMBED_SERVER)
+
+
+def main() -> None:
+    disable_proxies_for_localhost()
+    s = Settings()
+    address = sys.argv[1] if len(sys.argv) > 1 else s.embed_server
+    if not address:
+        print("Usage: python -m cli.embed_server unix:/path/embed.sock | host:port  (или EMBED_SERVER)")
+        return
+
+    kind, target = parse_address(address)
+    if kind == "unix" and os.path.exists(target):
+        os.unlink(target)  # сокет от прошлого запуска
+
+    embedder = BatchingEmbedder(
+        Embedder.from_settings(s),
+        max_batch=s.embed_max_batch,
+        max_wait_ms=s.embed_max_wait_ms,
+    )
+    embedder.embed(["прогрев"])
+    print(
+        f"Embed server: {address} | model: {embedder.model_name} ({embedder.backend_name}, dim={embedder.dim()})"
+        f" | max_batch={s.embed_max_batch} max_wait_ms={s.embed_max_wait_ms}"
+    )
+    try:
+        asyncio.run(serve(address, embedder))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Batches: {embedder.stats()}")
+        embedder.close()
+
+
+if __name__ == "__main__":
+    main()
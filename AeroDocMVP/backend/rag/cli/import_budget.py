@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+# Бюджет холодного импорта API: python -X importtime -c "import main" в чистом процессе.
+# python -m cli.import_budget [budget_ms] [top_n]  — код выхода 1 при превышении/запрещённом импорте.
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# Модули, которых не должно быть после "import main": ingest-only (docling, fitz, chonkie)
+# и тяжёлые рантаймы, которые грузятся лениво при прогреве (torch, qdrant_client, ...).
+FORBIDDEN = (
+    "docling",
+    "fitz",
+    "chonkie",
+    "tqdm",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "onnxruntime",
+    "fastembed",
+    "qdrant_client",
+    "grpc",
+)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Строки "import time: self [us] | cumulative | imported package" ->
+    (имя, self_us, cumulative_us, глубина вложенности).
+    """
+    out: List[Tuple[str, int, int, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок
+        raw = parts[2].rstrip()
+        name = raw.lstrip()
+        depth = (len(raw) - len(name) - 1) // 2
+        out.append((name, int(parts[0]), int(parts[1]), depth))
+    return out
+
+
+def main() -> int:
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 1500.0
+    top_n = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=str(BACKEND_DIR),
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        print(proc.stderr[-4000:])
+        print("import main failed")
+        return 1
+
+    total_ms = next((cum for name, _, cum, depth in rows if name == "main" and depth == 0), 0) / 1000.0
+    print(f"import main: {total_ms:.0f} ms (budget {budget_ms:.0f} ms), modules: {len(rows)}")
+
+    print(f"\nTop {top_n} direct imports of main by cumulative time:")
+    top = sorted((r for r in rows if r[3] == 1), key=lambda r: r[2], reverse=True)[:top_n]
+    for name, _, cum, _ in top:
+        print(f"  {cum / 1000.0:8.1f} ms  {name}")
+
+    loaded = {name for name, _, _, _ in rows}
+    bad = sorted(m for m in loaded if m.split(".")[0] in FORBIDDEN)
+    roots = sorted({m.split(".")[0] for m in bad})
+    if roots:
+        print(f"\nForbidden imports: {', '.join(roots)}")
+
+    ok = total_ms <= budget_ms and not roots
+    print("\nOK" if ok else "\nFAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,13 @@
 from __future__ import annotations
 import sys
 
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from tqdm import tqdm
 from dotenv import load_dotenv
@@ -15,17 +20,231 @@ from embed.embeddings import Embedder
 from utils.qdrant_store import QdrantStore
 
 from utils.batch import batched
-from utils.export import export_rows_jsonl_append
+from utils.export import export_rows_jsonl_append, export_drop_doc_ids
+from utils.manifest import IngestManifest, path_meta
+from utils.generation import bump_generation
+from utils.sparse import sparse_doc_vector
+from utils.tokens import get_token_counter
 from utils.qdrant_retry import wait_qdrant_ready, retry
 from utils.proxy import disable_proxies_for_localhost
-from utils.sqlite_fts import connect_db, init_fts, upsert_chunks, delete_by_doc_id as sqlite_delete_by_doc_id
+from utils.sqlite_fts import (
+    connect_db,
+    init_fts,
+    upsert_chunks,
+    delete_by_doc_id as sqlite_delete_by_doc_id,
+    update_doc_meta as sqlite_update_doc_meta,
+    begin_bulk_load,
+    bulk_insert_chunks,
+    finish_bulk_load,
+)
 
 
 def chunk_to_row(ch: SrcChunk) -> Dict[str, Any]:
     return {"id": ch.id, "text": ch.text, **(ch.meta or {})}
 
 
-def run_ingest(s: Settings) -> Path:
+@dataclass
+class ParsedDoc:
+    path: Path
+    doc_id: str
+    content_hash: str
+    chunks: List[SrcChunk]
+
+
+@dataclass
+class EmbeddedDoc:
+    path: Path
+    doc_id: str
+    content_hash: str
+    chunks: List[SrcChunk]
+    vecs: List[list]
+
+
+def scan_documents(docs_dir: Path) -> List[Path]:
+    return sorted(p for p in docs_dir.rglob("*") if p.is_file())
+
+
+def parse_document(path: Path, s: Settings, content_hash: str) -> ParsedDoc:
+    """
+    Стадия 1 (процесс-пул): docling/fitz -> chef -> chunking.
+    Чисто CPU, без сети и модели — безопасно гонять в отдельных процессах.
+    """
+    doc = read_with_docling(path, content_hash=content_hash)
+    raw_text = doc["text"]
+    meta: Dict[str, Any] = doc["meta"]
+
+    doc_id = meta.get("doc_id")
+    if not doc_id:
+        raise ValueError("doc meta must contain doc_id (add it in preprocessor/docling_reader.py)")
+
+    text = preprocess_doc_text(raw_text, table_mode="linearize")
+
+    chunks = chunk_with_chonkie(
+        text,
+        meta=meta,
+        target_chars=s.target_chunk_chars,
+        min_chars=s.min_chunk_chars,
+        overlap=s.overlap_chars,
+    )
+    # токены целевой LLM на чанк: бюджет промпта (app/budget.py) считает без повторной токенизации
+    counts = get_token_counter(s.prompt_tokenizer).count_many([c.text for c in chunks])
+    for c, n in zip(chunks, counts):
+        c.meta["n_tokens"] = n
+    return ParsedDoc(path=path, doc_id=doc_id, content_hash=content_hash, chunks=chunks)
+
+
+class Writer:
+    """
+    Стадия 3 (отдельный поток): delete старого + upsert в Qdrant, SQLite FTS, JSONL.
+    Работает параллельно с эмбеддингом следующих документов.
+    SQLite-соединение создаётся в этом же потоке.
+    Успешно записанный документ фиксируется в манифесте.
+
+    bulk=True (полная пересборка): chunks очищается в начале, FTS-индекс
+    не обновляется построчно, а строится одним 'rebuild' в конце.
+    """
+
+    def __init__(
+        self,
+        s: Settings,
+        store: QdrantStore,
+        export_path: Path,
+        manifest: IngestManifest,
+        docs_dir: Path,
+        *,
+        bulk: bool = False,
+    ):
+        self.s = s
+        self.store = store
+        self.export_path = export_path
+        self.manifest = manifest
+        self.docs_dir = docs_dir
+        self.bulk = bulk
+        self.total_chunks = 0
+        self.indexed_docs = 0  # успешно записанные документы (для bump_generation)
+
+        self._q: "queue.Queue[Optional[EmbeddedDoc]]" = queue.Queue(maxsize=max(1, s.ingest_queue_size))
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def put(self, item: EmbeddedDoc) -> None:
+        # bounded queue: если запись отстаёт — эмбеддинг ждёт (backpressure)
+        self._q.put(item)
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        sqlite_conn = connect_db(self.s.fts_db_path)
+        init_fts(sqlite_conn)
+        if self.bulk:
+            begin_bulk_load(sqlite_conn)
+        try:
+            while True:
+                item = self._q.get()
+                if item is None:
+                    if self.bulk:
+                        print("FTS rebuild...")
+                        finish_bulk_load(sqlite_conn)
+                    return
+                try:
+                    self._write(item, sqlite_conn)
+                    self.manifest.record_indexed(
+                        self.docs_dir,
+                        item.path,
+                        content_hash=item.content_hash,
+                        doc_id=item.doc_id,
+                        chunks=len(item.chunks),
+                    )
+                    self.indexed_docs += 1
+                except Exception as e:
+                    self.manifest.record_failed(self.docs_dir, item.path)
+                    print(f"[ERROR] {item.path.name}: {repr(e)}")
+        finally:
+            try:
+                sqlite_conn.close()
+            except Exception:
+                pass
+
+    def _write(self, item: EmbeddedDoc, sqlite_conn) -> None:
+        s = self.s
+        doc_id = item.doc_id
+
+        retry(
+            lambda: self.store.delete_by_doc_id(doc_id),
+            what=f"delete_by_doc_id({doc_id})",
+            retry_count=s.qdrant_retry_count,
+            sleep_s=s.qdrant_retry_sleep_s,
+        )
+        # точки, записанные по этому пути со старым path+mtime doc_id; документы из манифеста
+        # не трогаем — их содержимое может использовать копия (удаляются через plan.purge)
+        known = self.manifest.doc_ids()
+        retry(
+            lambda: self.store.delete_by_file_path(str(item.path), keep_doc_ids=sorted(known)),
+            what=f"delete_by_file_path({item.path.name})",
+            retry_count=s.qdrant_retry_count,
+            sleep_s=s.qdrant_retry_sleep_s,
+        )
+        if not self.bulk:
+            sqlite_delete_by_doc_id(sqlite_conn, doc_id)
+
+        points: List[Dict[str, Any]] = []
+        for c, v in zip(item.chunks, item.vecs):
+            point = {"id": c.id, "vector": v, "payload": {"text": c.text, **c.meta}}
+            if self.store.sparse_vector_name:
+                point["sparse"] = sparse_doc_vector(c.text)
+            points.append(point)
+
+        for batch in batched(points, s.upsert_batch_size):
+            retry(
+                lambda b=batch: self.store.upsert(b),
+                what=f"upsert({item.path.name})",
+                retry_count=s.qdrant_retry_count,
+                sleep_s=s.qdrant_retry_sleep_s,
+            )
+
+        rows = [chunk_to_row(c) for c in item.chunks]
+        if self.bulk:
+            bulk_insert_chunks(sqlite_conn, rows, batch_size=s.fts_batch_size)
+        else:
+            upsert_chunks(sqlite_conn, rows, batch_size=s.fts_batch_size)
+
+        export_rows_jsonl_append(rows, self.export_path)
+        self.total_chunks += len(item.chunks)
+
+
+class IngestRuntime:
+    """
+    Тяжёлые объекты ingest (Qdrant-клиент, модель), живут между проходами в --watch.
+    Embedder грузится лениво: проход без новых документов модель не трогает.
+    """
+
+    def __init__(self, s: Settings):
+        self.s = s
+        self.store = QdrantStore.from_settings(s)
+
+        print("\n=== QDRANT CONNECT ===")
+        wait_qdrant_ready(self.store, timeout_s=s.qdrant_ready_timeout_s)
+        print("Qdrant ready:", s.qdrant_url, "| collection:", s.collection, "| vector:", s.vector_name)
+
+        self._embedder: Optional[Embedder] = None
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = Embedder.from_settings(
+                self.s,
+                cache_dir=self.s.embed_cache_dir or None,
+                cache_max_entries=self.s.embed_cache_max_entries,
+                cache_dtype=self.s.embed_cache_dtype,
+            )
+        return self._embedder
+
+
+def run_ingest(s: Settings, *, runtime: Optional[IngestRuntime] = None) -> Path:
     load_dotenv()
     disable_proxies_for_localhost()
     docs_dir = Path(s.documents_dir)
@@ -34,23 +253,44 @@ def run_ingest(s: Settings) -> Path:
 
     sqlite_conn = connect_db(s.fts_db_path)
     init_fts(sqlite_conn)
+    sqlite_conn.close()
 
     if not docs_dir.exists():
         raise FileNotFoundError(f"Documents dir not found: {docs_dir.resolve()}")
 
-    files = [p for p in docs_dir.rglob("*") if p.is_file()]
-    if not files:
+    manifest = IngestManifest(exports_dir / "manifest.json")
+    full_rebuild = s.wipe_collection or not manifest.exists()
+    if full_rebuild:
+        # полная пересборка: манифест, export и FTS с нуля
+        manifest.reset()
+        if export_path.exists():
+            export_path.unlink()
+
+    files = scan_documents(docs_dir)
+    if not files and not manifest.docs:
         print(f"No files in {docs_dir.resolve()}")
         return export_path
 
-    store = QdrantStore(url=s.qdrant_url, collection=s.collection, vector_name=s.vector_name)
+    plan = manifest.plan(docs_dir, files)
+    print(
+        f"\n=== PLAN === files: {len(files)} | new/changed: {len(plan.process)} | "
+        f"removed: {len(plan.purge)} | linked: {plan.linked} | relinked: {len(plan.relink)} | "
+        f"unchanged: {plan.unchanged}"
+    )
 
-    print("\n=== QDRANT CONNECT ===")
-    wait_qdrant_ready(store, timeout_s=s.qdrant_ready_timeout_s)
-    print("Qdrant ready:", s.qdrant_url, "| collection:", s.collection, "| vector:", s.vector_name)
+    if not plan.process and not plan.purge and not plan.relink and not full_rebuild:
+        manifest.save()
+        print("Nothing to do.")
+        return export_path
 
-    if s.wipe_collection:
-        print(f"⚠️ WIPE_COLLECTION=True → deleting collection '{s.collection}'")
+    rt = runtime or IngestRuntime(s)
+    store = rt.store
+
+    if full_rebuild:
+        # без манифеста неизвестно, какие точки в коллекции устарели (в т.ч. со старым
+        # path+mtime doc_id) — пересобираем её вместе с FTS
+        reason = "WIPE_COLLECTION=True" if s.wipe_collection else "no manifest"
+        print(f"⚠️ {reason} → deleting collection '{s.collection}'")
         retry(
             lambda: store.client.delete_collection(collection_name=s.collection),
             what="delete_collection",
@@ -58,94 +298,204 @@ def run_ingest(s: Settings) -> Path:
             sleep_s=s.qdrant_retry_sleep_s,
         )
 
-    embedder = Embedder(s.embedding_model, batch_size=s.encode_batch_size)
-
     exports_dir.mkdir(parents=True, exist_ok=True)
-    if export_path.exists():
-        export_path.unlink()
     print("Export:", export_path.resolve())
 
-    collection_ready = False
-    total_chunks = 0
-
-    print("\n=== STREAMING INGEST (docling -> chef -> chunking -> embeddings -> qdrant) ===")
-
-    for path in tqdm(files, desc="Ingest"):
+    if plan.purge:
+        print(f"\n=== PURGE ({len(plan.purge)} removed/changed docs) ===")
+        sqlite_conn = connect_db(s.fts_db_path)
         try:
-            doc = read_with_docling(path)
-            raw_text = doc["text"]
-            meta: Dict[str, Any] = doc["meta"]
-
-            doc_id = meta.get("doc_id")
-            if not doc_id:
-                raise ValueError("doc meta must contain doc_id (add it in preprocessor/docling_reader.py)")
-
-            text = preprocess_doc_text(raw_text, table_mode="linearize")
-
-            chunks = chunk_with_chonkie(
-                text,
-                meta=meta,
-                target_chars=s.target_chunk_chars,
-                min_chars=s.min_chunk_chars,
-                overlap=s.overlap_chars,
-            )
-            if not chunks:
-                continue
-
-            vecs = embedder.embed([c.text for c in chunks])
-            if not vecs:
-                continue
-
-            if not collection_ready:
+            for doc_id in plan.purge:
                 retry(
-                    lambda: store.ensure_collection(embedder.dim()),
-                    what="ensure_collection",
+                    lambda d=doc_id: store.delete_by_doc_id(d),
+                    what=f"delete_by_doc_id({doc_id})",
                     retry_count=s.qdrant_retry_count,
                     sleep_s=s.qdrant_retry_sleep_s,
                 )
-                collection_ready = True
+                sqlite_delete_by_doc_id(sqlite_conn, doc_id)
+                manifest.forget_doc(doc_id)
+        finally:
+            sqlite_conn.close()
+        export_drop_doc_ids(export_path, set(plan.purge))
+        manifest.save()
+
+    if plan.relink:
+        print(f"\n=== RELINK ({len(plan.relink)} renamed/copied docs) ===")
+        sqlite_conn = connect_db(s.fts_db_path)
+        try:
+            for content_hash, path in plan.relink:
+                doc = manifest.docs[content_hash]
+                meta = path_meta(path)
+                if doc["chunks"]:
+                    retry(
+                        lambda d=doc["doc_id"], m=meta: store.set_payload_by_doc_id(d, m),
+                        what=f"set_payload({path.name})",
+                        retry_count=s.qdrant_retry_count,
+                        sleep_s=s.qdrant_retry_sleep_s,
+                    )
+                    sqlite_update_doc_meta(
+                        sqlite_conn,
+                        doc["doc_id"],
+                        file_name=meta["file_name"],
+                        modified_at=meta["modified_at"],
+                    )
+                manifest.record_relinked(docs_dir, path, content_hash=content_hash)
+        finally:
+            sqlite_conn.close()
+        manifest.save()
+
+    if plan.purge or plan.relink or full_rebuild:
+        # корпус изменился — кэш ответов API должен сброситься
+        bump_generation(s.ingest_generation_path)
+
+    if not plan.process:
+        print("\n=== DONE ===")
+        return export_path
 
-            retry(
-                lambda: store.delete_by_doc_id(doc_id),
-                what=f"delete_by_doc_id({doc_id})",
-                retry_count=s.qdrant_retry_count,
-                sleep_s=s.qdrant_retry_sleep_s,
-            )
-            sqlite_delete_by_doc_id(sqlite_conn, doc_id)
+    embedder = rt.embedder
 
-            points: List[Dict[str, Any]] = []
-            for c, v in zip(chunks, vecs):
-                points.append({"id": c.id, "vector": v, "payload": {"text": c.text, **c.meta}})
+    retry(
+        lambda: store.ensure_collection(embedder.dim()),
+        what="ensure_collection",
+        retry_count=s.qdrant_retry_count,
+        sleep_s=s.qdrant_retry_sleep_s,
+    )
 
-            for batch in batched(points, s.upsert_batch_size):
-                retry(
-                    lambda b=batch: store.upsert(b),
-                    what=f"upsert({path.name})",
-                    retry_count=s.qdrant_retry_count,
-                    sleep_s=s.qdrant_retry_sleep_s,
-                )
+    parse_workers = max(1, min(s.ingest_parse_workers, len(plan.process)))
+    max_in_flight = parse_workers * 2
+
+    print(
+        "\n=== PIPELINED INGEST (docling -> chef -> chunking) x"
+        f"{parse_workers} procs -> embeddings -> qdrant/sqlite/jsonl ==="
+    )
 
-            export_rows_jsonl_append([chunk_to_row(c) for c in chunks], export_path)
-            total_chunks += len(chunks)
+    writer = Writer(s, store, export_path, manifest, docs_dir, bulk=full_rebuild)
+    writer.start()
 
-        except Exception as e:
-            print(f"[ERROR] {path.name}: {repr(e)}")
+    pending = iter(plan.process)
+    in_flight: Dict[Future, Path] = {}
+    pbar = tqdm(total=len(plan.process), desc="Ingest")
+
+    # документы, чьи чанки ушли в embed_stream и ждут векторов
+    waiting: Dict[int, ParsedDoc] = {}
+    vectors: Dict[int, List[Optional[list]]] = {}
+    remaining: Dict[int, int] = {}
+
+    try:
+        with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+
+            def refill() -> None:
+                # ограничиваем число документов "в полёте", чтобы распарсенные чанки не копились в RAM
+                while len(in_flight) < max_in_flight:
+                    item = next(pending, None)
+                    if item is None:
+                        return
+                    path, content_hash = item
+                    in_flight[pool.submit(parse_document, path, s, content_hash)] = path
+
+            def parsed_docs() -> Iterator[ParsedDoc]:
+                refill()
+                while in_flight:
+                    done: Set[Future] = wait(in_flight, return_when=FIRST_COMPLETED).done
+                    for fut in done:
+                        path = in_flight.pop(fut)
+                        pbar.update(1)
+                        try:
+                            parsed: ParsedDoc = fut.result()
+                        except Exception as e:
+                            manifest.record_failed(docs_dir, path)
+                            print(f"[ERROR] {path.name}: {repr(e)}")
+                            continue
+                        if parsed.chunks:
+                            yield parsed
+                        else:
+                            # скан без текста / текст короче MIN_CHUNK_CHARS: писать нечего,
+                            # но в манифест — чтобы не парсить заново и не будить --watch
+                            manifest.record_indexed(
+                                docs_dir,
+                                path,
+                                content_hash=parsed.content_hash,
+                                doc_id=parsed.doc_id,
+                                chunks=0,
+                            )
+                    refill()
+
+            def chunk_items() -> Iterator[Tuple[Tuple[int, int], str]]:
+                # чанки всех документов одним потоком: Embedder собирает из них
+                # полные батчи по длине, а не по границам документов
+                for n, parsed in enumerate(parsed_docs()):
+                    waiting[n] = parsed
+                    vectors[n] = [None] * len(parsed.chunks)
+                    remaining[n] = len(parsed.chunks)
+                    for i, c in enumerate(parsed.chunks):
+                        yield (n, i), c.text
+
+            for (n, i), vec in embedder.embed_stream(chunk_items(), buffer_size=s.embed_buffer_chunks):
+                vectors[n][i] = vec
+                remaining[n] -= 1
+                if remaining[n] == 0:
+                    parsed = waiting.pop(n)
+                    writer.put(
+                        EmbeddedDoc(
+                            path=parsed.path,
+                            doc_id=parsed.doc_id,
+                            content_hash=parsed.content_hash,
+                            chunks=parsed.chunks,
+                            vecs=vectors.pop(n),  # type: ignore[arg-type]
+                        )
+                    )
+                    del remaining[n]
+    finally:
+        pbar.close()
+        writer.close()
+        manifest.save()
+        # кэш ответов API сбрасываем, только если индексы реально изменились
+        # (bulk-проход очистил FTS в начале — это тоже изменение)
+        if writer.indexed_docs or full_rebuild:
+            bump_generation(s.ingest_generation_path)
 
     print("\n=== DONE ===")
     print("Files:", len(files))
-    print("Total chunks:", total_chunks)
+    print("Indexed:", len(plan.process))
+    print("Total chunks:", writer.total_chunks)
+    if embedder.cache is not None:
+        print("Embed cache:", embedder.cache.stats())
     print("Export:", export_path.resolve())
-    try:
-        sqlite_conn.close()
-    except Exception:
-        pass
     return export_path
 
 
+def watch_ingest(s: Settings) -> None:
+    """
+    --watch: первый проход как обычно, дальше раз в WATCH_INTERVAL_S
+    сверяем stat файлов с манифестом и запускаем проход только при изменениях.
+    """
+    runtime = IngestRuntime(s)
+    run_ingest(s, runtime=runtime)
+
+    s = replace(s, wipe_collection=False)
+    docs_dir = Path(s.documents_dir)
+    manifest_path = Path(s.exports_dir) / "manifest.json"
+
+    print(f"\n=== WATCH {docs_dir.resolve()} (every {s.watch_interval_s}s, Ctrl+C to stop) ===")
+    try:
+        while True:
+            time.sleep(s.watch_interval_s)
+            files = scan_documents(docs_dir) if docs_dir.exists() else []
+            if IngestManifest(manifest_path).has_changes(docs_dir, files):
+                run_ingest(s, runtime=runtime)
+    except KeyboardInterrupt:
+        print("\nWatch stopped.")
+
+
 def main() -> None:
+    # python -m cli.ingest            — инкрементальный проход
+    # python -m cli.ingest --watch    — проход + слежение за documents/
     load_dotenv()
     s = Settings()
-    run_ingest(s)
+    if "--watch" in sys.argv[1:]:
+        watch_ingest(s)
+    else:
+        run_ingest(s)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
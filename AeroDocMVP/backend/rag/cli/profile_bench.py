@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import sys
+import time
+from dataclasses import replace
+from typing import Dict, List, Tuple
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from config.settings import Settings
+from embed.embeddings import Embedder
+from utils.proxy import disable_proxies_for_localhost
+from utils.qdrant_store import CollectionProfile, QdrantStore
+
+# Профили для сравнения; базовые параметры (HNSW, oversampling, ...) берутся из Settings.
+PROFILES: Dict[str, Dict] = {
+    "float32": dict(quantization="none"),
+    "scalar-int8": dict(quantization="scalar"),
+    "scalar-int8-ondisk": dict(quantization="scalar", on_disk_vectors=True),
+    "binary": dict(quantization="binary"),
+    "product-x16": dict(quantization="product", pq_compression="x16"),
+}
+
+
+def load_points(store: QdrantStore, max_points: int) -> Tuple[List, List[list], List[str]]:
+    ids, vecs, texts = [], [], []
+    offset = None
+    while len(ids) < max_points:
+        points, offset = store.client.scroll(
+            collection_name=store.collection,
+            limit=min(256, max_points - len(ids)),
+            offset=offset,
+            with_payload=["text"],
+            with_vectors=[store.vector_name],
+        )
+        for p in points:
+            ids.append(p.id)
+            vecs.append(p.vector[store.vector_name])  # type: ignore[index]
+            texts.append((p.payload or {}).get("text") or "")
+        if offset is None:
+            break
+    return ids, vecs, texts
+
+
+def wait_green(store: QdrantStore, timeout_s: float = 600.0) -> None:
+    t0 = time.time()
+    while time.time() - t0 < timeout_s:
+        info = store.client.get_collection(store.collection)
+        if info.status == qm.CollectionStatus.GREEN:
+            return
+        time.sleep(1.0)
+
+
+def bench(store: QdrantStore, qvecs: List[list], truth: List[List], k: int) -> Tuple[float, List[float]]:
+    recalls, lat = [], []
+    for qv, gold in zip(qvecs, truth):
+        t = time.perf_counter()
+        hits = store.search(qv, limit=k)
+        lat.append(time.perf_counter() - t)
+        got = {h.id for h in hits}
+        recalls.append(len(got & set(gold)) / max(1, len(gold)))
+    return float(np.mean(recalls)), lat
+
+
+def main():
+    # python -m cli.profile_bench [K] [N_QUERIES] [MAX_POINTS]
+    # Копирует точки рабочей коллекции во временные коллекции с разными профилями
+    # и сравнивает recall@K и латентность с точным поиском (exact=True) по рабочей коллекции.
+    disable_proxies_for_localhost()
+    s = Settings()
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    max_points = int(sys.argv[3]) if len(sys.argv) > 3 else 50_000
+
+    src = QdrantStore.from_settings(s)
+    ids, vecs, texts = load_points(src, max_points)
+    if not ids:
+        print(f"Collection '{s.collection}' is empty")
+        return
+    print(f"Points: {len(ids)} | dim: {len(vecs[0])} | k={k}")
+
+    # запросы — начала реальных чанков (как короткие вопросы по тексту)
+    embedder = Embedder.from_settings(s)
+    rng = np.random.default_rng(0)
+    pick = rng.choice(len(texts), size=min(n_queries, len(texts)), replace=False)
+    queries = [" ".join(texts[i].split()[:16]) for i in pick if texts[i].strip()]
+    qvecs = embedder.embed(queries)
+
+    truth = [[h.id for h in hits] for hits in src.search_batch(qvecs, limit=k, exact=True)]
+
+    base = CollectionProfile.from_settings(s)
+    print(f"{'profile':22s} {'recall@k':>9s} {'p50 ms':>8s} {'p95 ms':>8s} {'build s':>8s}")
+    for name, overrides in PROFILES.items():
+        profile = replace(base, **overrides)
+        store = QdrantStore.from_settings(s)
+        store.collection = f"{s.collection}__bench_{name}"
+        store.profile = profile
+
+        t0 = time.perf_counter()
+        store.recreate_collection(len(vecs[0]))
+        for i in range(0, len(ids), s.upsert_batch_size):
+            store.client.upsert(
+                collection_name=store.collection,
+                points=[
+                    qm.PointStruct(id=pid, vector={store.vector_name: v})
+                    for pid, v in zip(ids[i : i + s.upsert_batch_size], vecs[i : i + s.upsert_batch_size])
+                ],
+            )
+        wait_green(store)
+        build_s = time.perf_counter() - t0
+
+        try:
+            recall, lat = bench(store, qvecs, truth, k)
+            print(
+                f"{name:22s} {recall:9.4f} {np.percentile(lat, 50) * 1000:8.2f} "
+                f"{np.percentile(lat, 95) * 1000:8.2f} {build_s:8.1f}"
+            )
+        finally:
+            store.client.delete_collection(store.collection)
+
+
+if __name__ == "__main__":
+    main()
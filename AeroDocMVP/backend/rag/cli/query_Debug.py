@@ -184,8 +184,7 @@ def main():
     print("Collection:", collection)
     print("Vector name:", vector_name)
 
-    # Embed (ST-only embedder)
-    embedder = Embedder(s.embedding_model)
+    embedder = Embedder.from_settings(s)
     qvec = embedder.embed([q])[0]
     print("Query vector dim:", len(qvec))
 
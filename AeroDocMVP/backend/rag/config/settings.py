@@ -8,14 +8,83 @@ class Settings:
     exports_dir: str = os.getenv("EXPORTS_DIR", "exports")
 
     fts_db_path: str = os.getenv("FTS_DB_PATH", "exports/fts.sqlite3")
+    fts_mmap_size: int = int(os.getenv("FTS_MMAP_SIZE", str(256 * 1024 * 1024)))
+    fts_cache_kib: int = int(os.getenv("FTS_CACHE_KIB", str(64 * 1024)))
+    fts_max_df_ratio: float = float(os.getenv("FTS_MAX_DF_RATIO", "0.5"))
     # qdrant
     qdrant_url: str = os.getenv("QDRANT_URL", "http://localhost:6333")
+    # gRPC (порт 6334) вместо REST: без JSON-сериализации векторов
+    qdrant_prefer_grpc: bool = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+    qdrant_grpc_port: int = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    # таймаут запроса, с; 0 = по умолчанию клиента
+    qdrant_timeout_s: int = int(os.getenv("QDRANT_TIMEOUT_S", "0"))
+    # пул соединений REST; 0 = по умолчанию клиента
+    qdrant_pool_size: int = int(os.getenv("QDRANT_POOL_SIZE", "0"))
+    # профиль коллекции (применяется при создании): none | scalar | binary | product
+    qdrant_quantization: str = os.getenv("QDRANT_QUANTIZATION", "none")
+    qdrant_quantization_always_ram: bool = os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "true").lower() in ("1", "true", "yes")
+    qdrant_pq_compression: str = os.getenv("QDRANT_PQ_COMPRESSION", "x16")
+    qdrant_oversampling: float = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+    qdrant_rescore: bool = os.getenv("QDRANT_RESCORE", "true").lower() in ("1", "true", "yes")
+    # HNSW; 0 = по умолчанию Qdrant (m=16, ef_construct=100); hnsw_ef — при поиске
+    qdrant_hnsw_m: int = int(os.getenv("QDRANT_HNSW_M", "0"))
+    qdrant_hnsw_ef_construct: int = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "0"))
+    qdrant_hnsw_ef: int = int(os.getenv("QDRANT_HNSW_EF", "0"))
+    qdrant_on_disk_vectors: bool = os.getenv("QDRANT_ON_DISK_VECTORS", "false").lower() in ("1", "true", "yes")
+    qdrant_on_disk_payload: bool = os.getenv("QDRANT_ON_DISK_PAYLOAD", "false").lower() in ("1", "true", "yes")
+    # в payload Qdrant только id + поля фильтров; текст финальных хитов — одним запросом из SQLite
+    qdrant_slim_payload: bool = os.getenv("QDRANT_SLIM_PAYLOAD", "false").lower() in ("1", "true", "yes")
     collection: str = os.getenv("QDRANT_COLLECTION", "my_documents")
     vector_name: str = os.getenv("VECTOR_NAME", "dense")
+    # гибридный поиск: local = dense в Qdrant + BM25 в SQLite FTS, слияние RRF в Python;
+    # qdrant = dense + sparse BM25 (sparse_vector_name) в одной коллекции, prefetch + RRF на сервере
+    # (нужна переиндексация с WIPE_COLLECTION=true)
+    hybrid_engine: str = os.getenv("HYBRID_ENGINE", "local")
+    sparse_vector_name: str = os.getenv("SPARSE_VECTOR_NAME", "bm25")
 
     # embeddings
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+    # sentence-transformers | onnx | fastembed — векторы одной модели совместимы между бэкендами
+    embed_backend: str = os.getenv("EMBED_BACKEND", "sentence-transformers")
+    # ONNX-файл в репозитории модели; int8: onnx/model_qint8_avx512_vnni.onnx или EMBED_QUANTIZE=true
+    embed_onnx_file: str = os.getenv("EMBED_ONNX_FILE", "onnx/model.onnx")
+    embed_quantize: bool = os.getenv("EMBED_QUANTIZE", "false").lower() in ("1", "true", "yes")
+    embed_threads: int = int(os.getenv("EMBED_THREADS", "0"))
+    # API: выделенные пулы потоков под эмбеддинг и SQLite (FTS, кэш ответов)
+    embed_workers: int = int(os.getenv("EMBED_WORKERS", "1"))
+    fts_workers: int = int(os.getenv("FTS_WORKERS", "4"))
+    # общий сервер эмбеддингов (cli/embed_server.py): "unix:/path.sock" или "host:port";
+    # задан — воркеры API не грузят модель, а ходят к нему. Пусто = модель в процессе.
+    embed_server: str = os.getenv("EMBED_SERVER", "")
+    embed_server_timeout_s: float = float(os.getenv("EMBED_SERVER_TIMEOUT_S", "30"))
+    # micro-batching запросов эмбеддинга (API и сервер): до max_batch текстов
+    # или max_wait_ms ожидания; EMBED_MAX_BATCH=1 — без батчинга
+    embed_max_batch: int = int(os.getenv("EMBED_MAX_BATCH", "32"))
+    embed_max_wait_ms: float = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+    # rerank: cross-encoder по кандидатам после RRF (API); выключен по умолчанию
+    rerank_enabled: bool = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+    rerank_model: str = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    rerank_candidates: int = int(os.getenv("RERANK_CANDIDATES", "20"))
+    rerank_batch_size: int = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+    rerank_cache_size: int = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+
+    # бюджет контекста промпта в токенах целевой LLM (app/budget.py)
+    # токенайзер: HF repo id или путь к tokenizer.json; пусто = оценка ~3.5 символа/токен
+    prompt_tokenizer: str = os.getenv("PROMPT_TOKENIZER", "")
+    prompt_context_tokens: int = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1536"))
+    # соседних предложений/строк таблицы вокруг каждого отобранного
+    prompt_neighbour_units: int = int(os.getenv("PROMPT_NEIGHBOUR_UNITS", "1"))
+
     encode_batch_size: int = int(os.getenv("ENCODE_BATCH_SIZE", "32"))
+    # бюджет токенов на батч с учётом паддинга; 0 = по свободной памяти
+    encode_max_batch_tokens: int = int(os.getenv("ENCODE_MAX_BATCH_TOKENS", "0"))
+    # сколько чанков (из разных документов) копить перед кодированием в ingest
+    embed_buffer_chunks: int = int(os.getenv("EMBED_BUFFER_CHUNKS", "1024"))
+    # дисковый кэш эмбеддингов для ingest (пусто = выключен)
+    embed_cache_dir: str = os.getenv("EMBED_CACHE_DIR", "exports/embed_cache")
+    embed_cache_max_entries: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+    embed_cache_dtype: str = os.getenv("EMBED_CACHE_DTYPE", "float16")
 
     # chunking
     target_chunk_chars: int = int(os.getenv("CHUNK_CHARS", "1800"))
@@ -24,11 +93,61 @@ class Settings:
 
     # ingest behavior
     upsert_batch_size: int = int(os.getenv("UPSERT_BATCH_SIZE", "128"))
+    fts_batch_size: int = int(os.getenv("FTS_BATCH_SIZE", "500"))
     wipe_collection: bool = os.getenv("WIPE_COLLECTION", "false").lower() in ("1", "true", "yes")
+    ingest_parse_workers: int = int(os.getenv("INGEST_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+    ingest_queue_size: int = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+    watch_interval_s: float = float(os.getenv("WATCH_INTERVAL_S", "5"))
 
     # retries
     qdrant_ready_timeout_s: int = int(os.getenv("QDRANT_READY_TIMEOUT_S", "120"))
     qdrant_retry_count: int = int(os.getenv("QDRANT_RETRY_COUNT", "15"))
     qdrant_retry_sleep_s: float = float(os.getenv("QDRANT_RETRY_SLEEP_S", "2.0"))
 
+    # ollama
+    ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+    ollama_model: str = os.getenv("OLLAMA_MODEL", "llama3:8b")
+    ollama_timeout_s: float = float(os.getenv("OLLAMA_TIMEOUT_S", "120"))
+    ollama_connect_timeout_s: float = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_S", "5"))
+    ollama_max_connections: int = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+    ollama_max_keepalive: int = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "8"))
+    ollama_keepalive_expiry_s: float = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY_S", "60"))
+    ollama_retry_count: int = int(os.getenv("OLLAMA_RETRY_COUNT", "3"))
+    ollama_retry_backoff_s: float = float(os.getenv("OLLAMA_RETRY_BACKOFF_S", "0.5"))
+    # сколько модель держится в памяти после запроса: "-1" = всегда, "30m", "0" = выгружать сразу.
+    # Уходит с каждым запросом — иначе Ollama сбрасывает на свои 5 минут.
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "-1")
+    # одинаковые num_ctx/num_thread во всех запросах: другое значение = перезагрузка модели; 0 = по умолчанию Ollama
+    ollama_num_ctx: int = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+    ollama_num_thread: int = int(os.getenv("OLLAMA_NUM_THREAD", "0"))
+    # модели для загрузки при старте API (через запятую); пусто = только OLLAMA_MODEL
+    ollama_preload_models: str = os.getenv("OLLAMA_PRELOAD_MODELS", "")
+
+    # планировщик LLM (app/llm_scheduler.py): одновременных запросов на модель,
+    # исключения "model=N,model2=M"; очередь и порог ожидания до 429/503 с Retry-After
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+    llm_model_concurrency: str = os.getenv("LLM_MODEL_CONCURRENCY", "")
+    llm_max_queue: int = int(os.getenv("LLM_MAX_QUEUE", "32"))
+    llm_max_queue_wait_s: float = float(os.getenv("LLM_MAX_QUEUE_WAIT_S", "30"))
+    llm_retry_after_s: float = float(os.getenv("LLM_RETRY_AFTER_S", "5"))
+
+    # intent classifier (/classify)
+    intent_min_similarity: float = float(os.getenv("INTENT_MIN_SIMILARITY", "0.35"))
+    intent_min_margin: float = float(os.getenv("INTENT_MIN_MARGIN", "0.05"))
+    intent_cache_size: int = int(os.getenv("INTENT_CACHE_SIZE", "2048"))
+    intent_llm_fallback: bool = os.getenv("INTENT_LLM_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+    # answer cache (rag_service): exact + semantic, сбрасывается при смене поколения корпуса
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    answer_cache_db_path: str = os.getenv("ANSWER_CACHE_DB_PATH", "exports/answer_cache.sqlite3")
+    answer_cache_max_entries: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+    answer_cache_ttl_s: float = float(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+    # косинус для semantic tier; 0 = только exact (по умолчанию). Включать осознанно (например, 0.97)
+    # и проверять на своих вопросах: "взлётная"/"посадочная масса", разные типы ВС дают косинус > 0.95
+    answer_cache_semantic_threshold: float = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0"))
+    # файл с FAQ (вопрос на строку) для прогрева при старте API; пусто = без прогрева
+    answer_cache_faq_path: str = os.getenv("ANSWER_CACHE_FAQ_PATH", "")
+    # счётчик поколений корпуса: run_ingest увеличивает его после изменений в индексах
+    ingest_generation_path: str = os.getenv("INGEST_GENERATION_PATH", "exports/generation")
+
     
\ No newline at end of file
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# Бэкенды Embedder. Все отдают L2-нормированные float32-векторы той же модели,
+# поэтому коллекции, построенные через sentence-transformers, остаются валидными.
+#   sentence-transformers — PyTorch (эталон);
+#   onnx                  — onnxruntime + tokenizers, без torch (быстрый импорт, меньше RAM);
+#   fastembed             — fastembed (тоже ONNX, без torch).
+BACKENDS = ("sentence-transformers", "onnx", "fastembed")
+
+
+def _l2_normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _hub_file(model_name: str, filename: str, *, required: bool = True) -> Optional[Path]:
+    """
+    Файл модели: из локального каталога (model_name — путь) или из кэша HF Hub.
+    """
+    local = Path(model_name)
+    if local.is_dir():
+        p = local / filename
+        if p.exists():
+            return p
+        if required:
+            raise FileNotFoundError(p)
+        return None
+
+    from huggingface_hub import hf_hub_download  # type: ignore
+    from huggingface_hub.utils import EntryNotFoundError  # type: ignore
+
+    try:
+        return Path(hf_hub_download(model_name, filename))
+    except EntryNotFoundError:
+        if required:
+            raise
+        return None
+
+
+def _read_json(path: Optional[Path]) -> dict:
+    if path is None:
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+class _HFTokenizer:
+    """
+    Быстрый токенайзер (tokenizers) из tokenizer.json — тот же, что у sentence-transformers.
+    """
+
+    def __init__(self, model_name: str, max_seq_length: int):
+        from tokenizers import Tokenizer  # type: ignore
+
+        self._tok = Tokenizer.from_file(str(_hub_file(model_name, "tokenizer.json")))
+        self._tok.enable_truncation(max_length=max_seq_length)
+        self._tok.no_padding()
+
+    def lengths(self, texts: List[str]) -> List[int]:
+        return [len(e.ids) for e in self._tok.encode_batch(texts)]
+
+    def batch(self, texts: List[str]):
+        encs = self._tok.encode_batch(texts)
+        width = max(len(e.ids) for e in encs)
+        ids = np.zeros((len(encs), width), dtype=np.int64)
+        mask = np.zeros((len(encs), width), dtype=np.int64)
+        types = np.zeros((len(encs), width), dtype=np.int64)
+        for row, e in enumerate(encs):
+            n = len(e.ids)
+            ids[row, :n] = e.ids
+            mask[row, :n] = e.attention_mask
+            types[row, :n] = e.type_ids
+        # паддинг токеном pad модели (для mean pooling он всё равно маскируется)
+        pad_id = self._tok.token_to_id("<pad>")
+        if pad_id is None:
+            pad_id = self._tok.token_to_id("[PAD]") or 0
+        ids[mask == 0] = pad_id
+        return ids, mask, types
+
+
+# ---------------------------
+# sentence-transformers (PyTorch)
+# ---------------------------
+
+class SentenceTransformerBackend:
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str, *, threads: int = 0, **_):
+        if threads > 0:
+            import torch  # type: ignore
+
+            torch.set_num_threads(threads)
+        from sentence_transformers import SentenceTransformer  # type: ignore
+
+        self._model = SentenceTransformer(model_name)
+        self.max_seq_length = int(getattr(self._model, "max_seq_length", None) or 512)
+        self.cache_tag = model_name
+
+    def token_lengths(self, texts: List[str]) -> Optional[List[int]]:
+        tok = getattr(self._model, "tokenizer", None)
+        if tok is None:
+            return None
+        enc = tok(texts, add_special_tokens=True, truncation=True, max_length=self.max_seq_length)
+        return [len(ids) for ids in enc["input_ids"]]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self._model.encode(
+            texts,
+            batch_size=len(texts),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+    def dim(self) -> int:
+        return int(self._model.get_sentence_embedding_dimension())  # type: ignore
+
+
+# ---------------------------
+# ONNX Runtime
+# ---------------------------
+
+class OnnxBackend:
+    """
+    Та же модель через onnxruntime: токенизация tokenizers, пулинг по 1_Pooling/config.json
+    (как в sentence-transformers), затем L2-нормировка.
+    onnx_file — файл в репозитории модели (onnx/model.onnx, onnx/model_qint8_avx512_vnni.onnx, ...).
+    quantize=True — один раз квантуем fp32-файл в int8 (dynamic, веса QInt8) и кладём рядом.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        onnx_file: str = "onnx/model.onnx",
+        quantize: bool = False,
+        threads: int = 0,
+        **_,
+    ):
+        import onnxruntime as ort  # type: ignore
+
+        st_cfg = _read_json(_hub_file(model_name, "sentence_bert_config.json", required=False))
+        self.max_seq_length = int(st_cfg.get("max_seq_length") or 512)
+        pool_cfg = _read_json(_hub_file(model_name, "1_Pooling/config.json", required=False))
+        if pool_cfg.get("pooling_mode_cls_token"):
+            self.pooling = "cls"
+        elif pool_cfg.get("pooling_mode_max_tokens"):
+            self.pooling = "max"
+        else:
+            self.pooling = "mean"
+
+        model_path = _hub_file(model_name, onnx_file)
+        assert model_path is not None
+        if quantize:
+            model_path = self._quantized(model_path)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(
+            str(model_path), sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self._session.get_inputs()}
+        self._tok = _HFTokenizer(model_name, self.max_seq_length)
+        self._dim: Optional[int] = None
+        self.cache_tag = f"{model_name}#int8" if quantize or "int8" in onnx_file else model_name
+
+    @staticmethod
+    def _quantized(src: Path) -> Path:
+        dst = src.with_name(src.stem + ".int8.onnx")
+        if dst.exists():
+            return dst
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+
+        tmp = dst.with_name(dst.name + ".tmp")
+        quantize_dynamic(str(src), str(tmp), weight_type=QuantType.QInt8)
+        os.replace(tmp, dst)
+        return dst
+
+    def token_lengths(self, texts: List[str]) -> Optional[List[int]]:
+        return self._tok.lengths(texts)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        ids, mask, types = self._tok.batch(texts)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = types
+        hidden = self._session.run(None, feeds)[0]  # [B, T, H]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        elif self.pooling == "max":
+            pooled = np.where(mask[..., None] > 0, hidden, -1e9).max(axis=1)
+        else:
+            m = mask[..., None].astype(np.float32)
+            pooled = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+        return _l2_normalize(pooled)
+
+    def dim(self) -> int:
+        if self._dim is None:
+            self._dim = int(self.encode(["dim"]).shape[1])
+        return self._dim
+
+
+# ---------------------------
+# fastembed
+# ---------------------------
+
+class FastEmbedBackend:
+    """
+    fastembed.TextEmbedding. Модели вне каталога fastembed регистрируются как custom
+    (mean pooling + нормировка, тот же ONNX-файл из репозитория модели).
+    """
+
+    name = "fastembed"
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        onnx_file: str = "onnx/model.onnx",
+        threads: int = 0,
+        **_,
+    ):
+        from fastembed import TextEmbedding  # type: ignore
+
+        supported = {m["model"] for m in TextEmbedding.list_supported_models()}
+        if model_name not in supported:
+            self._register_custom(model_name, onnx_file)
+
+        self._model = TextEmbedding(model_name, threads=threads or None)
+        st_cfg = _read_json(_hub_file(model_name, "sentence_bert_config.json", required=False))
+        self.max_seq_length = int(st_cfg.get("max_seq_length") or 512)
+        self._tok: Optional[_HFTokenizer] = None
+        self._dim: Optional[int] = None
+        self.cache_tag = f"{model_name}#fastembed"
+
+    @staticmethod
+    def _register_custom(model_name: str, onnx_file: str) -> None:
+        from fastembed import TextEmbedding  # type: ignore
+        from fastembed.common.model_description import ModelSource, PoolingType  # type: ignore
+
+        cfg = _read_json(_hub_file(model_name, "config.json"))
+        TextEmbedding.add_custom_model(
+            model=model_name,
+            pooling=PoolingType.MEAN,
+            normalization=True,
+            sources=ModelSource(hf=model_name),
+            dim=int(cfg["hidden_size"]),
+            model_file=onnx_file,
+        )
+
+    def token_lengths(self, texts: List[str]) -> Optional[List[int]]:
+        if self._tok is None:
+            try:
+                self._tok = _HFTokenizer(self._model.model_name, self.max_seq_length)
+            except Exception:
+                return None
+        return self._tok.lengths(texts)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = list(self._model.embed(texts, batch_size=len(texts)))
+        return _l2_normalize(np.stack(vectors))
+
+    def dim(self) -> int:
+        if self._dim is None:
+            self._dim = int(self.encode(["dim"]).shape[1])
+        return self._dim
+
+
+def load_backend(name: str, model_name: str, **kwargs):
+    name = (name or "sentence-transformers").lower()
+    if name in ("sentence-transformers", "st", "torch"):
+        return SentenceTransformerBackend(model_name, **kwargs)
+    if name == "onnx":
+        return OnnxBackend(model_name, **kwargs)
+    if name == "fastembed":
+        return FastEmbedBackend(model_name, **kwargs)
+    raise ValueError(f"Unknown embedding backend: {name!r} (expected one of {BACKENDS})")
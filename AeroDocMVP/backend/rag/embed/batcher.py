@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+
+
+def _safe(texts: List[str]) -> List[str]:
+    # та же фильтрация, что в Embedder.embed: иначе ответы батча не совпадут по позициям
+    return [t for t in texts if t and t.strip()]
+
+
+class BatchingEmbedder:
+    """
+    Динамический micro-batching поверх Embedder (или любого объекта с embed(texts)).
+    Запросы из разных потоков/корутин копятся не дольше max_wait_ms или до max_batch
+    текстов и уходят в модель одним вызовом из выделенного потока; каждый вызывающий
+    получает свой срез. Модель трогает только этот поток.
+    Остальные атрибуты (dim, model_name, token_lengths, ...) — как у обёрнутого.
+    """
+
+    def __init__(self, inner: Any, *, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.inner = inner
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+
+        self._q: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+        self.batches = 0
+        self.requests = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+
+    def submit(self, texts: List[str]) -> "Future[List[list]]":
+        fut: "Future[List[list]]" = Future()
+        safe = _safe(list(texts or []))
+        if not safe:
+            fut.set_result([])
+        else:
+            self._q.put((safe, fut))
+        return fut
+
+    def embed(self, texts: List[str]) -> List[list]:
+        return self.submit(texts).result()
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._thread.join(timeout=5.0)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+
+    def _collect(self, first: Tuple[List[str], Future]) -> Tuple[List[Tuple[List[str], Future]], bool]:
+        # первый запрос уже есть; добираем остальные, пока не истёк max_wait или не набрался батч
+        items = [first]
+        n = len(first[0])
+        deadline = time.perf_counter() + self.max_wait_s
+        while n < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return items, True
+            items.append(item)
+            n += len(item[0])
+        return items, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._q.get()
+            if first is None:
+                return
+            items, stop = self._collect(first)
+
+            texts = [t for batch, _ in items for t in batch]
+            try:
+                vecs = self.inner.embed(texts)
+            except BaseException as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+            else:
+                pos = 0
+                for batch, fut in items:
+                    fut.set_result(vecs[pos : pos + len(batch)])
+                    pos += len(batch)
+            self.batches += 1
+            self.requests += len(items)
+
+            if stop:
+                return
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def text_key(model_name: str, text: str) -> str:
+    """
+    Ключ кэша: модель + нормализованный текст (пробелы схлопнуты — на токенизацию не влияют).
+    """
+    norm = " ".join((text or "").split())
+    return hashlib.sha1(f"{model_name}\x00{norm}".encode("utf-8", errors="ignore")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Дисковый кэш эмбеддингов одной модели:
+    - vectors.bin — memmap-матрица [capacity x dim] (float16 или float32);
+    - index.sqlite3 — key -> slot + last_used (LRU).
+    При заполнении вытесняется evict_fraction самых давно использованных слотов.
+    Потокобезопасен внутри процесса; писать в один каталог из нескольких процессов не нужно.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        *,
+        model_name: str,
+        dim: int,
+        max_entries: int = 200_000,
+        dtype: str = "float16",
+        evict_fraction: float = 0.05,
+    ):
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.capacity = int(max_entries)
+        self.dtype = np.dtype(dtype)
+        self.evict_batch = max(1, int(self.capacity * evict_fraction))
+
+        model_tag = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:12]
+        self.dir = Path(cache_dir) / f"{model_tag}-{self.dim}-{self.dtype.name}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(str(self.dir / "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key       TEXT PRIMARY KEY,
+                slot      INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            );
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY);")
+        self._conn.commit()
+
+        self._vectors = self._open_vectors(self.dir / "vectors.bin")
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _open_vectors(self, vec_path: Path) -> np.memmap:
+        """
+        Ёмкость в каталоге не зашита: число строк берётся из размера vectors.bin.
+        Ёмкость выросла — файл дописывается нулями; уменьшилась — записи со слотами
+        за новой границей удаляются из индекса, файл обрезается.
+        Размер не кратен строке (оборванная запись) — кэш собирается заново.
+        """
+        row_bytes = self.dim * self.dtype.itemsize
+        size = vec_path.stat().st_size if vec_path.exists() else 0
+        if size % row_bytes:
+            with self._conn:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("DELETE FROM free_slots")
+            size = 0
+        rows = size // row_bytes
+
+        if rows > self.capacity:
+            with self._conn:
+                self._conn.execute("DELETE FROM entries WHERE slot >= ?", (self.capacity,))
+                self._conn.execute("DELETE FROM free_slots WHERE slot >= ?", (self.capacity,))
+        if rows != self.capacity or not vec_path.exists():
+            with open(vec_path, "ab") as f:
+                f.truncate(self.capacity * row_bytes)
+        return np.memmap(vec_path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+
+    # ---------------------------
+    # Lookup / store
+    # ---------------------------
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, list]:
+        if not keys:
+            return {}
+        uniq = list(dict.fromkeys(keys))
+        found: Dict[str, list] = {}
+        now = time.time()
+
+        with self._lock:
+            for i in range(0, len(uniq), 500):
+                part = uniq[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, slot in rows:
+                    found[key] = self._vectors[slot].astype(np.float32).tolist()
+            if found:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE entries SET last_used = ? WHERE key = ?",
+                        [(now, k) for k in found],
+                    )
+
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[list]) -> None:
+        items = {k: v for k, v in zip(keys, vectors)}
+        if not items:
+            return
+        now = time.time()
+
+        with self._lock:
+            existing = {
+                k for k in items
+                if self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (k,)).fetchone()
+            }
+            new_keys = [k for k in items if k not in existing][: self.capacity]
+            slots = self._alloc_slots(len(new_keys))
+
+            for k, slot in zip(new_keys, slots):
+                self._vectors[slot] = np.asarray(items[k], dtype=self.dtype)
+            self._vectors.flush()
+
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO entries(key, slot, last_used) VALUES (?, ?, ?)",
+                    [(k, slot, now) for k, slot in zip(new_keys, slots)],
+                )
+
+    def _alloc_slots(self, n: int) -> List[int]:
+        """
+        Слоты матрицы: сначала освобождённые вытеснением, затем незанятый хвост,
+        затем вытесняем пачку LRU-записей (лишние слоты пачки уходят в free_slots).
+        """
+        if n <= 0:
+            return []
+        slots: List[int] = []
+
+        # граница занятого хвоста — до того, как заберём слоты из free_slots
+        row = self._conn.execute(
+            """
+            SELECT max(m) FROM (
+                SELECT max(slot) AS m FROM entries
+                UNION ALL SELECT max(slot) FROM free_slots
+            )
+            """
+        ).fetchone()
+        tail = (int(row[0]) + 1) if row and row[0] is not None else 0
+
+        rows = self._conn.execute("SELECT slot FROM free_slots LIMIT ?", (n,)).fetchall()
+        if rows:
+            slots.extend(int(r[0]) for r in rows)
+            with self._conn:
+                self._conn.executemany("DELETE FROM free_slots WHERE slot = ?", rows)
+
+        while len(slots) < n and tail < self.capacity:
+            slots.append(tail)
+            tail += 1
+
+        need = n - len(slots)
+        if need > 0:
+            rows = self._conn.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used ASC LIMIT ?",
+                (max(need, self.evict_batch),),
+            ).fetchall()
+            freed = [int(slot) for _, slot in rows]
+            with self._conn:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows])
+                self._conn.executemany(
+                    "INSERT INTO free_slots(slot) VALUES (?)", [(sl,) for sl in freed[need:]]
+                )
+            self.evictions += len(rows)
+            slots.extend(freed[:need])
+        return slots
+
+    # ---------------------------
+    # Stats
+    # ---------------------------
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT count(*) FROM entries").fetchone()[0])
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors.flush()
+            self._conn.close()
+
+
+def open_cache(
+    cache_dir: Optional[str],
+    *,
+    model_name: str,
+    dim: int,
+    max_entries: int,
+    dtype: str,
+) -> Optional[EmbeddingCache]:
+    if not cache_dir:
+        return None
+    return EmbeddingCache(cache_dir, model_name=model_name, dim=dim, max_entries=max_entries, dtype=dtype)
@@ -1,36 +1,201 @@
 from __future__ import annotations
-from typing import List, Optional
+import os
+from typing import TYPE_CHECKING, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from embed.cache import EmbeddingCache
+
+
+# Грубая оценка памяти активаций на один токен в батче (base-модель, fp32, CPU).
+_BYTES_PER_TOKEN = 256 * 1024
+_MEMORY_FRACTION = 0.25
+
+
+def _available_memory_bytes() -> Optional[int]:
+    try:
+        return int(os.sysconf("SC_AVPHYS_PAGES")) * int(os.sysconf("SC_PAGE_SIZE"))
+    except (AttributeError, ValueError, OSError):
+        return None
 
 
 class Embedder:
+    """
+    Эмбеддинги с длинными бакетами и дисковым кэшем поверх сменного бэкенда
+    (sentence-transformers / onnx / fastembed, см. embed/backends.py).
+    """
 
-    def __init__(self, model_name: str, *, batch_size: int = 32):
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        backend: str = "sentence-transformers",
+        onnx_file: str = "onnx/model.onnx",
+        quantize: bool = False,
+        threads: int = 0,
+        batch_size: int = 32,
+        max_batch_tokens: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        cache_max_entries: int = 200_000,
+        cache_dtype: str = "float16",
+    ):
         self.model_name = model_name
         self.batch_size = batch_size
 
-        from sentence_transformers import SentenceTransformer  # type: ignore
+        from embed.backends import load_backend
 
-        self._model = SentenceTransformer(model_name)
+        self._backend = load_backend(
+            backend, model_name, onnx_file=onnx_file, quantize=quantize, threads=threads
+        )
+        self.backend_name = self._backend.name
         self._dim_cache: Optional[int] = None
+        self.max_seq_length = int(self._backend.max_seq_length)
+        self.max_batch_tokens = max_batch_tokens or self._auto_batch_tokens()
+
+        self.cache: Optional["EmbeddingCache"] = None
+        if cache_dir:
+            from embed.cache import open_cache
+
+            self.cache = open_cache(
+                cache_dir,
+                model_name=self._backend.cache_tag,
+                dim=self.dim(),
+                max_entries=cache_max_entries,
+                dtype=cache_dtype,
+            )
+
+    @classmethod
+    def from_settings(cls, s, **overrides) -> "Embedder":
+        kwargs = dict(
+            backend=s.embed_backend,
+            onnx_file=s.embed_onnx_file,
+            quantize=s.embed_quantize,
+            threads=s.embed_threads,
+            batch_size=s.encode_batch_size,
+            max_batch_tokens=s.encode_max_batch_tokens or None,
+        )
+        kwargs.update(overrides)
+        return cls(s.embedding_model, **kwargs)
+
+    def _auto_batch_tokens(self) -> int:
+        """
+        Бюджет токенов на батч (с учётом паддинга) от свободной памяти:
+        не меньше batch_size коротких текстов, не больше 4 * batch_size полных.
+        """
+        lo = self.batch_size * 64
+        hi = self.batch_size * self.max_seq_length * 4
+        avail = _available_memory_bytes()
+        if avail is None:
+            return self.batch_size * self.max_seq_length
+        return max(lo, min(hi, int(avail * _MEMORY_FRACTION) // _BYTES_PER_TOKEN))
+
+    # ---------------------------
+    # Length bucketing
+    # ---------------------------
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        lengths = self._backend.token_lengths(texts)
+        if lengths is None:
+            return [min(self.max_seq_length, max(1, len(t) // 4)) for t in texts]
+        return lengths
+
+    def _plan_batches(self, lengths: List[int]) -> List[List[int]]:
+        """
+        Индексы, отсортированные по длине (длинные первыми), режем на батчи так,
+        чтобы len(batch) * max_len(batch) <= max_batch_tokens: короткие тексты
+        идут большими батчами, длинные — маленькими, паддинга почти нет.
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        max_items = max(self.batch_size, self.max_batch_tokens // 16)
+
+        batches: List[List[int]] = []
+        cur: List[int] = []
+        cur_max = 0
+        for i in order:
+            new_max = max(cur_max, lengths[i])
+            if cur and ((len(cur) + 1) * new_max > self.max_batch_tokens or len(cur) >= max_items):
+                batches.append(cur)
+                cur, new_max = [], lengths[i]
+            cur.append(i)
+            cur_max = new_max
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def _encode(self, texts: List[str]) -> List[list]:
+        """
+        Выравнено с texts (пустых быть не должно).
+        С кэшем в модель уходят только промахи (и каждый уникальный текст один раз).
+        """
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode_model(texts)
+
+        from embed.cache import text_key
+
+        keys = [text_key(self.model_name, t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        miss_texts: dict = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in miss_texts:
+                miss_texts[k] = t
+        if miss_texts:
+            miss_keys = list(miss_texts)
+            vectors = self._encode_model([miss_texts[k] for k in miss_keys])
+            self.cache.put_many(miss_keys, vectors)
+            found.update(zip(miss_keys, vectors))
+
+        return [found[k] for k in keys]
+
+    def _encode_model(self, texts: List[str]) -> List[list]:
+        if len(texts) == 1:
+            # запрос из /chat: без токенизации ради планирования батчей
+            return [self._backend.encode(texts)[0].tolist()]
+        out: List[Optional[list]] = [None] * len(texts)
+        for idx in self._plan_batches(self.token_lengths(texts)):
+            vectors = self._backend.encode([texts[i] for i in idx])
+            for i, v in zip(idx, vectors):
+                out[i] = v.tolist()
+        return out  # type: ignore[return-value]
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
 
     def embed(self, texts: List[str]) -> List[list]:
         if not texts:
             return []
-        
+
         safe_texts = [t for t in texts if t and t.strip()]
         if not safe_texts:
             return []
 
-        vectors = self._model.encode( 
-            safe_texts,
-            batch_size=self.batch_size,
-            show_progress_bar=False,
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-        )
-        return [v.tolist() for v in vectors]
+        return self._encode(safe_texts)
+
+    def embed_stream(
+        self,
+        items: Iterable[Tuple[Hashable, str]],
+        *,
+        buffer_size: int = 1024,
+    ) -> Iterator[Tuple[Hashable, list]]:
+        """
+        Поток (key, text) из многих документов -> поток (key, vector).
+        Копим buffer_size текстов, кодируем их вместе (бакеты по длине), отдаём пары.
+        Тексты с пустым содержимым пропускаются.
+        """
+        buf: List[Tuple[Hashable, str]] = []
+        for key, text in items:
+            if not text or not text.strip():
+                continue
+            buf.append((key, text))
+            if len(buf) >= buffer_size:
+                yield from zip((k for k, _ in buf), self._encode([t for _, t in buf]))
+                buf = []
+        if buf:
+            yield from zip((k for k, _ in buf), self._encode([t for _, t in buf]))
 
     def dim(self) -> int:
         if self._dim_cache is None:
-            self._dim_cache = int(self._model.get_sentence_embedding_dimension())  # type: ignore
+            self._dim_cache = int(self._backend.dim())
         return self._dim_cache
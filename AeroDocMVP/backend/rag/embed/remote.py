@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Общий сервер эмбеддингов (cli/embed_server.py): одна модель на хост, воркеры API — клиенты.
+# Адрес: "unix:/run/aerodoc/embed.sock" или "host:port" (TCP — там, где нет Unix-сокетов).
+# Протокол: запрос — строка JSON {"op": "embed", "texts": [...]} | {"op": "info"};
+# ответ — строка JSON {"n": N, "dim": D} и следом N*D float32 (little-endian)
+# для embed, либо строка JSON для info; ошибка — {"error": "..."}.
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"bad embed server address: {address!r} (unix:/path или host:port)")
+    return "tcp", (host, int(port))
+
+
+class RemoteEmbedder:
+    """
+    Клиент общего сервера эмбеддингов с интерфейсом Embedder (embed, dim, model_name).
+    Синхронный, как Embedder: вызывается из embed-пула; у каждого потока своё соединение.
+    Оборванное соединение переоткрывается один раз.
+    """
+
+    def __init__(self, address: str, *, timeout_s: float = 30.0):
+        self.address = address
+        self.timeout_s = timeout_s
+        self._kind, self._target = parse_address(address)
+        self._local = threading.local()
+        self._info: Optional[Dict[str, Any]] = None
+
+    def _connect(self) -> Tuple[socket.socket, Any]:
+        family = socket.AF_UNIX if self._kind == "unix" else socket.AF_INET  # type: ignore[attr-defined]
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout_s)
+        sock.connect(self._target)
+        if self._kind == "tcp":
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, sock.makefile("rb")
+
+    def _conn(self) -> Tuple[socket.socket, Any]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def _call(self, req: Dict[str, Any]) -> Tuple[Dict[str, Any], Any]:
+        data = (json.dumps(req, ensure_ascii=False) + "\n").encode("utf-8")
+        for attempt in (1, 2):
+            try:
+                sock, rfile = self._conn()
+                sock.sendall(data)
+                line = rfile.readline()
+                if not line:
+                    raise ConnectionError("embed server closed connection")
+                head = json.loads(line)
+                if head.get("error"):
+                    raise RuntimeError(f"embed server: {head['error']}")
+                return head, rfile
+            except (ConnectionError, BrokenPipeError, socket.timeout, OSError):
+                self._drop()
+                if attempt == 2:
+                    raise
+        raise RuntimeError("unreachable")
+
+    def info(self) -> Dict[str, Any]:
+        if self._info is None:
+            self._info, _ = self._call({"op": "info"})
+        return self._info
+
+    @property
+    def model_name(self) -> str:
+        return str(self.info()["model_name"])
+
+    def dim(self) -> int:
+        return int(self.info()["dim"])
+
+    def embed(self, texts: List[str]) -> List[list]:
+        safe = [t for t in texts or [] if t and t.strip()]
+        if not safe:
+            return []
+        head, rfile = self._call({"op": "embed", "texts": safe})
+        n, d = int(head["n"]), int(head["dim"])
+        raw = rfile.read(n * d * 4)
+        if len(raw) != n * d * 4:
+            self._drop()
+            raise ConnectionError("embed server: short read")
+        return np.frombuffer(raw, dtype="<f4").reshape(n, d).tolist()
+
+    def close(self) -> None:
+        self._drop()
+
+
+async def serve(address: str, embedder: Any) -> None:
+    """
+    Сервер: каждое соединение — последовательность запросов; embed-запросы всех соединений
+    идут в один BatchingEmbedder (embedder.submit) и считаются общими батчами.
+    """
+    info = {"model_name": embedder.model_name, "dim": embedder.dim()}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                try:
+                    req = json.loads(line)
+                    if req.get("op") == "info":
+                        writer.write((json.dumps(info) + "\n").encode("utf-8"))
+                    else:
+                        vecs = await asyncio.wrap_future(embedder.submit(req.get("texts") or []))
+                        arr = np.asarray(vecs, dtype="<f4").reshape(len(vecs), info["dim"])
+                        head = {"n": arr.shape[0], "dim": info["dim"]}
+                        writer.write((json.dumps(head) + "\n").encode("utf-8") + arr.tobytes())
+                except Exception as e:
+                    writer.write((json.dumps({"error": repr(e)}) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            writer.close()
+
+    kind, target = parse_address(address)
+    if kind == "unix":
+        server = await asyncio.start_unix_server(handle, path=target)
+    else:
+        server = await asyncio.start_server(handle, host=target[0], port=target[1])
+    async with server:
+        await server.serve_forever()
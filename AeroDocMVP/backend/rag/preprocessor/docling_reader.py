@@ -1,12 +1,13 @@
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import hashlib
-from datetime import datetime, timezone
 import json
 
 import fitz  # PyMuPDF
 from docling.document_converter import DocumentConverter
 
+from utils.manifest import file_sha1, path_meta
+
 fitz.TOOLS.mupdf_display_errors(False)
 
 
@@ -42,10 +43,13 @@ def _make_pseudo_page_spans_by_lines(text: str, *, lines_per_page: int = 80) ->
     return spans
 
 
-def read_with_docling(path: Path) -> Dict[str, Any]:
+def read_with_docling(path: Path, *, content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    doc_id = sha1 содержимого файла: touch/копия/переименование не меняют doc_id.
+    content_hash можно передать, если он уже посчитан (манифест ingest).
+    """
     st = path.stat()
-    modified_at = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc).isoformat()
-    doc_id = _sha1(f"{path.resolve()}|{st.st_size}|{st.st_mtime}")
+    doc_id = content_hash or file_sha1(path)
 
     suffix = path.suffix.lower()
     mime_type = {
@@ -58,12 +62,11 @@ def read_with_docling(path: Path) -> Dict[str, Any]:
 
     meta: Dict[str, Any] = {
         "doc_id": doc_id,
-        "file_name": path.name,
-        "file_path": str(path),
+        **path_meta(path),
         "suffix": suffix,
         "mime_type": mime_type,
         "file_size_bytes": int(st.st_size),
-        "modified_at": modified_at,
+        "content_hash": doc_id,
         "loader": "docling",
         "source_type": "pdf" if suffix == ".pdf" else ("docx" if suffix == ".docx" else "file"),
         "ocr_used": "unknown",
@@ -1,9 +1,26 @@
 import json
 from pathlib import Path
-from typing import Any, Dict, Iterable
+from typing import Any, Dict, Iterable, Set
 
 def export_rows_jsonl_append(rows: Iterable[Dict[str, Any]], out_path: Path) -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with out_path.open("a", encoding="utf-8") as f:
         for r in rows:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def export_drop_doc_ids(out_path: Path, doc_ids: Set[str]) -> None:
+    """
+    Переписывает JSONL без строк указанных документов (удалённые/изменённые файлы).
+    """
+    if not doc_ids or not out_path.exists():
+        return
+    tmp = out_path.with_suffix(out_path.suffix + ".tmp")
+    with out_path.open("r", encoding="utf-8") as src, tmp.open("w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            if json.loads(line).get("doc_id") in doc_ids:
+                continue
+            dst.write(line)
+    tmp.replace(out_path)
@@ -0,0 +1,90 @@
+# utils/filters.py
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Поля фильтров есть и в payload Qdrant, и в колонках chunks (SQLite).
+KEYWORD_FIELDS = ("file_name", "doc_id", "source_type")
+DATETIME_FIELDS = ("modified_at",)
+
+
+def normalize_datetime(value: Optional[str], *, end_of_day: bool = False) -> Optional[str]:
+    """
+    ISO-строка -> ISO в UTC (как modified_at в docling_reader), чтобы строки в SQLite
+    сравнивались корректно. Дата без времени допускается: начало дня, а при end_of_day —
+    последняя микросекунда дня (верхняя граница включает весь день). Без зоны считаем UTC.
+    """
+    if not value:
+        return None
+    raw = str(value).strip()
+    try:
+        day = date.fromisoformat(raw)
+    except ValueError:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    else:
+        dt = datetime.combine(day, time.max if end_of_day else time.min)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """
+    Фильтры retrieval: одинаково применяются к dense (query_filter Qdrant)
+    и к BM25 (WHERE по chunks).
+    modified_from / modified_to — границы modified_at включительно (ISO 8601);
+    modified_to без времени покрывает весь этот день.
+    """
+    file_name: Optional[str] = None
+    doc_id: Optional[str] = None
+    source_type: Optional[str] = None
+    modified_from: Optional[str] = None
+    modified_to: Optional[str] = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "modified_from", normalize_datetime(self.modified_from))
+        object.__setattr__(self, "modified_to", normalize_datetime(self.modified_to, end_of_day=True))
+
+    def is_empty(self) -> bool:
+        return not any(asdict(self).values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in asdict(self).items() if v}
+
+    def _keywords(self) -> List[Tuple[str, str]]:
+        return [(f, getattr(self, f)) for f in KEYWORD_FIELDS if getattr(self, f)]
+
+    def to_sql(self, alias: str = "c") -> Tuple[List[str], List[Any]]:
+        where: List[str] = []
+        params: List[Any] = []
+        for field, value in self._keywords():
+            where.append(f"{alias}.{field} = ?")
+            params.append(value)
+        if self.modified_from:
+            where.append(f"{alias}.modified_at >= ?")
+            params.append(self.modified_from)
+        if self.modified_to:
+            where.append(f"{alias}.modified_at <= ?")
+            params.append(self.modified_to)
+        return where, params
+
+    def to_qdrant(self):
+        from qdrant_client.http import models as qm
+
+        must: List[Any] = [
+            qm.FieldCondition(key=field, match=qm.MatchValue(value=value)) for field, value in self._keywords()
+        ]
+        if self.modified_from or self.modified_to:
+            must.append(
+                qm.FieldCondition(
+                    key="modified_at",
+                    range=qm.DatetimeRange(
+                        gte=datetime.fromisoformat(self.modified_from) if self.modified_from else None,
+                        lte=datetime.fromisoformat(self.modified_to) if self.modified_to else None,
+                    ),
+                )
+            )
+        return qm.Filter(must=must) if must else None
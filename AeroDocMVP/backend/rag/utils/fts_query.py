@@ -0,0 +1,232 @@
+# utils/fts_query.py
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Токены так же, как режет unicode61: буквы/цифры, всё остальное — разделители.
+# Слова через дефис ("Ан-2", "ВПП-1") держим вместе и превращаем во фразу.
+_RE_WORD = re.compile(r"[^\W_]+(?:-[^\W_]+)*", re.UNICODE)
+_RE_CYRILLIC = re.compile(r"[а-яё]")
+
+STOPWORDS = frozenset(
+    """
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже
+    для до его ее если есть еще же за здесь и из или им их к как какая какие каким каких какой
+    какое каков когда кто ли либо мне может мы на над надо наш не него нее нет ни них но ну о
+    об однако он она они оно от очень по под при про с со так также такой там те тем то того
+    тоже той только том ты у уже хотя чего чей чем что чтобы чье чья эта эти это я
+    a an and are as at be by for from how in is it of on or that the this to what when where
+    which who why with
+    """.split()
+)
+
+# Окончания в порядке убывания длины: отрезаем самое длинное подходящее.
+_RU_ENDINGS = sorted(
+    """
+    ейшими ейшего ейшему иями ями ами иях ях ием ого его ому ему ими ыми ией ость ости остью
+    ать ять ить ыть еть уть ешь ишь ете ите ет ит ут ют ят ал ил ыл ел ла ло ли на но ны ен
+    ий ый ой ая яя ое ее ые ие ую юю ою ею ов ев ей ам ям ом ем ах им ым их ых
+    а я о е ы и у ю ь й
+    """.split(),
+    key=len,
+    reverse=True,
+)
+_RU_REFLEXIVE = ("ся", "сь")
+_EN_ENDINGS = ("ing", "ed", "es", "s")
+
+MIN_STEM = 4
+
+
+def stem(word: str, *, fold_yo: bool = True) -> str:
+    """
+    Лёгкий суффиксный стеммер (ru/en). Результат используется как префикс FTS5 ("stem"*),
+    поэтому недорезанное окончание не страшно, а пере-резание ограничено MIN_STEM.
+    fold_yo=False — оставить "ё": unicode61 в chunks_fts её не сворачивает.
+    """
+    w = word.lower()
+    if fold_yo:
+        w = w.replace("ё", "е")
+    if _RE_CYRILLIC.search(w):
+        for r in _RU_REFLEXIVE:
+            if w.endswith(r) and len(w) - len(r) >= MIN_STEM:
+                w = w[: -len(r)]
+                break
+        for e in _RU_ENDINGS:
+            if w.endswith(e) and len(w) - len(e) >= MIN_STEM:
+                return w[: -len(e)]
+        return w
+
+    for e in _EN_ENDINGS:
+        if w.endswith(e) and len(w) - len(e) >= MIN_STEM:
+            return w[: -len(e)]
+    return w
+
+
+@dataclass(frozen=True)
+class Term:
+    text: str          # то, что уходит в MATCH (без кавычек), "ё" -> "е"
+    prefix: bool       # "text"* или "text"
+    phrase: bool = False
+    alt: str = ""      # написание с "ё", если оно было в вопросе: ищем оба
+
+    def spellings(self) -> List[str]:
+        return [self.text, self.alt] if self.alt else [self.text]
+
+    def _quote(self, text: str) -> str:
+        quoted = '"' + text.replace('"', '""') + '"'
+        return quoted + "*" if self.prefix else quoted
+
+    def to_match(self) -> str:
+        if self.alt:
+            return "(" + " OR ".join(self._quote(t) for t in self.spellings()) + ")"
+        return self._quote(self.text)
+
+
+def tokenize_query(question: str) -> List[Term]:
+    """
+    Вопрос -> термы для FTS5. Никакого синтаксиса FTS5 от пользователя не пропускаем:
+    кавычки, двоеточия, скобки и т.п. просто разделители.
+    """
+    terms: List[Term] = []
+    seen = set()
+
+    for m in _RE_WORD.finditer(question or ""):
+        yo = m.group(0).lower()
+        raw = yo.replace("ё", "е")
+        # chunks_fts (unicode61) хранит "ё" как есть: "взлёт" и "взлет" — разные термы,
+        # поэтому при "ё" в вопросе ищем оба написания
+        if "-" in raw:
+            parts = [p for p in raw.split("-") if p]
+            alt = " ".join(p for p in yo.split("-") if p) if yo != raw else ""
+            t = Term(text=" ".join(parts), prefix=False, phrase=True, alt=alt)
+        elif raw in STOPWORDS:
+            continue
+        elif raw.isdigit() or len(raw) < MIN_STEM:
+            if len(raw) < 2 and not raw.isdigit():
+                continue
+            t = Term(text=raw, prefix=False, alt=yo if yo != raw else "")
+        else:
+            t = Term(text=stem(raw), prefix=True, alt=stem(yo, fold_yo=False) if yo != raw else "")
+
+        if t.text and t not in seen:
+            seen.add(t)
+            terms.append(t)
+
+    return terms
+
+
+# ---------------------------
+# Document frequency (fts5vocab)
+# ---------------------------
+
+def doc_count(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT count(*) FROM chunks").fetchone()
+    return int(row[0]) if row else 0
+
+
+def term_df(conn: sqlite3.Connection, term: Term) -> int:
+    """
+    Точный df терма (число чанков).
+    Одно слово без вариантов — из chunks_vocab (fts5vocab 'row'): индексный lookup.
+    Префикс, фраза с "ё"-вариантом и т.п. — count(*) по MATCH: сумма doc по диапазону
+    vocab считала бы чанк с несколькими словоформами несколько раз. Результат кэшируется
+    по (файл БД, число чанков, выражение).
+    """
+    if not term.prefix and not term.alt:
+        if term.phrase:
+            # df фразы <= min df слов — для прунинга верхней оценки достаточно
+            dfs = [_df_exact(conn, w) for w in term.text.split()]
+            return min(dfs) if dfs else 0
+        return _df_exact(conn, term.text)
+    return _df_match(conn, term.to_match())
+
+
+_DF_CACHE_SIZE = 4096
+_df_cache: "OrderedDict[Tuple[str, int, str], int]" = OrderedDict()
+_df_lock = threading.Lock()
+
+
+def _df_match(conn: sqlite3.Connection, match: str) -> int:
+    # ключ: файл БД + число чанков (меняется при ingest) + выражение
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2] or f"memory:{id(conn)}"
+    key = (db_file, doc_count(conn), match)
+    with _df_lock:
+        if key in _df_cache:
+            _df_cache.move_to_end(key)
+            return _df_cache[key]
+
+    row = conn.execute("SELECT count(*) FROM chunks_fts WHERE chunks_fts MATCH ?", (match,)).fetchone()
+    df = int(row[0]) if row else 0
+
+    with _df_lock:
+        _df_cache[key] = df
+        while len(_df_cache) > _DF_CACHE_SIZE:
+            _df_cache.popitem(last=False)
+    return df
+
+
+def _df_exact(conn: sqlite3.Connection, word: str) -> int:
+    row = conn.execute("SELECT doc FROM chunks_vocab WHERE term = ?", (word,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+# ---------------------------
+# Compile
+# ---------------------------
+
+def compile_fts_query(
+    conn: Optional[sqlite3.Connection],
+    question: str,
+    *,
+    max_df_ratio: float = 0.5,
+    min_terms: int = 1,
+) -> Optional[str]:
+    """
+    Вопрос -> безопасное FTS5-выражение вида  "двигател"* OR "ан 2" OR ...
+    - термы, которых нет в индексе, выкидываем (не влияют на результат);
+    - термы с df/N > max_df_ratio выкидываем (огромные постинги, почти нулевой IDF),
+      но оставляем хотя бы min_terms самых редких.
+    conn=None -> без df-прунинга.
+    Возвращает None, если искать нечего.
+    """
+    terms = tokenize_query(question)
+    if not terms:
+        return None
+
+    if conn is not None and max_df_ratio < 1.0:
+        terms = prune_terms(conn, terms, max_df_ratio=max_df_ratio, min_terms=min_terms)
+        if not terms:
+            return None
+
+    return " OR ".join(t.to_match() for t in terms)
+
+
+def prune_terms(
+    conn: sqlite3.Connection,
+    terms: Sequence[Term],
+    *,
+    max_df_ratio: float,
+    min_terms: int = 1,
+) -> List[Term]:
+    try:
+        n = doc_count(conn)
+        dfs: Dict[Term, int] = {t: term_df(conn, t) for t in terms}
+    except sqlite3.OperationalError:
+        # старая БД без chunks_vocab — работаем без прунинга
+        return list(terms)
+
+    if n <= 0:
+        return list(terms)
+
+    dfs = {t: min(df, n) for t, df in dfs.items()}
+    present = [t for t in terms if dfs[t] > 0]
+    kept = [t for t in present if dfs[t] / n <= max_df_ratio]
+    if len(kept) < min_terms:
+        rare = sorted(present, key=lambda t: dfs[t])
+        kept = [t for t in present if t in set(kept) | set(rare[:min_terms])]
+    return kept
@@ -0,0 +1,26 @@
+# utils/generation.py
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+
+def read_generation(path: str | Path) -> int:
+    """
+    Поколение корпуса: растёт при каждом ingest, который что-то поменял в индексах.
+    Нет файла -> 0.
+    """
+    try:
+        return int(Path(path).read_text(encoding="utf-8").strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_generation(path: str | Path) -> int:
+    p = Path(path)
+    gen = read_generation(p) + 1
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(str(gen), encoding="utf-8")
+    os.replace(tmp, p)
+    return gen
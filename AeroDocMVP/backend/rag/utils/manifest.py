@@ -0,0 +1,234 @@
+# utils/manifest.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+
+def file_sha1(path: Path, *, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def path_meta(path: Path) -> Dict[str, Any]:
+    # поля чанков, которые зависят от пути, а не от содержимого (фильтры file_name/modified_*)
+    st = path.stat()
+    return {
+        "file_name": path.name,
+        "file_path": str(path),
+        "modified_at": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc).isoformat(),
+    }
+
+
+@dataclass
+class IngestPlan:
+    process: List[Tuple[Path, str]] = field(default_factory=list)  # (path, content_hash) — парсим и индексируем
+    purge: List[str] = field(default_factory=list)                  # doc_id, которых больше нет на диске
+    relink: List[Tuple[str, Path]] = field(default_factory=list)  # (content_hash, path) — мета чанков -> path
+    linked: int = 0      # новый путь к уже проиндексированному содержимому (копия/переименование)
+    unchanged: int = 0
+
+
+class IngestManifest:
+    """
+    Персистентный манифест ingest (exports/manifest.json).
+
+    docs:  content_hash -> {"doc_id", "file_name", "file_path", "chunks"} — что лежит в Qdrant/FTS
+           (file_path — rel_path файла, чьи file_name/modified_at записаны в чанках)
+    files: rel_path     -> {"hash", "size", "mtime"}           — что лежит на диске
+    failed: rel_path    -> {"size", "mtime"}                   — упавшие файлы (для --watch)
+
+    doc_id = content_hash, поэтому touch/копия не вызывают переиндексацию,
+    а документ удаляется из индексов, когда на него не ссылается ни один файл.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.failed: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        if data.get("version") != self.VERSION:
+            return
+        self.docs = data.get("docs") or {}
+        self.files = data.get("files") or {}
+        self.failed = data.get("failed") or {}
+
+    def save(self) -> None:
+        with self._lock:
+            data = {
+                "version": self.VERSION,
+                "docs": self.docs,
+                "files": self.files,
+                "failed": self.failed,
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.docs.clear()
+            self.files.clear()
+            self.failed.clear()
+
+    # ---------------------------
+    # Planning
+    # ---------------------------
+
+    @staticmethod
+    def rel_key(docs_dir: Path, path: Path) -> str:
+        return path.relative_to(docs_dir).as_posix()
+
+    @staticmethod
+    def _stat_sig(path: Path) -> Dict[str, Any]:
+        st = path.stat()
+        return {"size": int(st.st_size), "mtime": float(st.st_mtime)}
+
+    def has_changes(self, docs_dir: Path, files: Sequence[Path]) -> bool:
+        """
+        Дешёвая проверка только по stat (для --watch): новые/изменённые/удалённые файлы.
+        Упавшие файлы с тем же stat изменениями не считаются.
+        """
+        seen: Set[str] = set()
+        for p in files:
+            key = self.rel_key(docs_dir, p)
+            seen.add(key)
+            sig = self._stat_sig(p)
+            entry = self.files.get(key)
+            if entry and entry["size"] == sig["size"] and entry["mtime"] == sig["mtime"]:
+                continue
+            if self.failed.get(key) == sig:
+                continue
+            return True
+        return any(k not in seen for k in self.files)
+
+    def plan(self, docs_dir: Path, files: Sequence[Path]) -> IngestPlan:
+        """
+        Сравнивает диск с манифестом. Хэш считается только для файлов с изменённым stat.
+        Ссылки на уже проиндексированное содержимое (копии, touch) обновляются сразу;
+        новое содержимое попадает в plan.process и записывается в манифест после индексации.
+        Если файл, чья мета записана в чанках документа, больше на него не ссылается
+        (переименование, правка или удаление оригинала копии), документ попадает в plan.relink
+        с одним из оставшихся путей.
+        """
+        plan = IngestPlan()
+        new_files: Dict[str, Dict[str, Any]] = {}
+        pending_hashes: Set[str] = set()
+
+        for p in files:
+            key = self.rel_key(docs_dir, p)
+            sig = self._stat_sig(p)
+            entry = self.files.get(key)
+
+            if (
+                entry
+                and entry["size"] == sig["size"]
+                and entry["mtime"] == sig["mtime"]
+                and entry["hash"] in self.docs
+            ):
+                new_files[key] = entry
+                plan.unchanged += 1
+                continue
+
+            h = file_sha1(p)
+            if h in self.docs:
+                new_files[key] = {"hash": h, **sig}
+                if entry and entry["hash"] == h:
+                    plan.unchanged += 1
+                else:
+                    plan.linked += 1
+                continue
+
+            if h not in pending_hashes:
+                pending_hashes.add(h)
+                plan.process.append((p, h))
+
+        referenced: Dict[str, List[str]] = {}
+        for key, e in new_files.items():
+            referenced.setdefault(e["hash"], []).append(key)
+        for h, d in self.docs.items():
+            keys = referenced.get(h)
+            if not keys:
+                plan.purge.append(d["doc_id"])
+            elif d.get("file_path") not in keys:
+                plan.relink.append((h, docs_dir / keys[0]))
+
+        with self._lock:
+            self.files = new_files
+            self.failed = {k: v for k, v in self.failed.items() if (docs_dir / k).exists()}
+        return plan
+
+    # ---------------------------
+    # Updates after indexing
+    # ---------------------------
+
+    def doc_ids(self) -> Set[str]:
+        with self._lock:
+            return {d["doc_id"] for d in self.docs.values()}
+
+    def forget_doc(self, doc_id: str) -> None:
+        with self._lock:
+            for h in [h for h, d in self.docs.items() if d["doc_id"] == doc_id]:
+                del self.docs[h]
+
+    def record_indexed(
+        self,
+        docs_dir: Path,
+        path: Path,
+        *,
+        content_hash: str,
+        doc_id: str,
+        chunks: int,
+    ) -> None:
+        key = self.rel_key(docs_dir, path)
+        sig = self._stat_sig(path)
+        with self._lock:
+            self.docs[content_hash] = {
+                "doc_id": doc_id,
+                "file_name": path.name,
+                "file_path": key,
+                "chunks": int(chunks),
+            }
+            self.files[key] = {"hash": content_hash, **sig}
+            self.failed.pop(key, None)
+
+    def record_relinked(self, docs_dir: Path, path: Path, *, content_hash: str) -> None:
+        with self._lock:
+            d = self.docs[content_hash]
+            d["file_name"] = path.name
+            d["file_path"] = self.rel_key(docs_dir, path)
+
+    def record_failed(self, docs_dir: Path, path: Path) -> None:
+        key = self.rel_key(docs_dir, path)
+        try:
+            sig = self._stat_sig(path)
+        except OSError:
+            return
+        with self._lock:
+            self.failed[key] = sig
@@ -1,14 +1,100 @@
 # qdrant_store.py
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Sequence, Union
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models as qm
 
+from utils.filters import DATETIME_FIELDS, KEYWORD_FIELDS
+
 
 PointDict = Dict[str, Any]
 
+QUANTIZATIONS = ("none", "scalar", "binary", "product")
+
+# slim_payload: в Qdrant только поля для фильтров/удаления и ссылки на чанк,
+# текст и прочая мета живут в SQLite (chunks) и подтягиваются по id после fusion.
+SLIM_PAYLOAD_FIELDS = frozenset(
+    KEYWORD_FIELDS + DATETIME_FIELDS + ("file_path", "chunk_id", "chunk_index", "vector_name")
+)
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    Как хранить и искать векторы коллекции.
+    quantization: none | scalar (int8) | binary | product; сжатые векторы в RAM (always_ram),
+    оригиналы — на диске при on_disk_vectors; rescore + oversampling добирают точность по оригиналам.
+    hnsw_m / hnsw_ef_construct / hnsw_ef: 0 = по умолчанию Qdrant.
+    """
+    quantization: str = "none"
+    always_ram: bool = True
+    pq_compression: str = "x16"
+    oversampling: float = 2.0
+    rescore: bool = True
+    hnsw_m: int = 0
+    hnsw_ef_construct: int = 0
+    hnsw_ef: int = 0
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+
+    @classmethod
+    def from_settings(cls, s) -> "CollectionProfile":
+        return cls(
+            quantization=s.qdrant_quantization,
+            always_ram=s.qdrant_quantization_always_ram,
+            pq_compression=s.qdrant_pq_compression,
+            oversampling=s.qdrant_oversampling,
+            rescore=s.qdrant_rescore,
+            hnsw_m=s.qdrant_hnsw_m,
+            hnsw_ef_construct=s.qdrant_hnsw_ef_construct,
+            hnsw_ef=s.qdrant_hnsw_ef,
+            on_disk_vectors=s.qdrant_on_disk_vectors,
+            on_disk_payload=s.qdrant_on_disk_payload,
+        )
+
+    def vector_params(self, vector_size: int) -> qm.VectorParams:
+        hnsw = None
+        if self.hnsw_m or self.hnsw_ef_construct:
+            hnsw = qm.HnswConfigDiff(m=self.hnsw_m or None, ef_construct=self.hnsw_ef_construct or None)
+        return qm.VectorParams(
+            size=vector_size,
+            distance=qm.Distance.COSINE,
+            on_disk=self.on_disk_vectors or None,
+            hnsw_config=hnsw,
+        )
+
+    def quantization_config(self) -> Optional[qm.QuantizationConfig]:
+        q = (self.quantization or "none").lower()
+        if q == "none":
+            return None
+        if q == "scalar":
+            return qm.ScalarQuantization(
+                scalar=qm.ScalarQuantizationConfig(type=qm.ScalarType.INT8, quantile=0.99, always_ram=self.always_ram)
+            )
+        if q == "binary":
+            return qm.BinaryQuantization(binary=qm.BinaryQuantizationConfig(always_ram=self.always_ram))
+        if q == "product":
+            return qm.ProductQuantization(
+                product=qm.ProductQuantizationConfig(
+                    compression=qm.CompressionRatio(self.pq_compression.lower()),
+                    always_ram=self.always_ram,
+                )
+            )
+        raise ValueError(f"Unknown quantization: {self.quantization!r} (expected one of {QUANTIZATIONS})")
+
+    def search_params(self, *, exact: bool = False) -> Optional[qm.SearchParams]:
+        if exact:
+            return qm.SearchParams(exact=True, quantization=qm.QuantizationSearchParams(ignore=True))
+        quant = None
+        if (self.quantization or "none").lower() != "none":
+            quant = qm.QuantizationSearchParams(ignore=False, rescore=self.rescore, oversampling=self.oversampling)
+        if quant is None and not self.hnsw_ef:
+            return None
+        return qm.SearchParams(hnsw_ef=self.hnsw_ef or None, quantization=quant)
+
 
 class QdrantStore:
     """
@@ -26,11 +112,55 @@ class QdrantStore:
         vector_name: str = "dense",
         *,
         timeout: Optional[float] = None,
+        prefer_grpc: bool = False,
+        grpc_port: int = 6334,
+        pool_size: Optional[int] = None,
+        profile: Optional[CollectionProfile] = None,
+        slim_payload: bool = False,
+        sparse_vector_name: Optional[str] = None,
     ):
+        """
+        prefer_grpc: векторы идут бинарным protobuf вместо JSON (порт grpc_port, по умолчанию 6334).
+        pool_size: размер пула keep-alive соединений REST (None — по умолчанию httpx).
+        slim_payload: при upsert в payload остаются только SLIM_PAYLOAD_FIELDS.
+        sparse_vector_name: разреженный BM25-вектор рядом с dense (гибрид на стороне Qdrant).
+        """
+        kwargs: Dict[str, Any] = {}
+        if pool_size:
+            import httpx
+
+            kwargs["limits"] = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
         # check_compatibility=False -> меньше сюрпризов по версиям клиента/сервера
-        self.client = QdrantClient(url=url, timeout=timeout, check_compatibility=False)
+        self._client_kwargs: Dict[str, Any] = dict(
+            url=url,
+            timeout=int(timeout) if timeout else None,
+            prefer_grpc=prefer_grpc,
+            grpc_port=grpc_port,
+            check_compatibility=False,
+            **kwargs,
+        )
+        self.client = QdrantClient(**self._client_kwargs)
+        self._aclient: Optional[AsyncQdrantClient] = None
         self.collection = collection
         self.vector_name = vector_name
+        self.profile = profile or CollectionProfile()
+        self.slim_payload = slim_payload
+        self.sparse_vector_name = sparse_vector_name
+
+    @classmethod
+    def from_settings(cls, s) -> "QdrantStore":
+        return cls(
+            url=s.qdrant_url,
+            collection=s.collection,
+            vector_name=s.vector_name,
+            timeout=s.qdrant_timeout_s or None,
+            prefer_grpc=s.qdrant_prefer_grpc,
+            grpc_port=s.qdrant_grpc_port,
+            pool_size=s.qdrant_pool_size or None,
+            profile=CollectionProfile.from_settings(s),
+            slim_payload=s.qdrant_slim_payload,
+            sparse_vector_name=s.sparse_vector_name if s.hybrid_engine == "qdrant" else None,
+        )
 
     # ---------------------------
     # Collection management
@@ -38,30 +168,62 @@ class QdrantStore:
 
     def ensure_collection(self, vector_size: int) -> None:
         cols = self.client.get_collections().collections
-        if any(c.name == self.collection for c in cols):
-            return
-
-        self.client.create_collection(
-            collection_name=self.collection,
-            vectors_config={
-                self.vector_name: qm.VectorParams(
-                    size=vector_size,
-                    distance=qm.Distance.COSINE,
+        if not any(c.name == self.collection for c in cols):
+            self._create_collection(vector_size, recreate=False)
+        elif self.sparse_vector_name:
+            info = self.client.get_collection(self.collection)
+            if self.sparse_vector_name not in (info.config.params.sparse_vectors or {}):
+                print(
+                    f"⚠️ collection '{self.collection}' has no sparse vector '{self.sparse_vector_name}': "
+                    "hybrid_engine=qdrant needs a rebuild (WIPE_COLLECTION=true)"
                 )
-            },
-        )
+        self.ensure_payload_indexes()
 
     def recreate_collection(self, vector_size: int) -> None:
-        self.client.recreate_collection(
+        self._create_collection(vector_size, recreate=True)
+        self.ensure_payload_indexes()
+
+    def ensure_payload_indexes(self) -> None:
+        """
+        Индексы payload под фильтры (utils/filters.py): с ними фильтрованный HNSW-поиск
+        не скатывается в перебор. Уже существующие индексы не трогаем.
+        """
+        info = self.client.get_collection(self.collection)
+        existing = set((info.payload_schema or {}).keys())
+        wanted = [(f, qm.PayloadSchemaType.KEYWORD) for f in KEYWORD_FIELDS]
+        wanted += [(f, qm.PayloadSchemaType.DATETIME) for f in DATETIME_FIELDS]
+        for field, schema in wanted:
+            if field in existing:
+                continue
+            self.client.create_payload_index(
+                collection_name=self.collection,
+                field_name=field,
+                field_schema=schema,
+                wait=True,
+            )
+
+    def _create_collection(self, vector_size: int, *, recreate: bool) -> None:
+        p = self.profile
+        create = self.client.recreate_collection if recreate else self.client.create_collection
+        create(
             collection_name=self.collection,
-            vectors_config={
-                self.vector_name: qm.VectorParams(
-                    size=vector_size,
-                    distance=qm.Distance.COSINE,
-                )
-            },
+            vectors_config={self.vector_name: p.vector_params(vector_size)},
+            sparse_vectors_config=self._sparse_config(),
+            quantization_config=p.quantization_config(),
+            on_disk_payload=p.on_disk_payload or None,
         )
 
+    def _sparse_config(self) -> Optional[Dict[str, qm.SparseVectorParams]]:
+        if not self.sparse_vector_name:
+            return None
+        # IDF считает сервер по коллекции: в точках хранится только насыщенный TF (utils/sparse.py)
+        return {
+            self.sparse_vector_name: qm.SparseVectorParams(
+                index=qm.SparseIndexParams(on_disk=self.profile.on_disk_vectors or None),
+                modifier=qm.Modifier.IDF,
+            )
+        }
+
     # ---------------------------
     # Payload contract helpers
     # ---------------------------
@@ -94,6 +256,8 @@ class QdrantStore:
         out.setdefault("chunk_id", str(point_id))
         out.setdefault("vector_name", self.vector_name)
 
+        if self.slim_payload:
+            out = {k: v for k, v in out.items() if k in SLIM_PAYLOAD_FIELDS}
         return out
 
     def _normalize_point(self, p: PointDict) -> PointDict:
@@ -122,7 +286,10 @@ class QdrantStore:
             meta=meta if isinstance(meta, dict) else None,
         )
 
-        return {"id": pid, "vector": list(vec), "payload": norm_payload}
+        out = {"id": pid, "vector": list(vec), "payload": norm_payload}
+        if p.get("sparse") is not None:
+            out["sparse"] = p["sparse"]  # (indices, values)
+        return out
 
     # ---------------------------
     # Upsert
@@ -151,13 +318,20 @@ class QdrantStore:
                 points=[
                     qm.PointStruct(
                         id=p["id"],
-                        vector={self.vector_name: p["vector"]},
+                        vector=self._point_vectors(p),
                         payload=p["payload"],
                     )
                     for p in batch
                 ],
             )
 
+    def _point_vectors(self, p: PointDict) -> Dict[str, Any]:
+        vectors: Dict[str, Any] = {self.vector_name: p["vector"]}
+        if self.sparse_vector_name and p.get("sparse"):
+            indices, values = p["sparse"]
+            vectors[self.sparse_vector_name] = qm.SparseVector(indices=list(indices), values=list(values))
+        return vectors
+
     # ---------------------------
     # Search / Filters
     # ---------------------------
@@ -185,23 +359,231 @@ class QdrantStore:
         limit: int = 5,
         query_filter: Optional[qm.Filter] = None,
         score_threshold: Optional[float] = None,
+        exact: bool = False,
+        with_payload: Union[bool, Sequence[str]] = True,
     ) -> List[qm.ScoredPoint]:
         """
         Возвращает список ScoredPoint (payload внутри).
         score_threshold: если задан — отсекаем слабые совпадения.
+        exact=True — полный перебор без HNSW и квантизации (эталон для оценки recall).
+        with_payload=False — только id и score (текст потом берётся из SQLite).
         """
         res = self.client.query_points(
+            **self._search_kwargs(
+                query_vector,
+                limit=limit,
+                query_filter=query_filter,
+                score_threshold=score_threshold,
+                exact=exact,
+                with_payload=with_payload,
+            )
+        )
+        return list(res.points)
+
+    def _search_kwargs(
+        self,
+        query_vector: List[float],
+        *,
+        limit: int,
+        query_filter: Optional[qm.Filter],
+        score_threshold: Optional[float],
+        exact: bool,
+        with_payload: Union[bool, Sequence[str]],
+    ) -> Dict[str, Any]:
+        return dict(
             collection_name=self.collection,
             query=query_vector,
             using=self.vector_name,
             limit=limit,
-            with_payload=True,
+            with_payload=with_payload if isinstance(with_payload, bool) else list(with_payload),
             with_vectors=False,
             query_filter=query_filter,
             score_threshold=score_threshold,
+            search_params=self.profile.search_params(exact=exact),
+        )
+
+    def search_hybrid(
+        self,
+        dense_vector: List[float],
+        sparse_vector: Tuple[List[int], List[float]],
+        *,
+        limit: int = 5,
+        prefetch_dense: int = 30,
+        prefetch_sparse: int = 30,
+        query_filter: Optional[qm.Filter] = None,
+        score_threshold: Optional[float] = None,
+        with_payload: Union[bool, Sequence[str]] = True,
+    ) -> List[qm.ScoredPoint]:
+        """
+        Гибрид одним запросом: prefetch dense + prefetch sparse (BM25), слияние RRF на сервере.
+        score_threshold отсекает только dense-кандидатов (у RRF своя шкала).
+        """
+        res = self.client.query_points(
+            **self._hybrid_kwargs(
+                dense_vector,
+                sparse_vector,
+                limit=limit,
+                prefetch_dense=prefetch_dense,
+                prefetch_sparse=prefetch_sparse,
+                query_filter=query_filter,
+                score_threshold=score_threshold,
+                with_payload=with_payload,
+            )
+        )
+        return list(res.points)
+
+    def _hybrid_kwargs(
+        self,
+        dense_vector: List[float],
+        sparse_vector: Tuple[List[int], List[float]],
+        *,
+        limit: int,
+        prefetch_dense: int,
+        prefetch_sparse: int,
+        query_filter: Optional[qm.Filter],
+        score_threshold: Optional[float],
+        with_payload: Union[bool, Sequence[str]],
+    ) -> Dict[str, Any]:
+        if not self.sparse_vector_name:
+            raise RuntimeError("search_hybrid requires sparse_vector_name (hybrid_engine=qdrant)")
+
+        prefetch = [
+            qm.Prefetch(
+                query=dense_vector,
+                using=self.vector_name,
+                limit=prefetch_dense,
+                filter=query_filter,
+                score_threshold=score_threshold,
+                params=self.profile.search_params(),
+            )
+        ]
+        indices, values = sparse_vector
+        if indices:
+            prefetch.append(
+                qm.Prefetch(
+                    query=qm.SparseVector(indices=list(indices), values=list(values)),
+                    using=self.sparse_vector_name,
+                    limit=prefetch_sparse,
+                    filter=query_filter,
+                )
+            )
+        return dict(
+            collection_name=self.collection,
+            prefetch=prefetch,
+            query=qm.FusionQuery(fusion=qm.Fusion.RRF),
+            limit=limit,
+            with_payload=with_payload if isinstance(with_payload, bool) else list(with_payload),
+            with_vectors=False,
+        )
+
+    # ---------------------------
+    # Async (AsyncQdrantClient) — для API: поиск не занимает поток
+    # ---------------------------
+
+    @property
+    def aclient(self) -> AsyncQdrantClient:
+        # создаётся лениво: привязан к event loop, в котором впервые используется
+        if self._aclient is None:
+            self._aclient = AsyncQdrantClient(**self._client_kwargs)
+        return self._aclient
+
+    async def asearch(
+        self,
+        query_vector: List[float],
+        *,
+        limit: int = 5,
+        query_filter: Optional[qm.Filter] = None,
+        score_threshold: Optional[float] = None,
+        exact: bool = False,
+        with_payload: Union[bool, Sequence[str]] = True,
+    ) -> List[qm.ScoredPoint]:
+        res = await self.aclient.query_points(
+            **self._search_kwargs(
+                query_vector,
+                limit=limit,
+                query_filter=query_filter,
+                score_threshold=score_threshold,
+                exact=exact,
+                with_payload=with_payload,
+            )
         )
         return list(res.points)
 
+    async def asearch_hybrid(
+        self,
+        dense_vector: List[float],
+        sparse_vector: Tuple[List[int], List[float]],
+        *,
+        limit: int = 5,
+        prefetch_dense: int = 30,
+        prefetch_sparse: int = 30,
+        query_filter: Optional[qm.Filter] = None,
+        score_threshold: Optional[float] = None,
+        with_payload: Union[bool, Sequence[str]] = True,
+    ) -> List[qm.ScoredPoint]:
+        res = await self.aclient.query_points(
+            **self._hybrid_kwargs(
+                dense_vector,
+                sparse_vector,
+                limit=limit,
+                prefetch_dense=prefetch_dense,
+                prefetch_sparse=prefetch_sparse,
+                query_filter=query_filter,
+                score_threshold=score_threshold,
+                with_payload=with_payload,
+            )
+        )
+        return list(res.points)
+
+    async def awarmup(self) -> int:
+        """Соединение (HTTP/gRPC) и коллекция — до первого поиска; возвращает число точек."""
+        info = await self.aclient.get_collection(self.collection)
+        return int(info.points_count or 0)
+
+    async def aclose(self) -> None:
+        if self._aclient is not None:
+            await self._aclient.close()
+            self._aclient = None
+
+    def search_batch(
+        self,
+        query_vectors: Sequence[List[float]],
+        *,
+        limit: int = 5,
+        query_filter: Optional[qm.Filter] = None,
+        score_threshold: Optional[float] = None,
+        exact: bool = False,
+    ) -> List[List[qm.ScoredPoint]]:
+        """
+        Несколько векторов одним запросом (query_batch_points): multi-query, batch QA, оценка.
+        Результаты в порядке query_vectors.
+        """
+        if not query_vectors:
+            return []
+        params = self.profile.search_params(exact=exact)
+        requests = [
+            qm.QueryRequest(
+                query=list(vec),
+                using=self.vector_name,
+                limit=limit,
+                filter=query_filter,
+                score_threshold=score_threshold,
+                params=params,
+                with_payload=True,
+                with_vector=False,
+            )
+            for vec in query_vectors
+        ]
+        res = self.client.query_batch_points(collection_name=self.collection, requests=requests)
+        return [list(r.points) for r in res]
+
+    def set_payload_by_doc_id(self, doc_id: str, payload: Dict[str, Any]) -> None:
+        self.client.set_payload(
+            collection_name=self.collection,
+            payload=payload,
+            points=qm.FilterSelector(filter=self.filter_doc_id(doc_id)),
+        )
+
     # ---------------------------
     # Delete helpers (optional but useful)
     # ---------------------------
@@ -214,3 +596,13 @@ class QdrantStore:
 
     def delete_by_doc_id(self, doc_id: str) -> None:
         self.delete_by_filter(self.filter_doc_id(doc_id))
+
+    def delete_by_file_path(self, file_path: str, *, keep_doc_ids: Sequence[str] = ()) -> None:
+        """
+        Точки, записанные по пути file_path, кроме документов из keep_doc_ids
+        (их содержимое ещё используют другие файлы).
+        """
+        flt = self.filter_match_value("file_path", file_path)
+        if keep_doc_ids:
+            flt.must_not = [qm.FieldCondition(key="doc_id", match=qm.MatchAny(any=list(keep_doc_ids)))]
+        self.delete_by_filter(flt)
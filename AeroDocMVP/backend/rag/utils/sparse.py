@@ -0,0 +1,56 @@
+# utils/sparse.py
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from utils.fts_query import MIN_STEM, STOPWORDS, stem
+
+# Разреженный BM25-вектор для Qdrant (hybrid_engine=qdrant).
+# Токены — те же, что у FTS-запросов (utils/fts_query.py: стоп-слова + лёгкий стеммер),
+# индекс — 32-битный хэш токена. Документ хранит насыщенный TF (BM25 k1/b),
+# IDF считает сам Qdrant (Modifier.IDF у sparse-вектора), запрос — веса 1.0.
+_RE_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_DOC_TOKENS = 256.0  # ~ чанк в 1800 символов
+
+
+def sparse_tokens(text: str) -> List[str]:
+    out: List[str] = []
+    for m in _RE_TOKEN.finditer(text or ""):
+        w = m.group(0).lower().replace("ё", "е")
+        if w in STOPWORDS:
+            continue
+        if len(w) < 2 and not w.isdigit():
+            continue
+        out.append(stem(w) if len(w) >= MIN_STEM and not w.isdigit() else w)
+    return out
+
+
+def token_index(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def _to_vector(weights: Dict[int, float]) -> Tuple[List[int], List[float]]:
+    indices = sorted(weights)
+    return indices, [float(weights[i]) for i in indices]
+
+
+def sparse_doc_vector(text: str) -> Tuple[List[int], List[float]]:
+    tokens = sparse_tokens(text)
+    if not tokens:
+        return [], []
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * len(tokens) / AVG_DOC_TOKENS)
+    weights: Dict[int, float] = {}
+    for tok, tf in Counter(tokens).items():
+        idx = token_index(tok)
+        weights[idx] = weights.get(idx, 0.0) + tf * (BM25_K1 + 1.0) / (tf + norm)
+    return _to_vector(weights)
+
+
+def sparse_query_vector(question: str) -> Tuple[List[int], List[float]]:
+    return _to_vector({token_index(tok): 1.0 for tok in sparse_tokens(question)})
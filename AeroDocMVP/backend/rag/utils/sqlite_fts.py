@@ -1,9 +1,14 @@
 # utils/sqlite_fts.py
 from __future__ import annotations
 
+import json
 import sqlite3
+import threading
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from utils.filters import SearchFilters
+from utils.fts_query import compile_fts_query
 
 
 def connect_db(db_path: str) -> sqlite3.Connection:
@@ -16,6 +21,105 @@ def connect_db(db_path: str) -> sqlite3.Connection:
     return conn
 
 
+def connect_readonly(
+    db_path: str,
+    *,
+    mmap_size: int = 256 * 1024 * 1024,
+    cache_kib: int = 64 * 1024,
+    cached_statements: int = 128,
+) -> sqlite3.Connection:
+    """
+    Read-only соединение для поиска: без DDL/commit, без write-lock.
+    cached_statements — кэш подготовленных выражений sqlite3 (SQL bm25_search стабилен).
+    """
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, cached_statements=cached_statements)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size={int(mmap_size)};")
+    conn.execute(f"PRAGMA cache_size=-{int(cache_kib)};")  # отрицательное = KiB
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA query_only=ON;")
+    return conn
+
+
+class FtsReadPool:
+    """
+    Пул read-only соединений: одно на поток (sqlite3.Connection не шарим между потоками).
+    Схема создаётся один раз при создании пула, а не на каждый запрос.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_kib: int = 64 * 1024,
+        cached_statements: int = 128,
+    ):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cache_kib = cache_kib
+        self.cached_statements = cached_statements
+
+        self._local = threading.local()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        ensure_schema(db_path)
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_readonly(
+                self.db_path,
+                mmap_size=self.mmap_size,
+                cache_kib=self.cache_kib,
+                cached_statements=self.cached_statements,
+            )
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+_POOLS: Dict[str, FtsReadPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_read_pool(db_path: str, **kwargs: Any) -> FtsReadPool:
+    """
+    Пул на файл БД (ленивая инициализация, потокобезопасно).
+    kwargs (mmap_size/cache_kib/cached_statements) учитываются только при первом вызове.
+    """
+    key = str(Path(db_path).resolve())
+    pool = _POOLS.get(key)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(key)
+            if pool is None:
+                pool = FtsReadPool(db_path, **kwargs)
+                _POOLS[key] = pool
+    return pool
+
+
+def ensure_schema(db_path: str) -> None:
+    conn = connect_db(db_path)
+    try:
+        init_fts(conn)
+    finally:
+        conn.close()
+
+
 def init_fts(conn: sqlite3.Connection) -> None:
     # Основная таблица с метой
     conn.execute(
@@ -30,10 +134,18 @@ def init_fts(conn: sqlite3.Connection) -> None:
             page_start  INTEGER,
             page_end    INTEGER,
             char_start  INTEGER,
-            char_end    INTEGER
+            char_end    INTEGER,
+            source_type TEXT,
+            modified_at TEXT,
+            n_tokens    INTEGER
         );
         """
     )
+    # старые БД: колонки фильтров добавляем на месте
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(chunks)")}
+    for col, typ in (("source_type", "TEXT"), ("modified_at", "TEXT"), ("n_tokens", "INTEGER")):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE chunks ADD COLUMN {col} {typ};")
 
     # FTS5 индекс по text (BM25 доступен через bm25(chunks_fts))
     conn.execute(
@@ -48,74 +160,195 @@ def init_fts(conn: sqlite3.Connection) -> None:
         """
     )
 
+    # Словарь FTS-индекса: df по термам для планировщика запросов (utils/fts_query.py)
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab
+        USING fts5vocab('chunks_fts', 'row');
+        """
+    )
+
     # Индексы для фильтров/джойнов
     conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id);")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file_name ON chunks(file_name);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source_type ON chunks(source_type);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_modified_at ON chunks(modified_at);")
     conn.commit()
 
 
-def upsert_chunks(conn: sqlite3.Connection, rows: Iterable[Dict[str, Any]]) -> None:
+# id точек — беззнаковые u64 (preprocessor/chunking.py), а INTEGER в SQLite — знаковый i64.
+# Храним в SQLite дополнительный код, наружу отдаём исходный u64 (совпадает с id в Qdrant).
+_U64 = 1 << 64
+_I64_MAX = (1 << 63) - 1
+
+
+def to_sqlite_id(cid: int) -> int:
+    cid = int(cid)
+    return cid - _U64 if cid > _I64_MAX else cid
+
+
+def from_sqlite_id(rid: int) -> int:
+    rid = int(rid)
+    return rid + _U64 if rid < 0 else rid
+
+
+_CHUNK_COLUMNS = (
+    "id, text, doc_id, file_name, chunk_id, chunk_index, page_start, page_end, char_start, char_end, "
+    "source_type, modified_at, n_tokens"
+)
+
+
+def _row_tuple(r: Dict[str, Any]) -> tuple:
+    return (
+        to_sqlite_id(r["id"]),
+        str(r.get("text") or ""),
+        r.get("doc_id"),
+        r.get("file_name") or r.get("source_file"),
+        r.get("chunk_id"),
+        r.get("chunk_index"),
+        r.get("page_start"),
+        r.get("page_end"),
+        r.get("char_start"),
+        r.get("char_end"),
+        r.get("source_type"),
+        r.get("modified_at"),
+        r.get("n_tokens"),
+    )
+
+
+def upsert_chunks(
+    conn: sqlite3.Connection,
+    rows: Iterable[Dict[str, Any]],
+    *,
+    batch_size: int = 500,
+) -> None:
     """
     rows: {"id": int, "text": str, ...meta fields...}
     Держим chunks и chunks_fts синхронно.
+    Батчами: одна транзакция на батч, executemany + set-based синхронизация FTS
+    (старый текст удаляется из индекса по значениям из chunks — так требует external content).
     """
-    cur = conn.cursor()
-    cur.execute("BEGIN;")
-
+    batch: List[tuple] = []
     for r in rows:
-        cid = int(r["id"])
-        text = str(r.get("text") or "")
-
-        doc_id = r.get("doc_id")
-        file_name = r.get("file_name") or r.get("source_file")
-        chunk_id = r.get("chunk_id")
-        chunk_index = r.get("chunk_index")
-        page_start = r.get("page_start")
-        page_end = r.get("page_end")
-        char_start = r.get("char_start")
-        char_end = r.get("char_end")
-
-        # upsert meta+text
-        cur.execute(
+        batch.append(_row_tuple(r))
+        if len(batch) >= batch_size:
+            _upsert_batch(conn, batch)
+            batch = []
+    if batch:
+        _upsert_batch(conn, batch)
+
+
+def _upsert_batch(conn: sqlite3.Connection, batch: List[tuple]) -> None:
+    ids_json = json.dumps([t[0] for t in batch])
+    with conn:
+        conn.execute(
             """
-            INSERT OR REPLACE INTO chunks
-            (id, text, doc_id, file_name, chunk_id, chunk_index, page_start, page_end, char_start, char_end)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO chunks_fts(chunks_fts, rowid, text)
+            SELECT 'delete', id, text FROM chunks WHERE id IN (SELECT value FROM json_each(?))
             """,
-            (
-                cid,
-                text,
-                doc_id,
-                file_name,
-                chunk_id,
-                chunk_index,
-                page_start,
-                page_end,
-                char_start,
-                char_end,
-            ),
+            (ids_json,),
         )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO chunks ({_CHUNK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        conn.execute(
+            """
+            INSERT INTO chunks_fts(rowid, text)
+            SELECT id, text FROM chunks WHERE id IN (SELECT value FROM json_each(?))
+            """,
+            (ids_json,),
+        )
+
 
-        # обновляем fts: delete старое и вставляем новое
-        cur.execute("INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES('delete', ?, '')", (cid,))
-        cur.execute("INSERT INTO chunks_fts(rowid, text) VALUES(?, ?)", (cid, text))
+def delete_by_doc_id(conn: sqlite3.Connection, doc_id: str) -> None:
+    """
+    Синхронное удаление чанков документа из chunks и fts: два set-based запроса в одной транзакции.
+    """
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO chunks_fts(chunks_fts, rowid, text)
+            SELECT 'delete', id, text FROM chunks WHERE doc_id = ?
+            """,
+            (doc_id,),
+        )
+        conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
 
-    cur.execute("COMMIT;")
 
+def update_doc_meta(conn: sqlite3.Connection, doc_id: str, *, file_name: str, modified_at: str) -> None:
+    """
+    Мета документа, зависящая от пути (переименование/копия). Текст не меняется — FTS не трогаем.
+    """
+    with conn:
+        conn.execute(
+            "UPDATE chunks SET file_name = ?, modified_at = ? WHERE doc_id = ?",
+            (file_name, modified_at, doc_id),
+        )
 
-def delete_by_doc_id(conn: sqlite3.Connection, doc_id: str) -> None:
+
+# ---------------------------
+# Bulk-load (полная пересборка)
+# ---------------------------
+
+def begin_bulk_load(conn: sqlite3.Connection) -> None:
+    """
+    Полная пересборка: очищаем chunks и FTS-индекс.
+    Дальше bulk_insert_chunks пишет только в chunks, индекс строится один раз в finish_bulk_load.
+    """
+    with conn:
+        conn.execute("DELETE FROM chunks")
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('delete-all')")
+
+
+def bulk_insert_chunks(
+    conn: sqlite3.Connection,
+    rows: Iterable[Dict[str, Any]],
+    *,
+    batch_size: int = 500,
+) -> None:
+    batch: List[tuple] = []
+
+    def flush() -> None:
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO chunks ({_CHUNK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+
+    for r in rows:
+        batch.append(_row_tuple(r))
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+
+def finish_bulk_load(conn: sqlite3.Connection) -> None:
     """
-    Синхронное удаление чанков документа из chunks и fts.
+    Один 'rebuild' FTS по всей таблице chunks + 'optimize' (слияние сегментов).
     """
-    cur = conn.cursor()
-    cur.execute("BEGIN;")
-    ids = [row["id"] for row in cur.execute("SELECT id FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()]
+    with conn:
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('rebuild')")
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('optimize')")
 
-    for cid in ids:
-        cur.execute("INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES('delete', ?, '')", (cid,))
-        cur.execute("DELETE FROM chunks WHERE id = ?", (cid,))
 
-    cur.execute("COMMIT;")
+def fetch_chunks(conn: sqlite3.Connection, ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Payload чанков по id (u64, как в Qdrant) одним запросом WHERE id IN (...).
+    """
+    if not ids:
+        return {}
+    sql_ids = [to_sqlite_id(i) for i in ids]
+    marks = ",".join("?" * len(sql_ids))
+    rows = conn.execute(f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE id IN ({marks})", sql_ids).fetchall()
+    cols = [c.strip() for c in _CHUNK_COLUMNS.split(",")]
+    out: Dict[int, Dict[str, Any]] = {}
+    for r in rows:
+        payload = dict(zip(cols, tuple(r)))
+        out[from_sqlite_id(payload.pop("id"))] = payload
+    return out
 
 
 def bm25_search(
@@ -125,26 +358,29 @@ def bm25_search(
     limit: int = 10,
     file_name: Optional[str] = None,
     doc_id: Optional[str] = None,
+    filters: Optional[SearchFilters] = None,
+    max_df_ratio: float = 0.5,
 ) -> List[Dict[str, Any]]:
     """
     Возвращает список словарей как у dense:
       {"id": ..., "score": ..., "payload": {...}}
     В SQLite FTS5 bm25() — меньше = лучше, поэтому score делаем отрицательным.
+    Вопрос не идёт в MATCH как есть: compile_fts_query строит безопасный OR-запрос
+    со стеммингом и отбрасывает слишком частые термы.
+    filters — те же фильтры, что уходят в query_filter Qdrant (file_name/doc_id — сокращения).
     """
-    q = (query or "").strip()
+    q = compile_fts_query(conn, query or "", max_df_ratio=max_df_ratio)
     if not q:
         return []
 
+    if filters is None:
+        filters = SearchFilters(file_name=file_name, doc_id=doc_id)
+
     where = ["chunks_fts MATCH ?"]
     params: List[Any] = [q]
-
-    if file_name:
-        where.append("c.file_name = ?")
-        params.append(file_name)
-
-    if doc_id:
-        where.append("c.doc_id = ?")
-        params.append(doc_id)
+    flt_where, flt_params = filters.to_sql("c")
+    where += flt_where
+    params += flt_params
 
     sql = f"""
         SELECT
@@ -158,6 +394,9 @@ def bm25_search(
             c.page_end AS page_end,
             c.char_start AS char_start,
             c.char_end AS char_end,
+            c.source_type AS source_type,
+            c.modified_at AS modified_at,
+            c.n_tokens AS n_tokens,
             bm25(chunks_fts) AS bm25_score
         FROM chunks_fts
         JOIN chunks c ON c.id = chunks_fts.rowid
@@ -181,10 +420,13 @@ def bm25_search(
             "page_end": r["page_end"],
             "char_start": r["char_start"],
             "char_end": r["char_end"],
+            "source_type": r["source_type"],
+            "modified_at": r["modified_at"],
+            "n_tokens": r["n_tokens"],
         }
         out.append(
             {
-                "id": r["id"],
+                "id": from_sqlite_id(r["id"]),
                 "score": float(-r["bm25_score"]),  # больше = лучше
                 "payload": payload,
             }
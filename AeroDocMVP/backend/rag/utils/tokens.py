@@ -0,0 +1,48 @@
+# utils/tokens.py
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import List, Sequence
+
+# Без токенайзера модели: ~3.5 символа на токен (смесь ru/en у BPE-токенайзеров Llama/Qwen).
+_CHARS_PER_TOKEN = 3.5
+
+
+class TokenCounter:
+    """
+    Подсчёт токенов токенайзером целевой LLM (tokenizer.json с HF Hub или локальный путь).
+    name="" — грубая оценка по длине текста.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._tok = None
+        if name:
+            from tokenizers import Tokenizer  # type: ignore
+
+            if name.endswith(".json"):
+                self._tok = Tokenizer.from_file(name)
+            else:
+                self._tok = Tokenizer.from_pretrained(name)
+            self._tok.no_truncation()
+            self._tok.no_padding()
+
+    @property
+    def exact(self) -> bool:
+        return self._tok is not None
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        if not texts:
+            return []
+        if self._tok is None:
+            return [max(1, int(len(t) / _CHARS_PER_TOKEN + 0.5)) if t else 0 for t in texts]
+        return [len(e.ids) for e in self._tok.encode_batch(list(texts), add_special_tokens=False)]
+
+
+@lru_cache(maxsize=4)
+def get_token_counter(name: str = "") -> TokenCounter:
+    # один экземпляр на процесс (в т.ч. в воркерах process-пула ingest)
+    return TokenCounter(name)
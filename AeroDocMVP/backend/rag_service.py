@@ -1,21 +1,38 @@
 # rag_service.py
 from __future__ import annotations
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
-from typing import Optional, Tuple, List
-from functools import lru_cache
-BASE_DIR = Path(__file__).resolve().parent          
-RAG_DIR = BASE_DIR / "rag"                          
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional, Tuple, List
+from functools import lru_cache, partial
+
+
+BASE_DIR = Path(__file__).resolve().parent
+RAG_DIR = BASE_DIR / "rag"
 sys.path.insert(0, str(RAG_DIR))
-from rag.config.settings import Settings
-from rag.embed.embeddings import Embedder
-from rag.utils.qdrant_store import QdrantStore
-from rag.app.search import search_hybrid
-from rag.app.ollama import ollama_chat
-from rag.app.promt import build_prompt, format_sources
-from rag.app.search import search_qdrant
+# Модули rag — под теми же именами, что и внутри пакета (config., app., utils.): каждый грузится
+# один раз. Тяжёлое (qdrant_client, модели, torch) — лениво в get_store/get_embedder/...,
+# на старте API это делает warm_runtime; проверка: python -m cli.import_budget
+from config.settings import Settings
+from app.ollama import DEFAULT_SYSTEM
+from app.ollama_client import OllamaClient
+from app.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_GENERATE
+from app.answer_cache import AnswerCache, CachedAnswer, cache_scope, exact_key
+from app.promt import PROMPT_PREFIX, build_prompt, format_sources
+from app.budget import compress_hits
+from utils.filters import SearchFilters
+from utils.tokens import get_token_counter
+from utils.sqlite_fts import FtsReadPool, get_read_pool
+
+if TYPE_CHECKING:
+    from app.intent import IntentClassifier
+    from app.rerank import Reranker
+    from embed.embeddings import Embedder
+    from utils.qdrant_store import QdrantStore
 
 
 def disable_proxies_for_localhost() -> None:
@@ -25,49 +42,431 @@ def disable_proxies_for_localhost() -> None:
     os.environ["no_proxy"] = "localhost,127.0.0.1"
 
 
+# Синглтоны по отдельности: warm_runtime поднимает их параллельно, а не цепочкой.
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    disable_proxies_for_localhost()
+    return Settings()
+
+
 @lru_cache(maxsize=1)
+def get_store() -> "QdrantStore":
+    from utils.qdrant_store import QdrantStore
+
+    return QdrantStore.from_settings(get_settings())
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> "Embedder":
+    """
+    EMBED_SERVER задан — клиент общего сервера (одна модель на хост, батчит сам сервер);
+    иначе своя модель, запросы из разных корутин склеиваются BatchingEmbedder'ом.
+    """
+    s = get_settings()
+    if s.embed_server:
+        from embed.remote import RemoteEmbedder
+
+        return RemoteEmbedder(s.embed_server, timeout_s=s.embed_server_timeout_s)  # type: ignore[return-value]
+
+    from embed.embeddings import Embedder
+
+    embedder = Embedder.from_settings(s)
+    if s.embed_max_batch <= 1:
+        return embedder
+    from embed.batcher import BatchingEmbedder
+
+    return BatchingEmbedder(embedder, max_batch=s.embed_max_batch, max_wait_ms=s.embed_max_wait_ms)  # type: ignore[return-value]
+
+
+@lru_cache(maxsize=1)
+def get_fts_pool() -> Optional[FtsReadPool]:
+    # схема FTS + настройки read-пула один раз на процесс
+    # (hybrid_engine=qdrant с полным payload обходится без локального SQLite)
+    s = get_settings()
+    if s.hybrid_engine == "qdrant" and not s.qdrant_slim_payload:
+        return None
+    return get_read_pool(s.fts_db_path, mmap_size=s.fts_mmap_size, cache_kib=s.fts_cache_kib)
+
+
 def _get_runtime():
     """
-    Кэшируем тяжёлые штуки: Settings / QdrantStore / Embedder
-    чтобы не создавать их на каждый запрос.
+    Settings / QdrantStore / Embedder — создаются один раз на процесс
+    (обычно заранее, в warm_runtime при старте API).
     """
-    disable_proxies_for_localhost()
-    s = Settings()
-    store = QdrantStore(url=s.qdrant_url, collection=s.collection, vector_name=s.vector_name)
-    embedder = Embedder(s.embedding_model, batch_size=32)
-    return s, store, embedder
+    get_fts_pool()
+    return get_settings(), get_store(), get_embedder()
+
+
+@dataclass(frozen=True)
+class Executors:
+    # модель одна — мало потоков; с батчингом/сервером потоки только ждут ответа,
+    # и их должно хватать, чтобы одновременные запросы успели собраться в батч
+    embed: ThreadPoolExecutor
+    fts: ThreadPoolExecutor    # SQLite: у каждого потока своё read-соединение из пула
+
+
+@lru_cache(maxsize=1)
+def get_executors() -> Executors:
+    s = get_settings()
+    embed_workers = s.embed_workers
+    if s.embed_server or s.embed_max_batch > 1:
+        embed_workers = max(embed_workers, s.embed_max_batch)
+    return Executors(
+        embed=ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="embed"),
+        fts=ThreadPoolExecutor(max_workers=s.fts_workers, thread_name_prefix="fts"),
+    )
+
+
+async def run_embed(fn, *args):
+    """Вызов на Embedder (эмбеддинг, классификатор намерений) — в выделенном embed-пуле."""
+    return await asyncio.get_running_loop().run_in_executor(get_executors().embed, partial(fn, *args))
+
+
+async def run_fts(fn, *args):
+    """Синхронная работа с SQLite (FTS, кэш ответов) — в выделенном fts-пуле."""
+    return await asyncio.get_running_loop().run_in_executor(get_executors().fts, partial(fn, *args))
+
+
+async def aclose_runtime() -> None:
+    if get_store.cache_info().currsize:
+        await get_store().aclose()
+    if get_embedder.cache_info().currsize:
+        close = getattr(get_embedder(), "close", None)
+        if close is not None:
+            close()
+    if get_executors.cache_info().currsize:
+        ex = get_executors()
+        ex.embed.shutdown(wait=False)
+        ex.fts.shutdown(wait=False)
+
+
+@lru_cache(maxsize=1)
+def get_intent_classifier() -> "IntentClassifier":
+    """
+    Локальный классификатор намерений на том же Embedder, что и retrieval.
+    """
+    from app.intent import IntentClassifier
+
+    s = get_settings()
+    return IntentClassifier(
+        get_embedder(),
+        min_similarity=s.intent_min_similarity,
+        min_margin=s.intent_min_margin,
+        cache_size=s.intent_cache_size,
+    )
 
 
-def answer_question(
+@lru_cache(maxsize=1)
+def get_reranker() -> Optional["Reranker"]:
+    s = get_settings()
+    if not s.rerank_enabled:
+        return None
+    from app.rerank import Reranker
+
+    return Reranker.from_settings(s)
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> Optional[AnswerCache]:
+    s = get_settings()
+    if not s.answer_cache_enabled:
+        return None
+    return AnswerCache(
+        s.answer_cache_db_path,
+        generation_path=s.ingest_generation_path,
+        max_entries=s.answer_cache_max_entries,
+        ttl_s=s.answer_cache_ttl_s,
+        semantic_threshold=s.answer_cache_semantic_threshold,
+    )
+
+
+NO_INFO_ANSWER = "в предоставленных фрагментах нет информации"
+
+
+async def _retrieve(
     question: str,
     *,
-    file_name: Optional[str] = None,
     top_k: Optional[int] = None,
     score_threshold: Optional[float] = None,
-) -> Tuple[str, List[str]]:
-    s, store, embedder = _get_runtime()
+    query_vector: Optional[list] = None,
+    filters: Optional[SearchFilters] = None,
+) -> List[Dict[str, Any]]:
+    from app.search import search_hybrid_async  # тянет qdrant_client
 
-    ollama_base = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
-    ollama_model = os.getenv("OLLAMA_MODEL", "llama3:8b")
+    s, store, embedder = _get_runtime()
+    ex = get_executors()
 
     k = top_k if top_k is not None else int(os.getenv("TOP_K", "3"))
+    reranker = get_reranker()
+
+    hits = await search_hybrid_async(
+        store,
+        embedder,
+        question,
+        fts_db_path=s.fts_db_path,
+        embed_executor=ex.embed,
+        fts_executor=ex.fts,
+        # с rerank берём больше кандидатов: текст подтягивается одним запросом для всех
+        limit=max(k, reranker.max_candidates) if reranker else k,
+        score_threshold=score_threshold,
+        max_df_ratio=s.fts_max_df_ratio,
+        query_vector=query_vector,
+        filters=filters,
+        slim=s.qdrant_slim_payload,
+        engine=s.hybrid_engine,
+    )
+    if reranker is None or len(hits) <= 1:
+        return hits[:k]
+    return await run_embed(partial(reranker.rerank, question, hits, top_k=k))
 
-    hits = search_hybrid(
-            store,
-            embedder,
-            question,
-            fts_db_path=s.fts_db_path,
-            limit=k,
-            score_threshold=score_threshold,
+
+def _sources_list(hits: List[Dict[str, Any]]) -> List[str]:
+    return [line.strip() for line in format_sources(hits).splitlines() if line.strip()]
+
+
+@dataclass
+class PreparedAnswer:
+    """
+    Результат подготовки: либо готовый ответ из кэша, либо промпт для LLM
+    (prompt=None и cached=None — ничего не нашли).
+    """
+    question: str
+    prompt: Optional[str]
+    sources: List[str]
+    cached: Optional[CachedAnswer] = None
+    cache_key: Optional[str] = None
+    cache_scope: Optional[str] = None
+    query_vector: Optional[list] = None
+
+
+async def prepare_answer(
+    question: str,
+    *,
+    filters: Optional[SearchFilters] = None,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+) -> PreparedAnswer:
+    """
+    Всё до LLM: кэш ответов (exact -> semantic) + retrieval + сборка промпта.
+    Эмбеддинг вопроса считается один раз: и для semantic tier, и для dense-поиска;
+    без semantic tier он идёт параллельно с BM25.
+    """
+    s, _, embedder = _get_runtime()
+    cache = get_answer_cache()
+
+    key = scope = None
+    if cache is not None:
+        scope = cache_scope(
+            model=s.ollama_model,
+            filters={
+                **(filters.as_dict() if filters else {}),
+                "top_k": top_k,
+                "score_threshold": score_threshold,
+            },
         )
+        key = exact_key(question, scope=scope)
+        hit = await run_fts(cache.get_exact, key)
+        if hit is not None:
+            return PreparedAnswer(question, None, hit.sources, cached=hit)
+
+    qvec = None
+    if cache is not None and cache.semantic_threshold > 0:
+        qvec = (await run_embed(embedder.embed, [question]))[0]
+        hit = await run_fts(partial(cache.get_semantic, qvec, scope=scope))
+        if hit is not None:
+            return PreparedAnswer(question, None, hit.sources, cached=hit)
+
+    hits = await _retrieve(
+        question,
+        top_k=top_k,
+        score_threshold=score_threshold,
+        query_vector=qvec,
+        filters=filters,
+    )
+    prepared = PreparedAnswer(question, None, [], cache_key=key, cache_scope=scope, query_vector=qvec)
+    if hits:
+        # источники — по исходным чанкам, в промпт — сжатый под бюджет токенов контекст
+        prepared.sources = _sources_list(hits)
+        if s.prompt_context_tokens > 0:
+            hits = compress_hits(
+                question,
+                hits,
+                budget_tokens=s.prompt_context_tokens,
+                counter=get_token_counter(s.prompt_tokenizer),
+                neighbours=s.prompt_neighbour_units,
+            )
+            prepared.prompt = build_prompt(question, hits, max_chars=None)
+        else:
+            prepared.prompt = build_prompt(question, hits, max_chars=12000)
+    return prepared
+
+
+def store_answer(prepared: PreparedAnswer, answer: str) -> None:
+    cache = get_answer_cache()
+    if cache is None or prepared.cache_key is None or prepared.prompt is None or not answer:
+        return
+    cache.put(
+        prepared.cache_key,
+        scope=prepared.cache_scope,  # type: ignore[arg-type]
+        question=prepared.question,
+        answer=answer,
+        sources=prepared.sources,
+        qvec=prepared.query_vector,
+    )
+
+
+async def answer_question(
+    question: str,
+    *,
+    ollama: OllamaClient,
+    filters: Optional[SearchFilters] = None,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    priority: int = PRIORITY_GENERATE,
+) -> Tuple[str, List[str]]:
+    prepared = await prepare_answer(question, filters=filters, top_k=top_k, score_threshold=score_threshold)
+
+    if prepared.cached is not None:
+        return prepared.cached.answer, prepared.sources
+    if prepared.prompt is None:
+        return NO_INFO_ANSWER, []
+
+    answer = (await ollama.chat(prepared.prompt, priority=priority)).strip()
+    await run_fts(store_answer, prepared, answer)
+    return answer, prepared.sources
 
-    if not hits:
-        return "в предоставленных фрагментах нет информации", []
 
-    prompt = build_prompt(question, hits, max_chars=12000)
+async def stream_prepared_answer(
+    prepared: PreparedAnswer,
+    *,
+    ollama: OllamaClient,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Потоковая генерация по уже готовому результату prepare_answer.
+    События:
+      {"type": "sources", "sources": [...]}  — первым, до генерации
+      {"type": "token", "content": "..."}    — куски ответа по мере генерации
+      {"type": "done"}                       — при ответе из кэша: {"type": "done", "cache": "exact"|"semantic"}
+    Полностью сгенерированный ответ кладётся в кэш.
+    """
+    yield {"type": "sources", "sources": prepared.sources}
+
+    if prepared.cached is not None:
+        yield {"type": "token", "content": prepared.cached.answer}
+        yield {"type": "done", "cache": prepared.cached.tier}
+        return
+
+    if prepared.prompt is None:
+        yield {"type": "token", "content": NO_INFO_ANSWER}
+        yield {"type": "done"}
+        return
+
+    parts: List[str] = []
+    async for piece in ollama.chat_stream(prepared.prompt):
+        parts.append(piece)
+        yield {"type": "token", "content": piece}
+
+    await run_fts(store_answer, prepared, "".join(parts).strip())
+    yield {"type": "done"}
 
-    answer = ollama_chat(prompt, model=ollama_model, base_url=ollama_base).strip()
 
-    sources_list = [line.strip() for line in format_sources(hits).splitlines() if line.strip()]
-    return answer, sources_list
+async def warm_ollama(ollama: OllamaClient) -> List[str]:
+    """
+    Загрузка моделей Ollama при старте API (OLLAMA_PRELOAD_MODELS или OLLAMA_MODEL)
+    с keep_alive из настроек + прогон статического префикса промпта ответа,
+    чтобы первый /chat не платил за загрузку модели и префикс. Возвращает загруженные модели.
+    """
+    s = get_settings()
+    models = [m.strip() for m in s.ollama_preload_models.split(",") if m.strip()] or [s.ollama_model]
+    # по очереди: параллельная загрузка нескольких моделей упирается в ту же RAM/диск
+    for m in models:
+        if m == s.ollama_model:
+            await ollama.preload(m, system=DEFAULT_SYSTEM, prefix=PROMPT_PREFIX)
+        else:
+            await ollama.preload(m)
+    return models
+
+
+WARMUP_COMPONENTS = ("embedder", "qdrant", "fts", "ollama")
+
+
+async def warm_runtime(
+    ollama: OllamaClient,
+    status: Dict[str, str],
+    *,
+    max_retry_s: float = 30.0,
+) -> None:
+    """
+    Прогрев всего, что нужно первому запросу, — компоненты параллельно:
+      embedder — модель + классификатор намерений (+ reranker), в embed-пуле;
+      qdrant   — импорт клиента, соединение, коллекция;
+      fts      — read-пул SQLite, кэш ответов, токенайзер бюджета промпта;
+      ollama   — загрузка моделей и префикса промпта (warm_ollama).
+    status[name]: "pending" -> "ok" | "error: ...". Упавший компонент повторяется
+    с backoff до успеха (Qdrant/Ollama могут подняться позже API).
+    """
+    loop = asyncio.get_running_loop()
+    s = get_settings()
+
+    async def embedder() -> None:
+        emb = await run_embed(get_embedder)
+        await run_embed(emb.embed, ["прогрев"])
+        await run_embed(get_intent_classifier().warmup)
+        reranker = await run_embed(get_reranker)
+        if reranker is not None:
+            await run_embed(reranker.warmup)
+
+    async def qdrant() -> None:
+        store = await loop.run_in_executor(None, get_store)
+        await store.awarmup()
+
+    async def fts() -> None:
+        def touch() -> None:
+            pool = get_fts_pool()
+            if pool is not None:
+                pool.get().execute("SELECT 1 FROM chunks LIMIT 1").fetchall()
+            get_answer_cache()
+            get_token_counter(s.prompt_tokenizer)
+
+        await run_fts(touch)
+
+    async def llm() -> None:
+        await warm_ollama(ollama)
+
+    async def keep_trying(name: str, fn) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await fn()
+                status[name] = "ok"
+                return
+            except Exception as e:
+                status[name] = f"error: {e!r}"
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_retry_s)
+
+    steps = {"embedder": embedder, "qdrant": qdrant, "fts": fts, "ollama": llm}
+    await asyncio.gather(*(keep_trying(name, steps[name]) for name in WARMUP_COMPONENTS))
+
+
+async def warm_answer_cache(ollama: OllamaClient) -> int:
+    """
+    Прогрев кэша ответов вопросами из ANSWER_CACHE_FAQ_PATH (по одному на строку).
+    Уже закэшированные вопросы LLM не трогают. Возвращает число прогретых вопросов.
+    """
+    s = get_settings()
+    if not s.answer_cache_faq_path or get_answer_cache() is None:
+        return 0
+    path = Path(s.answer_cache_faq_path)
+    if not path.exists():
+        return 0
 
+    questions = [q.strip() for q in path.read_text(encoding="utf-8").splitlines()]
+    warmed = 0
+    for q in questions:
+        if not q or q.startswith("#"):
+            continue
+        await answer_question(q, ollama=ollama, priority=PRIORITY_BACKGROUND)
+        warmed += 1
+    return warmed
@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from app.budget import GAP, SOURCE_OVERHEAD_TOKENS, compress_hits, split_units  # noqa: E402
+
+
+class WordCounter:
+    # токен = слово: бюджеты в тестах считаются в уме
+    def count(self, text):
+        return len(text.split())
+
+    def count_many(self, texts):
+        return [self.count(t) for t in texts]
+
+
+def _hit(i, text, **payload):
+    return {"id": i, "score": 1.0, "payload": {"text": text, **payload}}
+
+
+def _filler(n):
+    return "Текст" + " текст" * (n - 1) + "."
+
+
+def test_split_units_sentences_and_table_rows():
+    text = "Первое предложение. Второе! Третье?\nТАБЛИЦА:\nМасса | 5500 кг. Да\nСкорость | 180\n\nКонец."
+    assert split_units(text) == [
+        "Первое предложение.",
+        "Второе!",
+        "Третье?",
+        "ТАБЛИЦА:",
+        "Масса | 5500 кг. Да",
+        "Скорость | 180",
+        "Конец.",
+    ]
+
+
+def test_unused_quota_rolls_over_to_next_sources():
+    counter = WordCounter()
+    budget = 100
+    short, long_ = _filler(9), _filler(59)
+    # поровну второму досталось бы 100 // 2 - 12 = 38 < 60; с остатком первого — 66
+    out = compress_hits("вопрос", [_hit(1, short), _hit(2, long_)], budget_tokens=budget, counter=counter)
+    assert [h["id"] for h in out] == [1, 2]
+    assert [h["payload"]["compressed"] for h in out] == [False, False]
+    assert out[1]["payload"]["text"] == long_
+    assert sum(h["payload"]["n_tokens"] + SOURCE_OVERHEAD_TOKENS for h in out) <= budget
+
+
+def test_uses_ingest_n_tokens_instead_of_recounting():
+    class NoCount(WordCounter):
+        def count_many(self, texts):
+            assert not texts, "n_tokens из ingest должен использоваться как есть"
+            return []
+
+    out = compress_hits("вопрос", [_hit(1, "короткий текст.", n_tokens=2)], budget_tokens=50, counter=NoCount())
+    assert out[0]["payload"]["compressed"] is False
+
+
+def test_over_quota_chunk_keeps_relevant_sentence_within_quota():
+    counter = WordCounter()
+    text = " ".join([_filler(8)] * 5 + ["Максимальная взлётная масса самолёта 5500 кг."] + [_filler(8)] * 5)
+    budget = 30
+    out = compress_hits("взлётная масса", [_hit(1, text)], budget_tokens=budget, counter=counter)
+    p = out[0]["payload"]
+    assert p["compressed"] is True
+    assert "взлётная масса самолёта 5500 кг." in p["text"]
+    assert GAP in p["text"]
+    assert p["n_tokens"] <= budget - SOURCE_OVERHEAD_TOKENS
+
+
+def test_exhausted_budget_empties_trailing_sources_but_keeps_them():
+    counter = WordCounter()
+    hits = [_hit(i, _filler(30)) for i in range(1, 4)]
+    out = compress_hits("вопрос", hits, budget_tokens=3 * SOURCE_OVERHEAD_TOKENS, counter=counter)
+    assert [h["id"] for h in out] == [1, 2, 3]
+    assert all(h["payload"]["text"] == "" and h["payload"]["compressed"] for h in out)
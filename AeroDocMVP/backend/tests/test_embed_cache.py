@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from embed.cache import EmbeddingCache, text_key  # noqa: E402
+
+
+def _cache(tmp_path, capacity, **kw):
+    return EmbeddingCache(str(tmp_path), model_name="m", dim=4, max_entries=capacity, dtype="float32", **kw)
+
+
+def _vec(i):
+    return [float(i)] * 4
+
+
+def test_text_key_ignores_whitespace_and_depends_on_model():
+    assert text_key("m", "взлётная  масса\n") == text_key("m", "взлётная масса")
+    assert text_key("m", "a") != text_key("other", "a")
+
+
+def test_roundtrip_and_stats(tmp_path):
+    c = _cache(tmp_path, 8)
+    c.put_many(["a", "b"], [_vec(1), _vec(2)])
+    assert c.get_many(["a", "b", "x"]) == {"a": _vec(1), "b": _vec(2)}
+    assert (c.hits, c.misses, len(c)) == (2, 1, 2)
+
+
+def test_lru_eviction_reuses_slots(tmp_path):
+    c = _cache(tmp_path, 4, evict_fraction=0.5)  # вытесняем по 2
+    c.put_many(["a", "b", "c", "d"], [_vec(i) for i in range(4)])
+    # "a" и "c" свежее остальных
+    c._conn.execute("UPDATE entries SET last_used = 0 WHERE key IN ('b', 'd')")
+    c._conn.commit()
+
+    c.put_many(["e"], [_vec(9)])
+    assert c.evictions == 2
+    assert set(c.get_many(["a", "b", "c", "d", "e"])) == {"a", "c", "e"}
+    # второй освобождённый слот ушёл в free_slots и занимается без нового вытеснения
+    c.put_many(["f"], [_vec(8)])
+    assert c.evictions == 2
+    slots = sorted(r[0] for r in c._conn.execute("SELECT slot FROM entries"))
+    assert slots == [0, 1, 2, 3]
+    assert c.get_many(["e", "f"]) == {"e": _vec(9), "f": _vec(8)}
+
+
+def test_capacity_change_resizes_vectors(tmp_path):
+    c = _cache(tmp_path, 4)
+    c.put_many(["a", "b", "c", "d"], [_vec(i) for i in range(4)])
+    c.close()
+
+    # ёмкость выросла: старые записи на месте, хвост доступен
+    c = _cache(tmp_path, 8)
+    c.put_many(["e"], [_vec(5)])
+    assert c.evictions == 0
+    assert c.get_many(["a", "d", "e"]) == {"a": _vec(0), "d": _vec(3), "e": _vec(5)}
+    c.close()
+
+    # ёмкость уменьшилась: записи за границей уходят из индекса, чтение не падает
+    c = _cache(tmp_path, 2)
+    assert set(c.get_many(["a", "b", "c", "d", "e"])) == {"a", "b"}
+    c.put_many(["f"], [_vec(6)])
+    assert len(c) == 2
+    c.close()
@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from utils.filters import SearchFilters  # noqa: E402
+
+
+def test_date_only_modified_to_covers_whole_day():
+    f = SearchFilters(modified_from="2024-05-01", modified_to="2024-05-01")
+    assert f.modified_from == "2024-05-01T00:00:00+00:00"
+    assert f.modified_to == "2024-05-01T23:59:59.999999+00:00"
+
+    where, params = f.to_sql()
+    assert where == ["c.modified_at >= ?", "c.modified_at <= ?"]
+    # modified_at из docling_reader — isoformat в UTC, с микросекундами и без
+    for ts in ("2024-05-01T00:00:00+00:00", "2024-05-01T15:30:00+00:00", "2024-05-01T23:59:59.5+00:00"):
+        assert params[0] <= ts <= params[1]
+    assert not "2024-05-02T00:00:00+00:00" <= params[1]
+
+
+def test_modified_to_with_time_is_kept():
+    f = SearchFilters(modified_to="2024-05-01T12:00:00+03:00")
+    assert f.modified_to == "2024-05-01T09:00:00+00:00"
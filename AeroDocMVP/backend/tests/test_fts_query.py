@@ -0,0 +1,40 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from utils.fts_query import compile_fts_query  # noqa: E402
+from utils.sqlite_fts import bm25_search, init_fts, upsert_chunks  # noqa: E402
+
+
+def _db(texts):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    init_fts(conn)
+    upsert_chunks(conn, [{"id": i, "text": t} for i, t in enumerate(texts, start=1)])
+    return conn
+
+
+def test_yo_query_matches_yo_text():
+    # unicode61 хранит "ё" как есть: запрос с "ё" должен находить текст с "ё"
+    conn = _db(["Взлёт самолёта с ВПП-1", "Посадка в сложных метеоусловиях", "Руление по перрону"])
+    hits = bm25_search(conn, "взлёт самолёта")
+    assert [h["id"] for h in hits] == [1]
+
+
+def test_yo_query_matches_both_spellings():
+    conn = _db(["Взлёт самолёта", "Взлет самолета", "Посадка", "Руление"])
+    assert '"взлёт"*' in compile_fts_query(conn, "взлёт", max_df_ratio=1.0)
+    hits = bm25_search(conn, "взлёт", max_df_ratio=1.0)
+    assert sorted(h["id"] for h in hits) == [1, 2]
+
+
+def test_prefix_df_counts_chunks_not_word_forms():
+    # один чанк с четырьмя словоформами — df префикса 1, а не 4
+    from utils.fts_query import term_df, tokenize_query
+
+    conn = _db(["двигатель двигателя двигателем двигателю", "посадка", "руление", "стоянка"])
+    (term,) = tokenize_query("двигателя")
+    assert term_df(conn, term) == 1
+    assert compile_fts_query(conn, "двигателя", max_df_ratio=0.5) == '"двигател"*'
@@ -0,0 +1,178 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from app.llm_scheduler import (  # noqa: E402
+    PRIORITY_BACKGROUND,
+    PRIORITY_CLASSIFY,
+    PRIORITY_GENERATE,
+    LLMOverloaded,
+    LLMScheduler,
+    parse_model_limits,
+)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("llama3:8b=2, qwen2.5:3b=4,,bad") == {"llama3:8b": 2, "qwen2.5:3b": 4}
+    assert parse_model_limits("") == {}
+
+
+def test_concurrency_limit_and_priority_order():
+    async def main():
+        sch = LLMScheduler(max_concurrency=1, max_queue_wait_s=0)
+        gate = asyncio.Event()
+        order = []
+
+        async def job(name, priority):
+            async with sch.slot("m", priority=priority):
+                order.append(name)
+                if name == "first":
+                    await gate.wait()
+
+        first = asyncio.ensure_future(job("first", PRIORITY_GENERATE))
+        await asyncio.sleep(0)
+        rest = [
+            asyncio.ensure_future(job(n, p))
+            for n, p in (
+                ("bg", PRIORITY_BACKGROUND),
+                ("gen1", PRIORITY_GENERATE),
+                ("cls", PRIORITY_CLASSIFY),
+                ("gen2", PRIORITY_GENERATE),
+            )
+        ]
+        await asyncio.sleep(0)
+        assert sch.stats()["m"]["active"] == 1 and sch.stats()["m"]["queued"] == 4
+        gate.set()
+        await asyncio.gather(first, *rest)
+        assert order == ["first", "cls", "gen1", "gen2", "bg"]
+        assert sch.stats()["m"]["active"] == 0
+
+    _run(main())
+
+
+def test_queue_full_is_429():
+    async def main():
+        sch = LLMScheduler(max_concurrency=1, max_queue=1, max_queue_wait_s=0, retry_after_s=3)
+        gate = asyncio.Event()
+
+        async def hold():
+            async with sch.slot("m"):
+                await gate.wait()
+
+        tasks = [asyncio.ensure_future(hold()) for _ in range(2)]  # 1 в слоте + 1 в очереди
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded) as e:
+            sch.check_admission("m")
+        assert e.value.status == 429 and e.value.retry_after_s >= 3
+        with pytest.raises(LLMOverloaded):
+            async with sch.slot("m"):
+                pass
+        gate.set()
+        await asyncio.gather(*tasks)
+
+    _run(main())
+
+
+def test_slot_wait_timeout_is_503_and_slot_is_not_leaked():
+    async def main():
+        sch = LLMScheduler(max_concurrency=1, max_queue_wait_s=0.05)
+        gate = asyncio.Event()
+
+        async def hold():
+            async with sch.slot("m"):
+                await gate.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded) as e:
+            async with sch.slot("m"):
+                pass
+        assert e.value.status == 503
+        gate.set()
+        await holder
+        stats = sch.stats()["m"]
+        assert (stats["active"], stats["queued"]) == (0, 0)
+        async with sch.slot("m"):
+            pass
+
+    _run(main())
+
+
+def test_run_singleflight():
+    async def main():
+        sch = LLMScheduler(max_concurrency=2)
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(sch.run("m", "same-key", fn) for _ in range(5)))
+        assert results == ["answer"] * 5 and calls == 1
+        # после завершения ключ свободен — новый вызов идёт в модель
+        assert await sch.run("m", "same-key", fn) == "answer" and calls == 2
+
+    _run(main())
+
+
+def test_stream_fanout_and_late_subscriber():
+    async def main():
+        sch = LLMScheduler(max_concurrency=1)
+        calls = 0
+        second_ready = asyncio.Event()
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            yield "a"
+            await second_ready.wait()
+            yield "b"
+            yield "c"
+
+        async def read():
+            return [p async for p in sch.stream("m", "k", fn)]
+
+        first = asyncio.ensure_future(read())
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(read())  # подключается после "a"
+        await asyncio.sleep(0.01)
+        second_ready.set()
+        assert await first == ["a", "b", "c"]
+        assert await second == ["a", "b", "c"]
+        assert calls == 1
+
+    _run(main())
+
+
+def test_stream_cancelled_when_last_subscriber_leaves():
+    async def main():
+        sch = LLMScheduler(max_concurrency=1)
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                yield "a"
+                await asyncio.sleep(10)
+                yield "b"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        agen = sch.stream("m", "k", fn)
+        assert await agen.__anext__() == "a"
+        await agen.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert sch.stats()["m"]["active"] == 0
+
+    _run(main())
@@ -0,0 +1,101 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from utils.manifest import IngestManifest, file_sha1  # noqa: E402
+
+
+def _write(path: Path, text: str, mtime: float = 1_700_000_000.0) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def _index(m: IngestManifest, docs: Path, plan) -> None:
+    # как Writer после успешной записи
+    for path, h in plan.process:
+        m.record_indexed(docs, path, content_hash=h, doc_id=h, chunks=1)
+    for h, path in plan.relink:
+        m.record_relinked(docs, path, content_hash=h)
+
+
+def _files(docs: Path):
+    return sorted(p for p in docs.rglob("*") if p.is_file())
+
+
+def test_plan_process_unchanged_linked_purge(tmp_path):
+    docs = tmp_path / "docs"
+    a = _write(docs / "a.txt", "alpha")
+    b = _write(docs / "b.txt", "beta")
+    m = IngestManifest(tmp_path / "manifest.json")
+
+    plan = m.plan(docs, _files(docs))
+    assert plan.process == [(a, file_sha1(a)), (b, file_sha1(b))]
+    _index(m, docs, plan)
+    assert not m.has_changes(docs, _files(docs))
+
+    # touch: stat изменился, содержимое нет
+    os.utime(a, (1_800_000_000.0, 1_800_000_000.0))
+    assert m.has_changes(docs, _files(docs))
+    plan = m.plan(docs, _files(docs))
+    assert (plan.process, plan.purge, plan.linked, plan.unchanged) == ([], [], 0, 2)
+
+    # копия: то же содержимое по новому пути — без переиндексации
+    _write(docs / "copy.txt", "alpha")
+    plan = m.plan(docs, _files(docs))
+    assert (plan.process, plan.purge, plan.linked, plan.relink) == ([], [], 1, [])
+
+    # правка b: новое содержимое в process, старое — в purge
+    old_b = file_sha1(b)
+    _write(b, "beta v2", mtime=1_900_000_000.0)
+    plan = m.plan(docs, _files(docs))
+    assert plan.process == [(b, file_sha1(b))]
+    assert plan.purge == [old_b]
+
+
+def test_identical_new_files_are_processed_once(tmp_path):
+    docs = tmp_path / "docs"
+    a = _write(docs / "a.txt", "same")
+    _write(docs / "b.txt", "same")
+    plan = IngestManifest(tmp_path / "manifest.json").plan(docs, _files(docs))
+    assert plan.process == [(a, file_sha1(a))]
+
+
+def test_rename_and_edited_original_relink_meta(tmp_path):
+    docs = tmp_path / "docs"
+    a = _write(docs / "a.txt", "alpha")
+    m = IngestManifest(tmp_path / "manifest.json")
+    _index(m, docs, m.plan(docs, _files(docs)))
+    h = file_sha1(a)
+
+    # переименование: мета чанков должна переехать на новый путь
+    a.rename(docs / "renamed.txt")
+    plan = m.plan(docs, _files(docs))
+    assert (plan.process, plan.purge) == ([], [])
+    assert plan.relink == [(h, docs / "renamed.txt")]
+    _index(m, docs, plan)
+    assert m.docs[h]["file_path"] == "renamed.txt"
+    assert m.plan(docs, _files(docs)).relink == []
+
+    # копия, затем правка оригинала: старое содержимое живёт в копии, мета — на неё
+    _write(docs / "copy.txt", "alpha")
+    _index(m, docs, m.plan(docs, _files(docs)))
+    _write(docs / "renamed.txt", "alpha v2", mtime=1_900_000_000.0)
+    plan = m.plan(docs, _files(docs))
+    assert plan.purge == []
+    assert plan.relink == [(h, docs / "copy.txt")]
+
+
+def test_manifest_roundtrip(tmp_path):
+    docs = tmp_path / "docs"
+    _write(docs / "a.txt", "alpha")
+    m = IngestManifest(tmp_path / "manifest.json")
+    _index(m, docs, m.plan(docs, _files(docs)))
+    m.save()
+
+    again = IngestManifest(tmp_path / "manifest.json")
+    assert again.docs == m.docs and again.files == m.files
+    assert not again.has_changes(docs, _files(docs))
@@ -0,0 +1,84 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag"))
+
+from utils.sqlite_fts import (  # noqa: E402
+    begin_bulk_load,
+    bm25_search,
+    bulk_insert_chunks,
+    delete_by_doc_id,
+    fetch_chunks,
+    finish_bulk_load,
+    from_sqlite_id,
+    init_fts,
+    to_sqlite_id,
+    upsert_chunks,
+)
+
+BIG = (1 << 64) - 5  # id точки больше i64 max (как у _u64_from_sha1)
+
+
+def _db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    init_fts(conn)
+    return conn
+
+
+def _ids(hits):
+    return sorted(h["id"] for h in hits)
+
+
+def _fts_rows(conn):
+    return conn.execute("SELECT count(*) FROM chunks_fts WHERE chunks_fts MATCH 'закрылки OR шасси'").fetchone()[0]
+
+
+def test_u64_id_mapping_roundtrip():
+    for cid in (0, 1, (1 << 63) - 1, 1 << 63, BIG):
+        rid = to_sqlite_id(cid)
+        assert -(1 << 63) <= rid < (1 << 63)
+        assert from_sqlite_id(rid) == cid
+
+
+def test_upsert_stores_u64_ids_and_returns_them():
+    conn = _db()
+    upsert_chunks(conn, [{"id": BIG, "text": "выпуск закрылков", "doc_id": "d1"}, {"id": 7, "text": "шасси"}])
+    assert _ids(bm25_search(conn, "закрылков", max_df_ratio=1.0)) == [BIG]
+    assert set(fetch_chunks(conn, [BIG, 7])) == {BIG, 7}
+    assert fetch_chunks(conn, [BIG])[BIG]["doc_id"] == "d1"
+
+
+def test_upsert_replaces_fts_row():
+    conn = _db()
+    upsert_chunks(conn, [{"id": BIG, "text": "выпуск закрылков"}, {"id": 2, "text": "руление"}])
+    upsert_chunks(conn, [{"id": BIG, "text": "уборка шасси"}], batch_size=1)
+    # старый текст ушёл из индекса, новый — на месте; строк в индексе не прибавилось
+    assert bm25_search(conn, "закрылков", max_df_ratio=1.0) == []
+    assert _ids(bm25_search(conn, "шасси", max_df_ratio=1.0)) == [BIG]
+    assert _fts_rows(conn) == 1
+    conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('integrity-check')")
+
+
+def test_delete_by_doc_id_removes_from_index():
+    conn = _db()
+    upsert_chunks(conn, [{"id": 1, "text": "закрылки", "doc_id": "a"}, {"id": 2, "text": "шасси", "doc_id": "b"}])
+    delete_by_doc_id(conn, "a")
+    assert bm25_search(conn, "закрылки", max_df_ratio=1.0) == []
+    assert _ids(bm25_search(conn, "шасси", max_df_ratio=1.0)) == [2]
+    conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('integrity-check')")
+
+
+def test_bulk_load_rebuilds_index_from_scratch():
+    conn = _db()
+    upsert_chunks(conn, [{"id": 1, "text": "закрылки"}])
+
+    begin_bulk_load(conn)
+    bulk_insert_chunks(conn, [{"id": BIG, "text": "шасси"}, {"id": 3, "text": "руление"}], batch_size=1)
+    finish_bulk_load(conn)
+
+    assert bm25_search(conn, "закрылки", max_df_ratio=1.0) == []
+    assert _ids(bm25_search(conn, "шасси", max_df_ratio=1.0)) == [BIG]
+    assert conn.execute("SELECT count(*) FROM chunks").fetchone()[0] == 2
+    conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('integrity-check')")
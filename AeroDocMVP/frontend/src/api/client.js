@@ -25,3 +25,45 @@ export async function chat(text) {
   }
   return res.json(); // { answer, sources }
 }
+
+// NDJSON-стрим: { type: "label" | "sources" | "token" | "done" | "error", ... } по строке на событие
+async function postNdjson(path, text, onEvent, what) {
+  const res = await fetch(`${API_BASE}${path}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ text }),
+  });
+  if (!res.ok || !res.body) {
+    const t = await res.text();
+    throw new Error(t || `${what} failed`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (!line) continue;
+      const ev = JSON.parse(line);
+      if (ev.type === "error") throw new Error(ev.detail || `${what} failed`);
+      onEvent(ev);
+    }
+  }
+}
+
+export function chatStream(text, onEvent) {
+  return postNdjson("/chat/stream", text, onEvent, "chat stream");
+}
+
+// classify + retrieval + генерация за один запрос
+export function ask(text, onEvent) {
+  return postNdjson("/ask", text, onEvent, "ask");
+}
@@ -1,6 +1,6 @@
 import { useEffect, useMemo, useRef, useState } from "react";
 import Message from "./Message";
-import { classify, chat } from "../api/client";
+import { ask } from "../api/client";
 
 const LS_KEY = "aerodoc_chats_v1";
 const MAX_LEN = 1000;
@@ -209,20 +209,7 @@ export default function Chat() {
         setLoading(true);
 
         try {
-            const { label } = await classify(text);
-
-            if (label === "greeting") {
-                addAssistantMessageAnimated(
-                    "Привет! Готов отвечать на твои вопросы."
-                );
-            } else if (label === "junk") {
-                addAssistantMessageAnimated(
-                    "Похоже на мусор или не по теме. Напиши вопрос чуть понятнее 🙂"
-                );
-            } else {
-                const res = await chat(text);
-                addAssistantMessageAnimated(res.answer);
-            }
+            await streamAssistantMessage(text);
         } catch (e) {
             updateActiveChat((c) => ({
                 ...c,
@@ -247,21 +234,19 @@ export default function Chat() {
         }
     }
 
-    function addAssistantMessageAnimated(fullText) {
+    async function streamAssistantMessage(text) {
         const id = crypto.randomUUID?.() ?? String(Date.now());
+        let acc = "";
 
         updateActiveChat((c) => ({
             ...c,
             messages: [...c.messages, { id, role: "assistant", text: "" }],
         }));
 
-        let i = 0;
-        const step = 2;
-        const delay = 14;
-
-        const timer = setInterval(() => {
-            i = Math.min(fullText.length, i + step);
-            const slice = fullText.slice(0, i);
+        await ask(text, (ev) => {
+            if (ev.type !== "token") return;
+            acc += ev.content;
+            const slice = acc;
 
             updateActiveChat((c) => ({
                 ...c,
@@ -269,9 +254,7 @@ export default function Chat() {
                     msg.id === id ? { ...msg, text: slice } : msg
                 ),
             }));
-
-            if (i >= fullText.length) clearInterval(timer);
-        }, delay);
+        });
     }
 
     // ===== Sidebar UI =====